@@ -0,0 +1,249 @@
+# app/async_engine.py
+
+import asyncio
+import itertools
+import json
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Optional, Any, Coroutine
+from PyQt6.QtCore import QObject, pyqtSignal
+from app.qwen_api import QwenAPIClient, QwenAPIException
+
+
+class RequestHandle:
+    """
+    一次对话请求的句柄
+
+    cancel() 会取消事件循环中的任务：正在读取的 HTTP 流会立即关闭，
+    不再继续消耗 token。信号中携带 request_id，调用方据此忽略已取消请求的残留信号。
+    """
+
+    def __init__(self, request_id: int, future: Future):
+        self.request_id = request_id
+        self.future = future
+
+    def cancel(self) -> bool:
+        return self.future.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def cancelled(self) -> bool:
+        return self.future.cancelled()
+
+
+class AsyncEngine(QObject):
+    """
+    常驻后台线程中的 asyncio 事件循环，持有 QwenAPIClient。
+
+    所有请求都通过 run_coroutine_threadsafe 提交到同一个事件循环，
+    因此 AsyncOpenAI 的连接池（HTTP keep-alive / TLS 会话）可以跨轮次复用。
+    信号从后台线程发射，连接到 GUI 线程的槽时会自动以队列方式投递。
+    """
+
+    token_received = pyqtSignal(int, str)  # request_id, token
+    error_occurred = pyqtSignal(int, str)  # request_id, 错误信息
+    finished = pyqtSignal(int)  # request_id
+    summary_ready = pyqtSignal(str, str, int)  # session_id, 摘要内容, 覆盖的消息条数
+    # 多模型对比 (compare)
+    compare_token = pyqtSignal(int, str, str)  # request_id, 模型, token
+    compare_result = pyqtSignal(int, str, str, str, object)  # request_id, 模型, 回复, 错误信息（成功为空）, 指标 dict
+    compare_finished = pyqtSignal(int, str)  # request_id, race 策略下胜出的模型（否则为空）
+
+    def __init__(self, qwen_client: Optional[QwenAPIClient] = None, parent=None):
+        super().__init__(parent)
+        self.qwen_client = qwen_client
+        self._request_ids = itertools.count(1)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="AsyncEngine", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        self._loop.close()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread.is_alive() and not self._loop.is_closed()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """在引擎的事件循环中执行协程，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        extra_params: Optional[Dict[str, Any]] = None,
+        use_cache: Optional[bool] = None,
+        session_id: Optional[str] = None,
+    ) -> RequestHandle:
+        """
+        提交一次流式对话请求
+
+        :param messages: 完整的对话上下文（含 system prompt）
+        :param extra_params: 覆盖本次请求的参数，如 top_p
+        :param use_cache: 是否使用回复缓存，见 QwenAPIClient.chat_completion
+        :param session_id: 请求所属的会话，用于按会话统计用量
+        :return: RequestHandle，其 future 的结果为完整的回复文本
+        """
+        request_id = next(self._request_ids)
+        future = self.submit(self._chat_completion(request_id, messages, extra_params, use_cache, session_id))
+        return RequestHandle(request_id, future)
+
+    async def _chat_completion(self, request_id: int, messages, extra_params, use_cache=None,
+                               session_id=None) -> str:
+        if not self.qwen_client:
+            self.error_occurred.emit(request_id, "Qwen API客户端未初始化。")
+            self.finished.emit(request_id)
+            return ""
+
+        print(f"[AsyncEngine DEBUG] Request {request_id}: sending messages to Qwen API: {messages}")
+        print(f"[AsyncEngine DEBUG] Request {request_id} overrides: {extra_params}")
+        try:
+            return await self.qwen_client.chat_completion(
+                messages=messages,
+                callback=lambda token: self.token_received.emit(request_id, token),
+                extra_params=extra_params,
+                use_cache=use_cache,
+                tag=f"chat#{request_id}",
+                session_id=session_id,
+            )
+        except asyncio.CancelledError:
+            # 流已在 QwenAPIClient 中关闭
+            print(f"[AsyncEngine] Request {request_id} cancelled.")
+            raise
+        except QwenAPIException as e:
+            user_message, error_details = QwenAPIClient.format_error_message(e)
+            print(f"[ERROR] {e.error_type}: {e.message}")
+            print(f"[ERROR] Details: {json.dumps(error_details, ensure_ascii=False, indent=2)}")
+            self.error_occurred.emit(request_id, user_message)
+        except Exception as e:
+            user_message, error_details = QwenAPIClient.format_error_message(e)
+            print(f"[ERROR] Unexpected error: {error_details}")
+            self.error_occurred.emit(request_id, f"发生未知错误: {e}")
+        finally:
+            self.finished.emit(request_id)
+        return ""
+
+    def compare(
+        self,
+        messages: List[Dict[str, str]],
+        models: List[str],
+        race: bool = False,
+        extra_params: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> RequestHandle:
+        """
+        把同一组消息并发发送给多个模型，各模型的回复通过 compare_token 同时流式返回
+
+        所有模型共用 QwenAPIClient 的连接池与调度器（按模型分别限速）。
+        :param race: 为 True 时第一个成功完成的模型胜出，其余请求立即取消
+        :return: RequestHandle，cancel() 会取消所有模型的请求
+        """
+        request_id = next(self._request_ids)
+        # 结果按模型名分发，重复的模型只请求一次
+        models = list(dict.fromkeys(models))
+        future = self.submit(self._compare(request_id, messages, models, race, extra_params, session_id))
+        return RequestHandle(request_id, future)
+
+    async def _compare_one(self, request_id: int, model: str, messages, extra_params, session_id=None) -> str:
+        tag = f"compare#{request_id}"
+        try:
+            content = await self.qwen_client.chat_completion(
+                messages=messages,
+                callback=lambda token: self.compare_token.emit(request_id, model, token),
+                extra_params={**(extra_params or {}), "model": model},
+                tag=tag,
+                session_id=session_id,
+            )
+        except asyncio.CancelledError:
+            self.compare_result.emit(request_id, model, "", "已取消", self._metrics_of(tag, model))
+            raise
+        except Exception as e:
+            user_message, _ = QwenAPIClient.format_error_message(e)
+            print(f"[AsyncEngine] Compare request {request_id} failed for '{model}': {e}")
+            self.compare_result.emit(request_id, model, "", user_message, self._metrics_of(tag, model))
+            return ""
+        self.compare_result.emit(request_id, model, content or "", "", self._metrics_of(tag, model))
+        return content or ""
+
+    def _metrics_of(self, tag: str, model: str) -> Dict:
+        recorder = self.qwen_client.metrics if self.qwen_client else None
+        metrics = recorder.find(tag, model) if recorder else None
+        return metrics.to_dict() if metrics else {}
+
+    async def _compare(self, request_id: int, messages, models, race, extra_params, session_id=None) -> str:
+        winner = ""
+        if not self.qwen_client:
+            for model in models:
+                self.compare_result.emit(request_id, model, "", "Qwen API客户端未初始化。", {})
+            self.compare_finished.emit(request_id, winner)
+            return winner
+        tasks = {
+            asyncio.ensure_future(self._compare_one(request_id, model, messages, extra_params, session_id)): model
+            for model in models
+        }
+        pending = set(tasks)
+        try:
+            if race:
+                while pending and not winner:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    winner = next((tasks[t] for t in done if t.result()), "")
+            else:
+                await asyncio.gather(*tasks)
+                pending = set()
+        finally:
+            # race 中落后的模型，或整个对比被取消时的全部请求
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.compare_finished.emit(request_id, winner)
+        return winner
+
+    def summarize(self, session_id: str, messages: List[Dict[str, str]], covers: int) -> Future:
+        """
+        在后台生成滚动摘要，完成后发射 summary_ready
+
+        :param messages: 摘要请求的消息（见 ContextManager.build_summary_request）
+        :param covers: 摘要覆盖的历史消息条数
+        """
+        return self.submit(self._summarize(session_id, messages, covers))
+
+    async def _summarize(self, session_id, messages, covers) -> str:
+        if not self.qwen_client:
+            return ""
+        try:
+            content = await self.qwen_client.chat_completion(
+                messages, extra_params={"stream": False}, tag="summary", session_id=session_id
+            )
+        except Exception as e:
+            # 摘要失败不影响对话，下一轮会重试
+            print(f"[AsyncEngine] Error generating summary for '{session_id}': {e}")
+            return ""
+        if content:
+            self.summary_ready.emit(session_id, content, covers)
+        return content
+
+    def prewarm(self) -> Future:
+        """
+        在事件循环线程中提前创建 API 客户端（导入 openai 较慢），
+        界面显示后调用，使第一次发送不必等待导入。
+        """
+        return self.submit(self._prewarm())
+
+    async def _prewarm(self) -> None:
+        if self.qwen_client:
+            self.qwen_client.client
+
+    def shutdown(self, timeout: float = 5.0):
+        """关闭 HTTP 客户端并停止事件循环"""
+        if not self.is_running:
+            return
+        if self.qwen_client:
+            try:
+                self.submit(self.qwen_client.close()).result(timeout)
+            except Exception as e:
+                print(f"[AsyncEngine] Error closing API client: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
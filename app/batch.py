@@ -0,0 +1,264 @@
+# app/batch.py
+
+"""
+无界面的批量运行器：从 JSONL 读取提示词，在同一个事件循环中并发请求，
+每完成一条就把结果追加写入输出 JSONL。
+
+输入每行一条记录：
+    {"id": "q1", "prompt": "..."}
+    {"id": "q2", "messages": [{"role": "user", "content": "..."}], "system_prompt": "..."}
+id 缺省时使用行号；system_prompt 缺省时使用 --system-prompt、--session 指定会话的
+system prompt，或与新会话相同的默认值。
+
+输出每行一条结果：
+    {"id": ..., "content": ..., "latency": ..., "ttft": ...}
+    {"id": ..., "error": ..., "error_type": ..., "latency": ...}
+中断后用相同参数重新运行，会跳过输出文件中已成功的 id（失败的会重跑）。
+
+用法: python -m app.batch prompts.jsonl -o results.jsonl [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional, Iterator, Tuple
+
+import config
+from app.context_manager import ContextManager
+from app.history_manager import HistoryManager
+from app.qwen_api import QwenAPIClient, QwenAPIException
+from app.request_scheduler import RequestScheduler
+from app.session_store import DEFAULT_SYSTEM_PROMPT
+
+
+def read_prompts(path: str) -> Iterator[Tuple[str, Dict]]:
+    """逐行读取输入文件，返回 (id, 记录)；无法解析的行会被跳过"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[Batch] Skipping malformed line {line_no} in {path}")
+                continue
+            if isinstance(record, str):
+                record = {"prompt": record}
+            if not isinstance(record, dict):
+                # 交给 validate_record 报告为失败的结果，而不是静默跳过
+                yield f"line-{line_no}", record
+                continue
+            yield str(record.get("id", f"line-{line_no}")), record
+
+
+def validate_record(record) -> None:
+    """检查一条输入记录的结构，不合法时抛出 ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError(f"记录应为 JSON 对象或字符串，实际为 {type(record).__name__}")
+    messages = record.get("messages")
+    if messages is not None:
+        if not isinstance(messages, list) or not messages:
+            raise ValueError("messages 应为非空列表")
+        for i, message in enumerate(messages):
+            if not isinstance(message, dict) or not isinstance(message.get("role"), str):
+                raise ValueError(f"messages[{i}] 缺少 role")
+            if not isinstance(message.get("content", ""), str):
+                raise ValueError(f"messages[{i}] 的 content 应为字符串")
+    elif not isinstance(record.get("prompt", ""), str):
+        raise ValueError("prompt 应为字符串")
+    if not isinstance(record.get("system_prompt") or "", str):
+        raise ValueError("system_prompt 应为字符串")
+    if not isinstance(record.get("params") or {}, dict):
+        raise ValueError("params 应为 JSON 对象")
+
+
+def completed_ids(path: str) -> set:
+    """读取已有的输出文件，返回已经成功完成的 id（以最后一条结果为准）"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 中断时可能留下不完整的末行
+            if "error" in result:
+                done.discard(result.get("id"))
+            else:
+                done.add(result.get("id"))
+    return done
+
+
+class BatchRunner:
+    """
+    批量运行器
+
+    :param client: QwenAPIClient，其调度器负责限速与重试
+    :param concurrency: 同时进行中的请求数上限
+    :param system_prompt: 记录未指定 system_prompt 时使用的值
+    """
+
+    def __init__(self, client: QwenAPIClient, concurrency: int = 4,
+                 system_prompt: str = DEFAULT_SYSTEM_PROMPT, stream: bool = True):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.system_prompt = system_prompt
+        self.stream = stream
+        # 与聊天窗口相同：为回复预留 max_tokens，历史预算与请求的回复长度一致
+        self.context_manager = ContextManager(reserve_tokens=client.max_tokens)
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.output_chars = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def build_messages(self, record: Dict) -> List[Dict[str, str]]:
+        """与聊天窗口相同：首条为 system prompt，历史按上下文预算裁剪"""
+        messages = record.get("messages") or [{"role": "user", "content": record.get("prompt", "")}]
+        system_prompt = record.get("system_prompt") or self.system_prompt
+        return self.context_manager.fit(system_prompt, messages, self.client.model).messages
+
+    async def run_one(self, item_id: str, record: Dict) -> Dict:
+        first_token_at = []
+
+        def on_token(_token):
+            if not first_token_at:
+                first_token_at.append(time.perf_counter())
+
+        start = time.perf_counter()
+        try:
+            validate_record(record)
+            content = await self.client.chat_completion(
+                self.build_messages(record),
+                callback=on_token if self.stream else None,
+                extra_params={"stream": self.stream, **(record.get("params") or {})},
+            )
+        except QwenAPIException as e:
+            self.failed += 1
+            return {"id": item_id, "error": e.message, "error_type": e.error_type,
+                    "latency": round(time.perf_counter() - start, 4)}
+        except Exception as e:
+            # 不合法的记录或参数（如 params 中 SDK 不认识的字段）只让这一条失败，批量继续
+            self.failed += 1
+            error_type = "invalid_record" if isinstance(e, ValueError) else type(e).__name__
+            return {"id": item_id, "error": str(e), "error_type": error_type,
+                    "latency": round(time.perf_counter() - start, 4)}
+        latency = time.perf_counter() - start
+        self.succeeded += 1
+        self.latencies.append(latency)
+        self.output_chars += len(content or "")
+        result = {"id": item_id, "content": content, "latency": round(latency, 4)}
+        if first_token_at:
+            self.ttfts.append(first_token_at[0] - start)
+            result["ttft"] = round(first_token_at[0] - start, 4)
+        return result
+
+    async def run(self, input_path: str, output_path: str) -> None:
+        done = completed_ids(output_path)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        with open(output_path, 'a', encoding='utf-8') as out:
+            async def worker():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    result = await self.run_one(*item)
+                    # 每完成一条立即落盘，中断后可以续跑
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            for item_id, record in read_prompts(input_path):
+                if item_id in done:
+                    self.skipped += 1
+                    continue
+                await queue.put((item_id, record))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+    def summary(self, elapsed: float) -> str:
+        lines = [
+            f"[Batch] ok={self.succeeded} failed={self.failed} skipped={self.skipped} "
+            f"in {elapsed:.2f} s ({self.succeeded / elapsed if elapsed else 0:.2f} req/s, "
+            f"{self.output_chars / elapsed if elapsed else 0:.0f} chars/s)",
+        ]
+        for label, values in (("latency", self.latencies), ("ttft", self.ttfts)):
+            if not values:
+                continue
+            ordered = sorted(values)
+            p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+            lines.append(
+                f"[Batch] {label}: p50={statistics.median(ordered) * 1000:.0f} ms "
+                f"p90={p90 * 1000:.0f} ms max={ordered[-1] * 1000:.0f} ms"
+            )
+        lines.append(f"[Batch] scheduler: {self.client.scheduler.stats}")
+        return "\n".join(lines)
+
+
+def _resolve_system_prompt(args) -> str:
+    if args.system_prompt:
+        return args.system_prompt
+    if args.session:
+        return HistoryManager(history_dir=args.history_dir).get_session_system_prompt(args.session)
+    return DEFAULT_SYSTEM_PROMPT
+
+
+async def _main(args) -> int:
+    cfg = config.get_config()
+    overrides = {"max_concurrency": args.concurrency}
+    if args.rpm:
+        overrides["requests_per_minute"] = args.rpm
+    scheduler = RequestScheduler.from_config(cfg, **overrides)
+    client = QwenAPIClient(
+        model=args.model,
+        temperature=args.temperature if args.temperature is not None else 0.7,
+        max_tokens=args.max_tokens,
+        base_url=args.base_url,
+        scheduler=scheduler,
+    )
+    runner = BatchRunner(client, concurrency=args.concurrency,
+                         system_prompt=_resolve_system_prompt(args), stream=not args.no_stream)
+    print(f"[Batch] {args.input} -> {args.output} (model={client.model}, concurrency={args.concurrency})")
+    start = time.perf_counter()
+    try:
+        await runner.run(args.input, args.output)
+    finally:
+        print(runner.summary(time.perf_counter() - start))
+        await client.close()
+    return 1 if runner.failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量运行 JSONL 中的提示词")
+    parser.add_argument("input", help="输入 JSONL，每行包含 prompt 或 messages")
+    parser.add_argument("-o", "--output", help="输出 JSONL（默认为 <input>.results.jsonl）")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时进行中的请求数")
+    parser.add_argument("--rpm", type=float, default=None, help="覆盖配置中的每分钟请求数上限")
+    parser.add_argument("--model", default=None, help="默认使用配置中的第一个模型")
+    parser.add_argument("--temperature", type=float, default=None)
+    parser.add_argument("--max-tokens", type=int, default=2048)
+    parser.add_argument("--system-prompt", default=None)
+    parser.add_argument("--session", default=None, help="使用该会话的 system prompt")
+    parser.add_argument("--history-dir", default="chat_history")
+    parser.add_argument("--base-url", default=None, help="覆盖配置中的 api_base_url")
+    parser.add_argument("--no-stream", action="store_true", help="使用非流式请求（不统计首 token 时间）")
+    args = parser.parse_args(argv)
+    args.output = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    try:
+        return asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        print("[Batch] Interrupted; rerun the same command to resume.")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,80 @@
 # app/chat_window.py
 
-import asyncio
 import threading
-import json
+import time
+from typing import Dict, List, Optional
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QMessageBox, QHBoxLayout, QSplitter
-from PyQt6.QtCore import Qt, pyqtSignal, QObject, QTimer
-from app.qwen_api import QwenAPIClient, QwenAPIException
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+import config
+from app.qwen_api import QwenAPIClient
+from app.async_engine import AsyncEngine, RequestHandle
+from app.render_scheduler import StreamRenderScheduler
+from app.context_manager import ContextManager
+from app.response_cache import ResponseCache
 from app.widgets.config_bar import ConfigBar
 from app.widgets.chat_area import ChatArea
 from app.widgets.input_bar import InputBar
 from app.history_manager import HistoryManager
+from app.history_watcher import HistoryWatcher
 from app.widgets.history_sidebar import HistorySidebar, SessionInfoDialog
+from app.widgets.compare_dialog import CompareDialog
 
 
-# 用于在非GUI线程中更新GUI的信号载体
-class WorkerSignals(QObject):
-    token_received = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
-    finished = pyqtSignal()
+class SessionStream:
+    """
+    一个会话正在进行中的请求
+
+    每个会话各自保存回复缓冲、消息列表和排队的输入；切换到其他会话时请求在后台继续，
+    收到的内容只累积在缓冲中，完成后写入所属的会话。
+    """
+
+    def __init__(self, session_id: Optional[str], messages: List[Dict], handle: RequestHandle):
+        self.session_id = session_id
+        self.messages = messages  # 所属会话的消息列表（含尚未保存的用户消息）
+        self.handle = handle
+        self.buffer = ""  # 已收到的回复
+        self.shown = False  # 回复是否已显示在当前视图中
+        self.error: Optional[str] = None
+        self.queued_inputs: List[str] = []
+        self.io_start: Optional[Dict[str, int]] = None
+        self.compare: Optional[CompareDialog] = None  # 多模型对比时的对比窗口
+
+    @property
+    def request_id(self) -> int:
+        return self.handle.request_id
 
 
 class ChatWindow(QWidget):
-    def __init__(self):
+    history_ready = pyqtSignal()  # 后台扫描历史会话完成
+
+    def __init__(self, qwen_client: Optional[QwenAPIClient] = None,
+                 history_manager: Optional[HistoryManager] = None):
+        """
+        :param qwen_client: 使用指定的客户端（如基准测试中指向本地模拟服务器），默认按配置创建
+        :param history_manager: 使用指定的会话存储，默认为 chat_history 目录
+        """
         super().__init__()
         self.setWindowTitle("Qwen AI 桌面助手")
         self.resize(1000, 700) # Increased size to accommodate sidebar
 
         # 初始化可能在后续逻辑中条件访问的成员
-        try:
-            self.qwen_client = QwenAPIClient()
-        except ValueError as e:
-            QMessageBox.warning(self, "API初始化错误", str(e))
-            self.qwen_client = None
+        self.qwen_client = qwen_client
+        if self.qwen_client is None:
+            try:
+                self.qwen_client = QwenAPIClient(cache=ResponseCache.from_config(config.get_config()))
+            except ValueError as e:
+                QMessageBox.warning(self, "API初始化错误", str(e))
+        # 常驻的后台事件循环，所有 API 请求共用同一个连接池
+        self.engine = AsyncEngine(self.qwen_client, self)
+        self.context_manager = ContextManager(
+            reserve_tokens=self.qwen_client.max_tokens if self.qwen_client else 2048
+        )
+        self.last_context_plan = None
+        # 各会话正在进行的请求，多个会话可以同时生成。同一会话生成期间再次发送时
+        # 按 concurrent_send_policy 处理："cancel_previous"（默认）取消当前回复，"queue" 排队，"reject" 拒绝
+        self.streams: Dict[Optional[str], SessionStream] = {}
+        self._stream_requests: Dict[int, SessionStream] = {}
+        self.send_policy = config.get_config().get('concurrent_send_policy', 'cancel_previous')
         self.config_bar = None
         self.chat_area = None
         self.input_bar = None
@@ -40,19 +83,73 @@ class ChatWindow(QWidget):
 
         self._load_styles()
         
-        self.history_manager = HistoryManager()
+        self.history_manager = history_manager or HistoryManager.from_config(config.get_config())
         self.current_session_id = None
         self.current_messages = []
-        self.assistant_response_buffer = ""
+        # 历史目录的外部修改（同步工具、脚本）增量应用到侧边栏，初次同步索引后开始监视
+        watch_options = config.get_config().get('history_watcher') or {}
+        self.history_watcher = None
+        if watch_options.get('enabled', True):
+            self.history_watcher = HistoryWatcher(
+                self.history_manager,
+                debounce_ms=int(watch_options.get('debounce_ms', 500)),
+                watch_recent_files=int(watch_options.get('watch_recent_files', 50)),
+                parent=self,
+            )
+            self.history_watcher.changes_ready.connect(self._on_history_changed)
 
         self._init_ui()
         self._connect_signals()
 
-        self.history_sidebar.load_history()
-        self._load_latest_session_on_startup()
+        # 历史会话目录只扫描一次，且放在后台线程中，窗口可以先显示出来
+        self.history_loaded = False
+        self.history_ready.connect(self._on_history_ready)
+        self._history_sync_start = time.perf_counter()
+        if self.status_label:
+            self.status_label.setText("正在加载历史会话...")
+        threading.Thread(target=self._sync_history, name="HistorySync", daemon=True).start()
+        # 界面显示后在后台创建 API 客户端，第一次发送时无需等待导入 openai
+        QTimer.singleShot(0, self.engine.prewarm)
 
         self.input_bar.input_box.setFocus()
 
+    def _sync_history(self):
+        try:
+            self.history_manager.sync_index()
+        except Exception as e:
+            print(f"[ChatWindow] Error syncing history index: {e}")
+        self.history_ready.emit() # 跨线程发射，以队列方式投递到 GUI 线程
+
+    def _on_history_ready(self):
+        self.history_loaded = True
+        print(f"[ChatWindow] History loaded in {(time.perf_counter() - self._history_sync_start) * 1000:.0f} ms")
+        if self.history_sidebar:
+            self.history_sidebar.load_history()
+        if self.current_session_id is None and not self.current_messages:
+            self._load_latest_session_on_startup()
+        elif self.current_session_id and self.history_sidebar:
+            # 加载完成前已经开始了新会话
+            self.history_sidebar.select_session(self.current_session_id)
+        if self.status_label and self.status_label.text() == "正在加载历史会话...":
+            self.status_label.setText("就绪")
+        if self.history_watcher:
+            self.history_watcher.start()
+
+    def _on_history_changed(self, updated: list, removed: list):
+        """历史目录中的会话在外部被修改或删除"""
+        if self.history_sidebar:
+            self.history_sidebar.apply_changes(updated, removed)
+        session_id = self.current_session_id
+        if session_id is None or session_id in self.streams:
+            return # 正在生成的会话以内存中的为准，保存时覆盖外部修改
+        if session_id in removed:
+            if self.status_label:
+                self.status_label.setText("当前会话的文件已在外部删除，继续对话会重新保存")
+        elif any(meta["id"] == session_id for meta in updated):
+            self._load_chat_session(session_id)
+            if self.status_label:
+                self.status_label.setText("当前会话已在外部更新，已重新加载")
+
     def _load_styles(self):
         try:
             with open("app/styles.qss", "r", encoding="utf-8") as f:
@@ -102,131 +199,189 @@ class ChatWindow(QWidget):
     def _connect_signals(self):
         if self.input_bar:
             self.input_bar.send_clicked.connect(self.on_user_input)
-        self.signals = WorkerSignals()  # 用于线程通信
-        self.signals.token_received.connect(self._handle_stream_token)
-        self.signals.error_occurred.connect(self._handle_stream_error)
-        self.signals.finished.connect(self._handle_stream_finished)
+            self.input_bar.stop_clicked.connect(self.stop_generation)
+        self.engine.token_received.connect(self._handle_stream_token)
+        self.engine.error_occurred.connect(self._handle_stream_error)
+        self.engine.finished.connect(self._handle_stream_finished)
+        self.engine.summary_ready.connect(self._handle_summary_ready)
+        self.engine.compare_token.connect(self._handle_compare_token)
+        self.engine.compare_result.connect(self._handle_compare_result)
+        self.engine.compare_finished.connect(self._handle_compare_finished)
+        if self.input_bar:
+            self.input_bar.set_compare_available(len(self._compare_models()) >= 2)
         if self.history_sidebar:
             self.history_sidebar.session_selected.connect(self._load_chat_session)
+            self.history_sidebar.search_result_selected.connect(self._jump_to_search_hit)
+            self.history_sidebar.session_deleting.connect(self._discard_session_stream)
             self.history_sidebar.new_chat_requested.connect(self._start_new_chat_session)
             self.history_sidebar.config_requested.connect(self._show_config_dialog)
+            self.history_sidebar.stats_requested.connect(self._show_usage_stats)
 
-        self.stream_buffer = ""  # 存储待处理的字符
-        self.char_display_timer = QTimer(self)  # 用于逐字显示的定时器
-        self.char_display_timer.timeout.connect(self._display_next_char)
-        self.char_display_interval = 50  # ms, 字符显示间隔
-        self.assistant_response_buffer = "" # Buffer for the complete assistant response in a stream
+        # 按帧批量渲染 token；打字机动画为可选的外观效果
+        self.render_scheduler = StreamRenderScheduler(
+            self.chat_area,
+            typing_animation=bool(config.get_config().get('typing_animation', False)),
+            parent=self,
+        )
+
+    @property
+    def active_request(self) -> Optional[RequestHandle]:
+        """当前会话正在进行的请求"""
+        stream = self.streams.get(self.current_session_id)
+        return stream.handle if stream else None
 
     def on_user_input(self, user_input: str):
         if not user_input:
             return
-        if self.chat_area:
-            self.chat_area.append_message("user", user_input)
-        # 获取当前会话的system prompt
-        session_data = self.history_manager.load_chat_session(self.current_session_id)
-        system_prompt = session_data.get('system_prompt', '你是一个有帮助的AI助手。') if session_data else '你是一个有帮助的AI助手。'
-        # 构造messages，首条为system prompt
-        messages = [{"role": "system", "content": system_prompt}]
-        messages += self.current_messages
+        stream = self.streams.get(self.current_session_id)
+        if stream is not None:
+            if self.send_policy == 'reject':
+                if self.input_bar:
+                    self.input_bar.input_box.setText(user_input) # 保留输入内容
+                if self.status_label:
+                    self.status_label.setText("正在生成回复，请等待完成或点击停止")
+                return
+            if self.send_policy == 'queue':
+                stream.queued_inputs.append(user_input)
+                if self.status_label:
+                    self.status_label.setText(f"正在生成回复，已排队 {len(stream.queued_inputs)} 条消息")
+                return
+            self.stop_generation()
+        compare_models = self._compare_models() if self.input_bar and self.input_bar.compare_mode else None
+        self._submit(self.current_session_id, self.current_messages, user_input,
+                     compare_models=compare_models if compare_models and len(compare_models) >= 2 else None)
+
+    @staticmethod
+    def _compare_models() -> List[str]:
+        """多模型对比使用的模型（去重）：compare.models，未设置时为配置中的全部模型"""
+        cfg = config.get_config()
+        return list(dict.fromkeys((cfg.get('compare') or {}).get('models') or cfg.get('models') or []))
+
+    def _submit(self, session_id: Optional[str], messages: List[Dict], user_input: str,
+                queued: Optional[List[str]] = None, compare_models: Optional[List[str]] = None):
+        """
+        向指定会话发送一条消息；会话不在当前视图中时（排队的后续消息）只更新数据
+
+        :param messages: 该会话的消息列表，用户消息和回复都追加到其中
+        :param queued: 该会话在本条之后排队的输入
+        :param compare_models: 非空时并发发送给这些模型，在对比窗口中选择保存的回答
+        """
+        existing = self.streams.get(session_id)
+        if existing is not None:
+            # 排队的消息发出前会话又开始了新的请求，继续排在它后面
+            existing.queued_inputs.extend([user_input] + (queued or []))
+            return
+        is_current = session_id == self.current_session_id
+        if is_current and self.chat_area:
+            self.chat_area.append_message("user", user_input, seq=len(messages))
+        io_start = self.history_manager.io_snapshot()
+        # 获取会话的system prompt（来自内存中的会话对象）
+        session = self.history_manager.get_session(session_id)
+        system_prompt = session.system_prompt if session else '你是一个有帮助的AI助手。'
+        summary = session.summary if session else None
         messages.append({"role": "user", "content": user_input})
-        self.current_messages.append({"role": "user", "content": user_input})
-        if self.status_label:
+        if is_current and self.status_label:
             self.status_label.setText("正在思考...")
         if not self.qwen_client:
-            if self.chat_area:
+            if is_current and self.chat_area:
                 self.chat_area.append_message(
                     "assistant", "错误：Qwen API客户端未初始化。"
                 )
-            if self.status_label:
+            if is_current and self.status_label:
                 self.status_label.setText("错误")
             return
-        self.is_first_token = True  # Reset for the new stream
-        self.assistant_response_buffer = "" # Clear buffer for new response
-        # 启动异步任务在子线程中执行
-        thread = threading.Thread(
-            target=self._run_qwen_request_in_thread, args=(messages,)
-        )
-        thread.start()
-
-    def _run_qwen_request_in_thread(self, messages_context: list[dict[str,str]]):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(self._get_qwen_response_async(messages_context))
-        loop.close()
-
-    async def _get_qwen_response_async(self, messages_context: list[dict[str,str]]):
-        if not self.qwen_client:
-            self.signals.error_occurred.emit("Qwen API客户端未初始化。")
-            return
-
+        # 构造messages：首条为system prompt，历史按上下文预算裁剪
+        # 对比多个模型时按上下文窗口最小的模型裁剪，保证所有模型收到相同的上下文
+        plan_model = (min(compare_models, key=self.context_manager.context_limit)
+                      if compare_models else self.qwen_client.model)
+        plan = self.context_manager.fit(system_prompt, messages, plan_model, summary, session_id=session_id)
+        self.last_context_plan = plan
+        print(f"[ChatWindow] Context plan for '{session_id}': {plan.to_dict()}")
+        if plan.prefix_break:
+            print(f"[ChatWindow] Prompt prefix changed for '{session_id}' ({plan.prefix_break}), "
+                  f"only {plan.prefix_tokens} of {plan.prompt_tokens} tokens can hit the prefix cache")
+        if is_current and self.status_label:
+            status = f"正在思考... (上下文约 {plan.prompt_tokens} tokens"
+            if plan.truncated:
+                status += f"，省略 {plan.dropped} 条早期消息"
+            self.status_label.setText(status + ")")
+        # 提交到常驻事件循环；top_p 在GUI线程读取后作为本次请求的参数传入
         current_top_p = (
             self.config_bar.get_top_p_value()
             if self.config_bar
             else self.qwen_client.top_p
         )
-        self.qwen_client.top_p = current_top_p
-        self.qwen_client.stream = True
-        
-        print(f"[DEBUG] _get_qwen_response_async: Sending messages to Qwen API: {messages_context}")
-        print(f"[DEBUG] _get_qwen_response_async: Using top_p: {self.qwen_client.top_p}, stream: {self.qwen_client.stream}")
-
-        def stream_callback_adapter(token):
-            # print(f"[DEBUG] stream_callback_adapter: Received token: {token}")
-            self.signals.token_received.emit(token)
-
-        try:
-            print("[DEBUG] _get_qwen_response_async: Calling qwen_client.chat_completion")
-            await self.qwen_client.chat_completion(
-                messages=messages_context, # Use the provided context
-                callback=stream_callback_adapter
+        # 默认只缓存确定性请求；cache_all 表示用户选择缓存所有请求
+        cache_all = (config.get_config().get('response_cache') or {}).get('cache_all', False)
+        if compare_models:
+            race = (config.get_config().get('compare') or {}).get('policy') == 'race'
+            handle = self.engine.compare(plan.messages, compare_models, race=race,
+                                         extra_params={"top_p": current_top_p}, session_id=session_id)
+        else:
+            handle = self.engine.chat_completion(
+                plan.messages,
+                extra_params={"top_p": current_top_p},
+                use_cache=True if cache_all else None,
+                session_id=session_id,
             )
-            print("[DEBUG] _get_qwen_response_async: qwen_client.chat_completion finished")
-        except QwenAPIException as e:
-            print(f"[DEBUG] _get_qwen_response_async: QwenAPIException: {e.error_type} - {e.message}")
-            user_message, error_details = QwenAPIClient.format_error_message(e)
-            print(f"[ERROR] {e.error_type}: {e.message}")
-            print(f"[ERROR] Details: {json.dumps(error_details, ensure_ascii=False, indent=2)}")
-            self.signals.error_occurred.emit(user_message)
-        except Exception as e:
-            print(f"[DEBUG] _get_qwen_response_async: Unexpected error: {e}")
-            user_message, error_details = QwenAPIClient.format_error_message(e)
-            print(f"[ERROR] Unexpected error: {error_details}")
-            self.signals.error_occurred.emit(f"发生未知错误: {e}")
-        finally:
-            print("[DEBUG] _get_qwen_response_async: Emitting finished signal")
-            self.signals.finished.emit()
-
-    def _handle_stream_token(self, token: str):
-        # print(f"[ChatWindow DEBUG] _handle_stream_token: Received token: '{token}'")
-        if self.is_first_token and self.chat_area:
-            # print("[ChatWindow DEBUG] First token, creating assistant message placeholder.")
+        stream = SessionStream(session_id, messages, handle)
+        if compare_models:
+            stream.compare = CompareDialog(compare_models, user_input, race=race, parent=self)
+            stream.compare.answer_chosen.connect(
+                lambda model, content, s=stream: self._finish_compare(s, model, content))
+            stream.compare.finished.connect(lambda _result, s=stream: self._close_compare(s))
+            stream.compare.show()
+        stream.queued_inputs = list(queued or [])
+        stream.io_start = io_start
+        self.streams[session_id] = stream
+        self._stream_requests[handle.request_id] = stream
+        if is_current and self.input_bar:
+            self.input_bar.set_generating(True)
+        if session_id and self.history_sidebar:
+            self.history_sidebar.set_session_generating(session_id, True)
+        if session_id and self.context_manager.needs_summary(plan, summary):
+            self.engine.summarize(
+                session_id,
+                ContextManager.build_summary_request(messages, summary, plan.window_start),
+                plan.window_start,
+            )
+
+    def _handle_summary_ready(self, session_id: str, content: str, covers: int):
+        session = self.history_manager.get_session(session_id)
+        if not session:
+            return
+        session_data = session.to_dict()
+        session_data['summary'] = {"content": content, "covers": covers}
+        self.history_manager.save_chat_session(session_id, session_data)
+        print(f"[ChatWindow] Summary cached for session '{session_id}' (covers {covers} messages)")
+
+    def _handle_stream_token(self, request_id: int, token: str):
+        stream = self._stream_requests.get(request_id)
+        if stream is None:
+            return # 已取消请求的残留信号直接忽略
+        stream.buffer += token # Accumulate full assistant response
+        if stream.session_id != self.current_session_id:
+            return # 后台会话只累积，切换回来时再显示
+        if not stream.shown and self.chat_area:
             self.chat_area.append_message(
-                "assistant", ""
+                "assistant", "", seq=len(stream.messages)
             )  # Create placeholder structure
-            self.is_first_token = False
-        
-        self.assistant_response_buffer += token # Accumulate full assistant response
-        self.stream_buffer += token
-        if not self.char_display_timer.isActive():
-            # print("[ChatWindow DEBUG] Starting char_display_timer.")
-            self.char_display_timer.start(self.char_display_interval)
-
-    def _display_next_char(self):
-        if not self.stream_buffer:
-            self.char_display_timer.stop()
-            return
-
-        char_to_display = self.stream_buffer[0]
-        self.stream_buffer = self.stream_buffer[1:]
+            stream.shown = True
+        self.render_scheduler.push(token)
 
-        if self.chat_area:
-            self.chat_area.stream_token(char_to_display)
-
-        if not self.stream_buffer:  # 如果缓冲区空了，停止定时器
-            self.char_display_timer.stop()
-
-    def _handle_stream_error(self, error_message: str):
+    def _handle_stream_error(self, request_id: int, error_message: str):
         """处理流式输出过程中的错误"""
+        stream = self._stream_requests.get(request_id)
+        if stream is None:
+            return
+        stream.error = error_message
+        stream.buffer = ""
+        print(f"[ERROR] Stream error in session '{stream.session_id}': {error_message}")
+        if stream.session_id != self.current_session_id:
+            if self.status_label:
+                self.status_label.setText(f"后台会话「{self._session_title(stream.session_id)}」生成失败: {error_message}")
+            return
+        self.render_scheduler.flush() # 先写出已收到的内容
         if self.chat_area:
             if self.chat_area.streaming_message_open: # Check if a stream was active
                 self.chat_area.finalize_stream() # Finalize stream even on error
@@ -238,42 +393,187 @@ class ChatWindow(QWidget):
         if self.status_label:
             self.status_label.setText("错误")
 
-        print(f"[ERROR] Stream error: {error_message}")
-        if self.char_display_timer.isActive():
-            self.char_display_timer.stop()
-        self.stream_buffer = "" 
-        self.assistant_response_buffer = "" 
-
-    def _handle_stream_finished(self):
-        while self.stream_buffer:
-            self._display_next_char()
-        
-        if self.char_display_timer.isActive():
-            self.char_display_timer.stop()
-
-        if self.chat_area and self.chat_area.streaming_message_open:
-            self.chat_area.finalize_stream()
-        
-        if self.assistant_response_buffer:
-            self.current_messages.append({"role": "assistant", "content": self.assistant_response_buffer})
-            if self.current_session_id:
-                # 保存时带上标题和system prompt
-                session_data = self.history_manager.load_chat_session(self.current_session_id)
-                title = session_data.get('title', '新对话') if session_data else '新对话'
-                system_prompt = session_data.get('system_prompt', '你是一个有帮助的AI助手。') if session_data else '你是一个有帮助的AI助手。'
-                self.history_manager.save_chat_session(
-                    self.current_session_id,
-                    self.current_messages,
-                    title=title,
-                    system_prompt=system_prompt
-                )
-                if self.history_sidebar:
-                    self.history_sidebar.add_session_to_top(self.current_session_id, title)
-            self.assistant_response_buffer = ""
-
-        if self.status_label:
-            self.status_label.setText("就绪")
-        print("[ChatWindow DEBUG] Stream finished and finalized.")
+    def _handle_stream_finished(self, request_id: int):
+        stream = self._stream_requests.pop(request_id, None)
+        if stream is None:
+            return
+        self._detach_stream(stream)
+        is_current = stream.session_id == self.current_session_id
+        if is_current:
+            self.render_scheduler.flush()
+            if self.chat_area and self.chat_area.streaming_message_open:
+                self.chat_area.finalize_stream()
+
+        if stream.buffer:
+            self._save_assistant_reply(stream, stream.buffer)
+
+        if self.status_label and stream.error is None:
+            if is_current:
+                self.status_label.setText(self._metrics_status() or "就绪")
+            else:
+                self.status_label.setText(f"后台会话「{self._session_title(stream.session_id)}」已完成回复")
+        self._log_turn_io(stream)
+        print(f"[ChatWindow DEBUG] Stream for session '{stream.session_id}' finished and finalized.")
+        if stream.queued_inputs:
+            next_input = stream.queued_inputs.pop(0)
+            QTimer.singleShot(0, lambda: self._submit(
+                stream.session_id, stream.messages, next_input, stream.queued_inputs))
+
+    def _handle_compare_token(self, request_id: int, model: str, token: str):
+        stream = self._stream_requests.get(request_id)
+        if stream is not None and stream.compare is not None:
+            stream.compare.append_token(model, token)
+
+    def _handle_compare_result(self, request_id: int, model: str, content: str, error: str, metrics: dict):
+        stream = self._stream_requests.get(request_id)
+        if stream is not None and stream.compare is not None:
+            stream.compare.set_result(model, content, error, metrics)
+
+    def _handle_compare_finished(self, request_id: int, winner: str):
+        stream = self._stream_requests.pop(request_id, None)
+        if stream is None or stream.compare is None:
+            return
+        if stream.session_id == self.current_session_id and self.status_label and not winner:
+            self.status_label.setText("对比完成，请在对比窗口中选择要保存的回答")
+        # 会话保持“生成中”直到选择了回答或关闭对比窗口；race 策略下这里会直接采用胜出的回答
+        stream.compare.set_finished(winner)
+
+    def _finish_compare(self, stream: SessionStream, model: str, content: str):
+        """对比窗口中选择了回答：作为本轮回复保存到会话"""
+        if self.streams.get(stream.session_id) is not stream:
+            return # 已停止或会话已被删除
+        self._stream_requests.pop(stream.request_id, None)
+        self._detach_stream(stream)
+        if stream.session_id == self.current_session_id:
+            if self.chat_area:
+                self.chat_area.append_message("assistant", content, seq=len(stream.messages))
+            if self.status_label:
+                self.status_label.setText(f"已保存 {model} 的回答")
+        self._save_assistant_reply(stream, content, model=model)
+        self._log_turn_io(stream)
+        if self.qwen_client and self.qwen_client.metrics:
+            print(f"[ChatWindow] Per-model metrics: {self.qwen_client.metrics.by_model()}")
+        if stream.queued_inputs:
+            next_input = stream.queued_inputs.pop(0)
+            QTimer.singleShot(0, lambda: self._submit(
+                stream.session_id, stream.messages, next_input, stream.queued_inputs))
+
+    def _close_compare(self, stream: SessionStream):
+        """对比窗口被关闭：未选择回答时取消仍在进行的请求，本轮不保存回复"""
+        if self.streams.get(stream.session_id) is not stream:
+            return
+        self._stream_requests.pop(stream.request_id, None)
+        self._detach_stream(stream)
+        stream.handle.cancel()
+        if stream.session_id == self.current_session_id and self.status_label:
+            self.status_label.setText("已取消对比")
+        self._log_turn_io(stream)
+
+    def _detach_stream(self, stream: SessionStream):
+        """请求结束或取消后，解除会话与请求的关联并更新界面状态"""
+        if self.streams.get(stream.session_id) is stream:
+            del self.streams[stream.session_id]
+        if stream.session_id and self.history_sidebar:
+            self.history_sidebar.set_session_generating(stream.session_id, False)
+        if stream.session_id == self.current_session_id and self.input_bar:
+            self.input_bar.set_generating(False)
+
+    def _session_title(self, session_id: Optional[str]) -> str:
+        session = self.history_manager.get_session(session_id)
+        return session.title if session else '新对话'
+
+    def _save_assistant_reply(self, stream: SessionStream, content: str, truncated: bool = False,
+                              model: Optional[str] = None):
+        message = {"role": "assistant", "content": content}
+        if truncated:
+            message["truncated"] = True # 回复被中断，内容不完整
+        if model:
+            message["model"] = model # 多模型对比时记录采用的是哪个模型的回答
+        stream.messages.append(message)
+        if stream.session_id:
+            # 保存时带上标题和system prompt
+            session = self.history_manager.get_session(stream.session_id)
+            title = session.title if session else '新对话'
+            self.history_manager.save_chat_session(
+                stream.session_id,
+                stream.messages,
+                title=title,
+                system_prompt=session.system_prompt if session else None,
+                summary=session.summary if session else None
+            )
+            if self.history_sidebar:
+                # 后台会话完成时不改变侧边栏的选中项
+                self.history_sidebar.add_session_to_top(
+                    stream.session_id, title, select=stream.session_id == self.current_session_id)
+
+    def stop_generation(self, session_id: Optional[str] = None):
+        """
+        停止会话（默认为当前会话）的回复：取消请求（立即关闭 HTTP 流），
+        已收到的部分内容保存到会话并标记为 truncated。
+        """
+        stream = self.streams.get(self.current_session_id if session_id is None else session_id)
+        if stream is None:
+            return
+        self._stream_requests.pop(stream.request_id, None)
+        self._detach_stream(stream)
+        stream.handle.cancel()
+        if stream.compare is not None:
+            stream.compare.close()
+        is_current = stream.session_id == self.current_session_id
+        if is_current:
+            self.render_scheduler.flush()
+            if self.chat_area and self.chat_area.streaming_message_open:
+                self.chat_area.finalize_stream()
+        if stream.buffer:
+            self._save_assistant_reply(stream, stream.buffer, truncated=True)
+        if is_current:
+            if self.chat_area:
+                self.chat_area.append_message("system", "⏹ 已停止生成，回复不完整")
+            if self.status_label:
+                self.status_label.setText("已停止")
+        self._log_turn_io(stream)
+        print(f"[ChatWindow] Request {stream.request_id} cancelled.")
+
+    def _metrics_status(self) -> str:
+        """最近一次请求的首字时间、生成速度等，未启用指标时返回空字符串"""
+        if not self.qwen_client or not self.qwen_client.metrics:
+            return ""
+        last = self.qwen_client.metrics.last()
+        if last is not None:
+            print(f"[ChatWindow] Request metrics: {last.to_dict()}")
+        return self.qwen_client.metrics.format_status()
+
+    def _discard_session_stream(self, session_id: str):
+        """会话即将被删除：取消其请求且不保存回复，避免完成时重新写回会话文件"""
+        stream = self.streams.get(session_id)
+        if stream is None:
+            return
+        self._stream_requests.pop(stream.request_id, None)
+        self._detach_stream(stream)
+        stream.handle.cancel()
+        if stream.compare is not None:
+            stream.compare.close()
+        if session_id == self.current_session_id:
+            self.render_scheduler.clear()
+            if self.chat_area and self.chat_area.streaming_message_open:
+                self.chat_area.finalize_stream()
+
+    def _log_turn_io(self, stream: SessionStream):
+        """打印本轮对话的会话文件读写次数，便于发现多余的磁盘往返"""
+        start = stream.io_start
+        if start is None:
+            return
+        end = self.history_manager.io_snapshot()
+        delta = {key: end[key] - start.get(key, 0) for key in end}
+        print(f"[ChatWindow] Turn I/O: {delta}")
+        stream.io_start = None
+
+    def _leave_current_view(self):
+        """切换会话前调用：当前会话如仍在生成，改为在后台累积"""
+        self.render_scheduler.clear()
+        stream = self.streams.get(self.current_session_id)
+        if stream is not None:
+            stream.shown = False
 
     def _start_new_chat_session(self, add_to_sidebar=True):
         # 弹窗输入标题和system prompt
@@ -285,10 +585,13 @@ class ChatWindow(QWidget):
         else:
             # 用户取消则不新建
             return
+        self._leave_current_view() # 正在生成的会话在后台继续
         self.current_session_id = self.history_manager.generate_session_id()
         self.current_messages = []
         if self.chat_area:
             self.chat_area.clear()
+        if self.input_bar:
+            self.input_bar.set_generating(False)
         # 保存空会话（带标题和system prompt）
         self.history_manager.save_chat_session(
             self.current_session_id,
@@ -315,26 +618,34 @@ class ChatWindow(QWidget):
             print("[ChatWindow] No history found. Starting with an empty session.")
 
     def _load_chat_session(self, session_id: str):
+        if session_id == self.current_session_id and session_id in self.streams:
+            return # 正在生成的会话无需重新加载
         session_data = self.history_manager.load_chat_session(session_id)
         if session_data:
-            # Ensure we have the messages list
-            messages = session_data.get('messages', [])
+            self._leave_current_view() # 正在生成的会话在后台继续
+            stream = self.streams.get(session_id)
+            # 正在生成的会话使用请求所持有的消息列表（含尚未保存的用户消息）
+            messages = stream.messages if stream else session_data.get('messages', [])
             self.current_session_id = session_id
             # Store the loaded messages including system prompt if it exists in the file
             # However, we should only display user/assistant messages
             self.current_messages = messages # Keep full history internally
 
             if self.chat_area:
-                self.chat_area.clear()
-                # Display only user and assistant messages
-                for msg in messages:
-                    if msg['role'] in ['user', 'assistant']:
-                         self.chat_area.append_message(msg['role'], msg['content'])
+                # Display only user and assistant messages, most recent page first
+                self.chat_area.load_messages(messages)
+                if stream is not None and stream.buffer:
+                    # 显示在后台已经收到的内容，后续 token 继续追加
+                    self.chat_area.append_message("assistant", "", seq=len(messages))
+                    self.chat_area.stream_token(stream.buffer)
+                    stream.shown = True
+            if self.input_bar:
+                self.input_bar.set_generating(stream is not None)
 
             if self.status_label:
                 # Use the title for status label if available
                 title = session_data.get('title', session_id[:8] + '...')
-                self.status_label.setText(f"已加载会话: {title}")
+                self.status_label.setText(f"正在生成回复: {title}" if stream else f"已加载会话: {title}")
 
             if self.history_sidebar:
                 # Update the sidebar to show title
@@ -348,13 +659,52 @@ class ChatWindow(QWidget):
             # Fallback to a new chat session if loading fails
             self._start_new_chat_session()
 
-    async def mock_api_call(self, text):
-        # 模拟 API 延迟
-        await asyncio.sleep(0.5)
-        return "这是一个示例回复，当前输入是：" + text
+    def _jump_to_search_hit(self, session_id: str, seq: int, query: str):
+        """打开搜索结果所在的会话并定位到命中的消息（seq 为 -1 表示标题命中）"""
+        if session_id != self.current_session_id:
+            self._load_chat_session(session_id)
+            if session_id != self.current_session_id:
+                return
+        if seq < 0 or not self.chat_area:
+            return
+        if not self.chat_area.scroll_to_message(seq, query) and self.active_request is None:
+            # 锚点不在当前显示内容中（例如显示的是旧内容），重新加载后再定位
+            self.chat_area.load_messages(self.current_messages)
+            self.chat_area.scroll_to_message(seq, query)
+
+    def closeEvent(self, event):
+        if self.history_watcher:
+            self.history_watcher.stop()
+        for session_id in list(self.streams):
+            self.stop_generation(session_id)
+        self.engine.shutdown()
+        if self.chat_area:
+            self.chat_area.highlighter.shutdown()
+        if self.qwen_client:
+            print(f"[ChatWindow] Request scheduler stats: {self.qwen_client.scheduler.stats}")
+            if self.qwen_client.metrics:
+                print(f"[ChatWindow] Request metrics summary: {self.qwen_client.metrics.summary()}")
+                self.qwen_client.metrics.close()
+        if self.qwen_client and self.qwen_client.cache:
+            print(f"[ChatWindow] Response cache stats: {self.qwen_client.cache.stats}")
+            self.qwen_client.cache.close()
+        self.history_manager.flush()
+        super().closeEvent(event)
+
+    def _show_usage_stats(self):
+        ledger = self.qwen_client.metrics.ledger if self.qwen_client and self.qwen_client.metrics else None
+        if ledger is None:
+            QMessageBox.information(self, "用量统计",
+                                    "用量账本未启用（需要在配置中同时启用 metrics 和 usage_ledger）。")
+            return
+        from app.widgets.usage_stats_dialog import UsageStatsDialog
+        dlg = UsageStatsDialog(ledger, self.history_manager, self)
+        dlg.exec()
 
     def _show_config_dialog(self):
         # TODO: 弹出配置页面
         from app.widgets.settings_dialog import SettingsDialog
         dlg = SettingsDialog(self)
         dlg.exec()
+        if self.input_bar:
+            self.input_bar.set_compare_available(len(self._compare_models()) >= 2)
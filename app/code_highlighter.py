@@ -0,0 +1,127 @@
+# app/code_highlighter.py
+
+import hashlib
+import html
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+from PyQt6.QtCore import QObject, pyqtSignal
+
+STYLE = "monokai"  # 与聊天区深色背景相配
+GUESS_MAX_CHARS = 4000  # 未标注语言时只对较短的代码猜测语言
+
+_pygments = None  # 首次高亮时在后台线程中导入，不增加启动耗时；False 表示未安装
+
+
+def _load_pygments():
+    """语法高亮为可选依赖，未安装时代码块以等宽纯文本显示"""
+    global _pygments
+    if _pygments is None:
+        try:
+            import pygments
+            import pygments.formatters
+            import pygments.lexers
+            import pygments.util
+            _pygments = pygments
+        except ImportError:
+            print("[CodeHighlighter] pygments is not installed, code blocks are shown without highlighting.")
+            _pygments = False
+    return _pygments
+
+
+def code_key(code: str, lang: str) -> str:
+    return hashlib.sha1(f"{lang}\0{code}".encode("utf-8")).hexdigest()
+
+
+def plain_code_html(code: str) -> str:
+    return f'<pre style="margin:0;">{html.escape(code)}</pre>'
+
+
+def highlight_html(code: str, lang: str) -> str:
+    """把代码渲染为带内联颜色的 HTML（QTextDocument 不支持 CSS 类），没有合适的词法分析器时返回纯文本"""
+    pygments = _load_pygments()
+    if not pygments:
+        return plain_code_html(code)
+    try:
+        if lang:
+            lexer = pygments.lexers.get_lexer_by_name(lang.lower(), stripnl=False)
+        elif len(code) <= GUESS_MAX_CHARS:
+            lexer = pygments.lexers.guess_lexer(code, stripnl=False)
+        else:
+            return plain_code_html(code)
+    except pygments.util.ClassNotFound:
+        return plain_code_html(code)
+    formatter = pygments.formatters.HtmlFormatter(style=STYLE, nowrap=True, noclasses=True)
+    # 词法分析器总会在末尾补一个换行，去掉以免代码块多出一个空行
+    body = pygments.highlight(code, lexer, formatter).rstrip("\n")
+    return f'<pre style="margin:0;">{body}</pre>'
+
+
+class CodeHighlighter(QObject):
+    """
+    在后台线程中为代码块做语法高亮，结果按 (语言, 代码) 的哈希缓存在内存 LRU 中。
+
+    lookup 在 GUI 线程中调用：已缓存时直接返回 HTML，否则提交后台任务并返回 None，
+    完成后通过 highlighted 信号（以队列方式投递到 GUI 线程）通知调用方替换纯文本的占位内容。
+    """
+
+    highlighted = pyqtSignal(str, str)  # 代码哈希, HTML
+    _done = pyqtSignal(str, str)  # 后台线程 -> GUI 线程
+
+    _instance: Optional["CodeHighlighter"] = None
+
+    @classmethod
+    def instance(cls) -> "CodeHighlighter":
+        """各个 ChatArea（包括对比窗口）共用的实例，缓存因此在它们之间共享"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, max_entries: int = 512, parent=None):
+        super().__init__(parent)
+        self.max_entries = max(1, max_entries)
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._done.connect(self._on_done)
+        self.stats = {"hits": 0, "misses": 0}
+
+    def lookup(self, key: str, code: str, lang: str) -> Optional[str]:
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached
+        self.stats["misses"] += 1
+        if key not in self._pending:
+            self._pending.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CodeHighlighter")
+            self._executor.submit(self._highlight, key, code, lang)
+        return None
+
+    def _highlight(self, key: str, code: str, lang: str):
+        try:
+            result = highlight_html(code, lang)
+        except Exception as e:  # 个别词法分析器对异常输入可能抛出任意异常
+            print(f"[CodeHighlighter] Highlighting failed ({lang or 'unknown'}): {e}")
+            result = plain_code_html(code)
+        self._done.emit(key, result)
+
+    def _on_done(self, key: str, result: str):
+        self._pending.discard(key)
+        self._cache[key] = result
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        self.highlighted.emit(key, result)
+
+    @property
+    def busy(self) -> bool:
+        """是否还有未完成的高亮任务"""
+        return bool(self._pending)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
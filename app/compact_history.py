@@ -0,0 +1,76 @@
+# app/compact_history.py
+
+"""
+批量迁移/压缩历史会话：把目录中的全部会话（.json / .jsonl / .jsonl.gz / .jsonl.zst）
+整体重写为指定的存储格式，去掉追加写积累的冗余 header 记录；
+jsonl.zst 格式下先用小会话训练共享字典。完成后输出迁移前后的磁盘占用与全部会话的读取耗时。
+
+迁移不会修改 user_config.json：要让之后新建的会话也使用该格式，
+需要把 history_storage.format 设为相同的值（否则会话在下次整体重写时转回配置的格式）。
+
+用法: python -m app.compact_history [--format jsonl.zst] [--level 3] [--history-dir chat_history]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import List, Optional
+
+import config
+from app import session_codec
+from app.history_manager import HistoryManager
+
+
+def _read_all(manager: HistoryManager) -> float:
+    """不经缓存读取全部会话文件，返回耗时秒数"""
+    start = time.perf_counter()
+    for _ in manager.iter_session_files():
+        pass
+    return time.perf_counter() - start
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    options = config.get_config().get('history_storage') or {}
+    parser = argparse.ArgumentParser(description="批量迁移/压缩历史会话")
+    parser.add_argument("--format", choices=sorted(session_codec.FORMATS), default=options.get('format') or "jsonl",
+                        help="目标存储格式（默认使用配置中的 history_storage.format）")
+    parser.add_argument("--level", type=int, default=options.get('compression_level') or None, help="压缩级别")
+    parser.add_argument("--history-dir", default=config.HISTORY_DIR)
+    parser.add_argument("--no-dictionary", action="store_true", help="jsonl.zst 格式下不训练共享字典")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.history_dir):
+        print(f"[Compact] {args.history_dir} does not exist")
+        return 1
+    if args.format == "jsonl.zst" and not session_codec.zstd_available():
+        print("[Compact] jsonl.zst requires zstandard: pip install zstandard")
+        return 1
+
+    manager = HistoryManager(history_dir=args.history_dir, storage_format=args.format,
+                             compression_level=args.level)
+    with contextlib.redirect_stdout(io.StringIO()):  # 不输出每个会话的日志
+        manager.sync_index()
+        read_before = _read_all(manager)
+
+    def progress(done: int, total: int):
+        if done % 500 == 0 or done == total:
+            print(f"[Compact] {done}/{total}", file=sys.stderr)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = manager.compact_all(train_dictionary=not args.no_dictionary, progress=progress)
+        read_after = _read_all(manager)
+    manager.index.close()
+
+    before, after = report["bytes_before"], report["bytes_after"]
+    print(f"[Compact] {report['sessions']} session(s) -> {args.format} in {report['seconds']:.1f} s"
+          + (f", dictionary {report['dictionary_id']}" if report["dictionary_id"] else ""))
+    print(f"[Compact] size: {before / 1024:.0f} KB -> {after / 1024:.0f} KB"
+          + (f" ({after / before:.0%})" if before else ""))
+    print(f"[Compact] read all sessions: {read_before * 1000:.0f} ms -> {read_after * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
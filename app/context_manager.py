@@ -0,0 +1,282 @@
+# app/context_manager.py
+
+import hashlib
+import json
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
+import config
+from app.session_index import message_text
+
+DEFAULT_CONTEXT_LIMIT = 32768
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色/分隔符开销
+SUMMARY_PREFIX = "以下是之前对话的摘要：\n"
+WINDOW_SLACK = 0.25  # 窗口需要前移时额外让出的预算比例，之后若干轮的请求前缀保持不变
+
+# 前缀缓存失效的原因
+PREFIX_SYSTEM_PROMPT = "system_prompt"
+PREFIX_SUMMARY = "summary"
+PREFIX_HISTORY = "history"
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF      # CJK 统一汉字
+        or 0x3400 <= code <= 0x4DBF   # 扩展 A
+        or 0x3000 <= code <= 0x303F   # CJK 标点
+        or 0xFF00 <= code <= 0xFFEF   # 全角字符
+        or 0x3040 <= code <= 0x30FF   # 日文假名
+        or 0xAC00 <= code <= 0xD7AF   # 韩文
+    )
+
+
+def estimate_text_tokens(text: str) -> int:
+    """粗略估算 token 数：CJK 字符约 1 token/字，其他字符约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+@lru_cache(maxsize=8192)
+def _estimate_text_message_tokens(role: str, content: str) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + estimate_text_tokens(role) + estimate_text_tokens(content)
+
+
+def estimate_message_tokens(role: str, content) -> int:
+    """
+    估算单条消息的 token 数，按 (role, content) 缓存
+    :param content: 字符串，或多模态消息的内容列表（只计其中的文本部分）
+    """
+    if not isinstance(content, str):
+        content = message_text({"content": content})
+    return _estimate_text_message_tokens(role or '', content)
+
+
+def canonical_message(message: Dict) -> str:
+    """消息的规范序列化：固定字段顺序与分隔符，内容相同的消息总是得到相同的字节"""
+    return json.dumps({"role": message['role'], "content": message['content']},
+                      ensure_ascii=False, separators=(",", ":"))
+
+
+def prefix_fingerprints(messages: List[Dict]) -> List[str]:
+    """每个前缀（前 1..n 条消息）的累积哈希，用于判断两次请求共享多长的前缀"""
+    digest = hashlib.sha1()
+    fingerprints = []
+    for message in messages:
+        digest.update(canonical_message(message).encode("utf-8"))
+        digest.update(b"\n")
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+class ContextPlan:
+    """一次请求的上下文预算结果，供调用方查看/记录"""
+
+    def __init__(self, messages: List[Dict[str, str]], prompt_tokens: int, budget: int,
+                 context_limit: int, dropped: int, pinned: int, summary_used: bool,
+                 window_start: int, fingerprints: Optional[List[str]] = None):
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.budget = budget
+        self.context_limit = context_limit
+        self.dropped = dropped
+        self.pinned = pinned
+        self.summary_used = summary_used
+        self.window_start = window_start  # 滑动窗口中最早一条消息在历史中的下标
+        self.fingerprints = fingerprints or prefix_fingerprints(messages)
+        # 与同一会话上一次请求相比（由 ContextManager.fit 在传入 session_id 时填写）
+        self.prefix_messages = 0  # 共享前缀的消息数
+        self.prefix_tokens = 0  # 共享前缀的估算 token 数，即服务端可能命中前缀缓存的部分
+        self.prefix_break: Optional[str] = None  # 上一次请求的前缀没有被完整保留时的原因
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped > 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "budget": self.budget,
+            "context_limit": self.context_limit,
+            "sent_messages": len(self.messages),
+            "dropped": self.dropped,
+            "pinned": self.pinned,
+            "summary_used": self.summary_used,
+            "prefix_tokens": self.prefix_tokens,
+            "prefix_break": self.prefix_break,
+        }
+
+
+class ContextManager:
+    """
+    上下文窗口预算管理
+
+    - 每条消息的 token 数按内容缓存估算
+    - 各模型的上下文上限来自 user_config.json 的 context_limits
+    - 超出预算时保留 system prompt、置顶消息 (pinned) 和最近的消息（滑动窗口），
+      被省略的早期消息可以用缓存在会话文件中的滚动摘要代替
+    - 请求前缀保持稳定，以便命中服务端的前缀缓存：消息总是按 system prompt、摘要、历史的顺序
+      以相同的字段发送；窗口起点在放得下时保持不动，需要前移时一次多让出 WINDOW_SLACK 的预算，
+      而不是每轮都丢掉最早的一条
+    """
+
+    def __init__(self, reserve_tokens: int = 2048, summary_batch: int = 6):
+        """
+        :param reserve_tokens: 为模型输出预留的 token 数（通常等于 max_tokens）
+        :param summary_batch: 至少累积多少条未摘要的消息才重新生成摘要，避免每轮都请求
+        """
+        self.reserve_tokens = reserve_tokens
+        self.summary_batch = max(1, summary_batch)
+        # 各会话上一次请求的 (窗口起点, 前缀哈希, 是否带摘要)
+        self._last_requests: Dict[str, Tuple[int, List[str], bool]] = {}
+
+    def context_limit(self, model: str) -> int:
+        limits = config.get_config().get('context_limits', {}) or {}
+        return int(limits.get(model, limits.get('default', DEFAULT_CONTEXT_LIMIT)))
+
+    def summary_enabled(self) -> bool:
+        return bool(config.get_config().get('context_summary', False))
+
+    @staticmethod
+    def message_tokens(message: Dict) -> int:
+        return estimate_message_tokens(message.get('role', ''), message.get('content', '') or '')
+
+    @staticmethod
+    def _outgoing(message: Dict) -> Dict[str, str]:
+        # 只发送 API 认识的字段，pinned/truncated 等本地标记不上传；字段顺序固定为 role, content
+        return {"role": message['role'], "content": message.get('content') or ''}
+
+    def fit(self, system_prompt: str, messages: List[Dict], model: str,
+            summary: Optional[Dict] = None, session_id: Optional[str] = None) -> ContextPlan:
+        """
+        把 system prompt + 历史消息裁剪到预算之内
+
+        :param system_prompt: 会话的 system prompt，始终作为第一条发送
+        :param messages: 会话历史（最后一条通常是本轮用户输入）
+        :param model: 模型名，用于查找上下文上限
+        :param summary: 会话中缓存的摘要 {"content": str, "covers": int}，
+                        covers 表示摘要覆盖了前多少条消息
+        :param session_id: 传入时沿用该会话上一次请求的窗口起点，并与上一次请求比较前缀
+        :return: ContextPlan
+        """
+        limit = self.context_limit(model)
+        budget = max(limit - self.reserve_tokens, 0)
+        system_message = {"role": "system", "content": system_prompt or ''}
+        used = self.message_tokens(system_message)
+
+        # 最后一条消息和 pinned 消息必须保留
+        keep = set()
+        if messages:
+            keep.add(len(messages) - 1)
+        keep.update(i for i, m in enumerate(messages) if m.get('pinned'))
+        for i in keep:
+            used += self.message_tokens(messages[i])
+
+        summary_message = None
+        summary_covers = 0
+        if summary and summary.get('content'):
+            summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary['content']}
+            summary_covers = int(summary.get('covers', 0))
+
+        selected = set(keep)
+        costs = {i: self.message_tokens(m) for i, m in enumerate(messages) if i not in keep}
+        last = self._last_requests.get(session_id) if session_id else None
+        anchor = last[0] if last else 0
+        anchored = sum(cost for i, cost in costs.items() if i >= anchor)
+        if used + sum(costs.values()) <= budget:
+            # 全部放得下
+            selected.update(costs)
+            used += sum(costs.values())
+        elif last and used + anchored <= budget:
+            # 上一次的窗口起点仍然放得下：不丢弃更多消息，前缀保持不变
+            selected.update(i for i in costs if i >= anchor)
+            used += anchored
+        else:
+            # 从新到旧填充滑动窗口；窗口前移时留出余量，之后几轮不必再移动
+            fill_limit = budget - int(budget * WINDOW_SLACK)
+            for i in range(len(messages) - 1, -1, -1):
+                if i in keep:
+                    continue
+                if used + costs[i] > fill_limit:
+                    break
+                used += costs[i]
+                selected.add(i)
+
+        summary_used = bool(summary_message and summary_covers > 0 and len(selected) < len(messages))
+        if summary_used:
+            cost = self.message_tokens(summary_message)
+            # 为摘要腾出空间：从窗口最旧端继续丢弃非保留消息
+            for i in sorted(selected):
+                if used + cost <= budget:
+                    break
+                if i in keep:
+                    continue
+                selected.discard(i)
+                used -= self.message_tokens(messages[i])
+            used += cost
+
+        window = [i for i in selected if not messages[i].get('pinned')]
+        outgoing = [system_message]
+        if summary_used:
+            outgoing.append(summary_message)
+        outgoing += [self._outgoing(messages[i]) for i in sorted(selected)]
+        plan = ContextPlan(
+            messages=outgoing,
+            prompt_tokens=used,
+            budget=budget,
+            context_limit=limit,
+            dropped=len(messages) - len(selected),
+            pinned=len(selected) - len(window),
+            summary_used=summary_used,
+            window_start=min(window) if window else len(messages),
+        )
+        if session_id:
+            self._compare_prefix(session_id, plan, last)
+        return plan
+
+    def _compare_prefix(self, session_id: str, plan: ContextPlan, last: Optional[Tuple[int, List[str], bool]]):
+        """记录本次请求的前缀，并与该会话上一次请求比较可复用的部分"""
+        self._last_requests[session_id] = (plan.window_start, plan.fingerprints, plan.summary_used)
+        if not last:
+            return
+        previous, previous_summary = last[1], last[2]
+        shared = 0
+        for old, new in zip(previous, plan.fingerprints):
+            if old != new:
+                break
+            shared += 1
+        plan.prefix_messages = shared
+        plan.prefix_tokens = sum(self.message_tokens(m) for m in plan.messages[:shared])
+        if shared == len(previous):
+            return
+        if shared == 0:
+            plan.prefix_break = PREFIX_SYSTEM_PROMPT
+        elif shared == 1 and (plan.summary_used or previous_summary):
+            plan.prefix_break = PREFIX_SUMMARY
+        else:
+            plan.prefix_break = PREFIX_HISTORY
+
+    def needs_summary(self, plan: ContextPlan, summary: Optional[Dict]) -> bool:
+        """滑动窗口之前的消息超出了现有摘要的覆盖范围时需要（重新）生成摘要"""
+        if not self.summary_enabled() or not plan.truncated:
+            return False
+        covers = int(summary.get('covers', 0)) if summary else 0
+        if covers == 0:
+            return plan.window_start > 0
+        return plan.window_start - covers >= self.summary_batch
+
+    @staticmethod
+    def build_summary_request(messages: List[Dict], summary: Optional[Dict], cutoff: int) -> List[Dict[str, str]]:
+        """构造生成滚动摘要的请求：旧摘要 + 尚未摘要的消息"""
+        covers = int(summary.get('covers', 0)) if summary else 0
+        parts = []
+        if summary and summary.get('content'):
+            parts.append(f"[已有摘要]\n{summary['content']}")
+        for m in messages[covers:cutoff]:
+            parts.append(f"[{m['role']}]\n{message_text(m)}")
+        return [
+            {"role": "system", "content": "你负责压缩对话历史。请用简洁的中文概括以下对话中的关键事实、结论和未完成的问题，不超过300字。"},
+            {"role": "user", "content": "\n\n".join(parts)},
+        ]
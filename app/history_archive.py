@@ -0,0 +1,190 @@
+# app/history_archive.py
+
+"""
+整个历史目录的导出/导入归档
+
+归档是一个 JSONL 流（可按扩展名用 gzip 或 zstd 流式压缩：.jsonl / .jsonl.gz / .jsonl.zst），
+第一行是归档头，之后每行一个完整的会话：
+    {"type": "archive", "format": "qwen-box-history", "version": 1, "created": ..., "sessions": N}
+    {"type": "session", "id": ..., "mtime": ..., "title": ..., "system_prompt": ..., "summary": ..., "messages": [...]}
+归档内容与会话文件的存储格式（以及 zstd 共享字典）无关，导入时按目标目录配置的格式重新写入。
+读写都是逐个会话进行，内存占用与会话总数无关。导入、导出的实现见
+HistoryManager.import_archive / export_archive。
+
+用法: python -m app.history_archive export backup.jsonl.zst [--history-dir chat_history]
+      python -m app.history_archive import backup.jsonl.zst [--overwrite] [--history-dir chat_history]
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+import config
+from app import session_codec
+
+ARCHIVE_FORMAT = "qwen-box-history"
+ARCHIVE_VERSION = 1
+ZSTD_LEVEL = 10  # 归档只写一次，压缩级别比会话文件高一些
+
+
+def _is_valid_session_id(session_id) -> bool:
+    """会话 ID 直接用作文件名，不接受路径或隐藏文件（索引、字典文件以 . 开头）"""
+    return (isinstance(session_id, str) and session_id and not session_id.startswith(".")
+            and os.path.basename(session_id) == session_id and "\0" not in session_id)
+
+
+class ArchiveWriter:
+    """按扩展名选择压缩方式，逐个写入会话；关闭时 fsync 一次"""
+
+    def __init__(self, path: str, sessions: Optional[int] = None):
+        self.path = path
+        self.sessions_written = 0
+        self._file = open(path, "wb")
+        if path.endswith(".zst"):
+            if not session_codec.zstd_available():
+                self._file.close()
+                os.remove(path)
+                raise RuntimeError("导出 .zst 归档需要安装 zstandard")
+            self._stream = session_codec.zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+                self._file, closefd=False)
+        elif path.endswith(".gz"):
+            self._stream = gzip.GzipFile(fileobj=self._file, mode="wb", mtime=0)
+        else:
+            self._stream = self._file
+        self._write({"type": "archive", "format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION,
+                     "created": time.time(), "sessions": sessions})
+
+    def _write(self, record: Dict) -> None:
+        self._stream.write((json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+
+    def write_session(self, session_id: str, mtime: float, data: Dict) -> None:
+        record = {"type": "session", "id": session_id, "mtime": mtime,
+                  "title": data.get("title"), "system_prompt": data.get("system_prompt")}
+        if data.get("summary"):
+            record["summary"] = data["summary"]
+        record["messages"] = data.get("messages", [])
+        self._write(record)
+        self.sessions_written += 1
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ArchiveReader:
+    """按文件开头的魔数识别压缩方式，逐行迭代归档中的会话记录"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        magic = self._file.read(4)
+        self._file.seek(0)
+        if magic.startswith(session_codec.ZSTD_MAGIC):
+            if not session_codec.zstd_available():
+                self._file.close()
+                raise RuntimeError("读取 .zst 归档需要安装 zstandard")
+            reader = session_codec.zstandard.ZstdDecompressor().stream_reader(
+                self._file, read_across_frames=True, closefd=False)
+            self._stream = io.BufferedReader(reader, buffer_size=1 << 20)
+        elif magic.startswith(session_codec.GZIP_MAGIC):
+            self._stream = gzip.GzipFile(fileobj=self._file, mode="rb")
+        else:
+            self._stream = self._file
+        first = self._stream.readline()
+        try:
+            header = json.loads(first) if first.strip() else {}
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            header = {}
+        self.header = header if isinstance(header, dict) else {}
+        if self.header.get("type") != "archive" or self.header.get("format") != ARCHIVE_FORMAT \
+                or not isinstance(self.header.get("version", 0), int):
+            self.close()
+            raise ValueError(f"{path} 不是 Qwen-Box 历史归档")
+        if self.header.get("version", 0) > ARCHIVE_VERSION:
+            self.close()
+            raise ValueError(f"归档版本 {self.header.get('version')} 高于当前支持的版本 {ARCHIVE_VERSION}")
+        self.corrupt = 0  # 无法解析而跳过的行数
+
+    @property
+    def sessions(self) -> Optional[int]:
+        """归档头中记录的会话数，用于显示进度"""
+        return self.header.get("sessions")
+
+    def __iter__(self) -> Iterator[Dict]:
+        for line in self._stream:  # 二进制模式只按 \n 分行，内容中的 U+2028 等字符不影响
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                self.corrupt += 1
+                continue
+            # 合法的 JSON 但不是对象（如 [1, 2]）同样按损坏的行跳过
+            if not isinstance(record, dict) or record.get("type") != "session" \
+                    or not _is_valid_session_id(record.get("id")) or not isinstance(record.get("messages"), list) \
+                    or not all(isinstance(message, dict) for message in record["messages"]):
+                self.corrupt += 1
+                continue
+            yield record
+
+    def close(self) -> None:
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="导出/导入全部历史会话")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("archive", help="归档文件（.jsonl / .jsonl.gz / .jsonl.zst）")
+    parser.add_argument("--history-dir", default=config.HISTORY_DIR)
+    parser.add_argument("--overwrite", action="store_true", help="导入时覆盖同 ID 的已有会话（默认跳过）")
+    args = parser.parse_args(argv)
+
+    from app.history_manager import HistoryManager
+    manager = HistoryManager.from_config(config.get_config(), history_dir=args.history_dir)
+
+    def progress(done: int, total: Optional[int]):
+        if done % 1000 == 0 or done == total:
+            print(f"[Archive] {done}/{total if total is not None else '?'}", file=sys.stderr)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # 不输出每个会话的日志
+            if args.command == "export":
+                report = manager.export_archive(args.archive, progress=progress)
+            else:
+                report = manager.import_archive(args.archive, overwrite=args.overwrite, progress=progress)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"[Archive] {args.command} failed: {e}")
+        return 1
+    finally:
+        manager.index.close()
+    print(f"[Archive] {args.command}: {json.dumps(report, ensure_ascii=False)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
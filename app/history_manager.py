@@ -1,23 +1,146 @@
 # app/history_manager.py
+import contextlib
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+from app import session_codec, session_store
+from app.history_archive import ArchiveReader, ArchiveWriter
+from app.session_index import SessionIndex
+
+INDEX_FILENAME = ".session_index.sqlite3"
+# 会话文件扩展名，按优先级排列：同一会话有多个文件时（如迁移中途中断）使用靠前的
+SESSION_SUFFIXES = (".jsonl.zst", ".jsonl.gz", ".jsonl", ".json")
+# 导出时每次从索引读取的会话数；导入时每批落盘（一次 sync）并写入索引（一个事务）的会话数
+ARCHIVE_PAGE_SIZE = 500
+IMPORT_BATCH_SIZE = 256
+
+
+class ChatSession:
+    """内存中的会话对象；dirty 表示有尚未写入磁盘的修改"""
+
+    def __init__(self, session_id: str, title: str, system_prompt: str, messages: List[Dict],
+                 summary: Optional[Dict] = None):
+        self.session_id = session_id
+        self.title = title
+        self.system_prompt = system_prompt
+        self.messages = messages
+        self.summary = summary
+        self.dirty = False
+
+    @classmethod
+    def from_dict(cls, session_id: str, data: Dict) -> "ChatSession":
+        return cls(
+            session_id,
+            data.get("title", session_store.DEFAULT_TITLE),
+            data.get("system_prompt", session_store.DEFAULT_SYSTEM_PROMPT),
+            list(data.get("messages", [])),
+            data.get("summary"),
+        )
+
+    def to_dict(self) -> Dict:
+        data = {
+            "title": self.title,
+            "system_prompt": self.system_prompt,
+            "messages": list(self.messages),
+        }
+        if self.summary:
+            data["summary"] = self.summary
+        return data
+
 
 class HistoryManager:
-    def __init__(self, history_dir: str = "chat_history"):
+    # 追加写模式下，文件中冗余的 header 记录超过该数量时整体重写（压缩）
+    COMPACT_EXTRA_RECORDS = 16
+
+    def __init__(self, history_dir: str = "chat_history", storage_format: str = "jsonl",
+                 cache_size: int = 32, compression_level: Optional[int] = None):
+        """
+        :param storage_format: "jsonl" 为追加写格式（默认），"jsonl.gz" / "jsonl.zst" 为按帧压缩的
+                               追加写格式（见 session_codec），"json" 为旧的整体重写格式；
+                               所有格式的已有会话都可以读取，新格式在会话整体重写时生效
+        :param cache_size: 内存中缓存的会话数量，超出后按 LRU 淘汰不活跃的会话
+        :param compression_level: 压缩级别，None 使用各格式的默认值
+        """
         self.history_dir = history_dir
+        if storage_format == "jsonl.zst" and not session_codec.zstd_available():
+            print("[HistoryManager] zstandard is not installed, falling back to jsonl.gz")
+            storage_format = "jsonl.gz"
+        self.storage_format = storage_format
         if not os.path.exists(self.history_dir):
             os.makedirs(self.history_dir)
+        self.compression_level = compression_level
+        # 写入新文件/整体重写时使用的编码器；追加时沿用文件原有的格式，见 _codec_for
+        self.codec = session_codec.make_codec(storage_format, history_dir, compression_level) \
+            if storage_format != "json" else None
+        self._codecs = {storage_format: self.codec}
+        # 会话元数据索引：列表/标题/预览都从索引读取，不解析会话文件
+        self.index = SessionIndex(os.path.join(self.history_dir, INDEX_FILENAME))
+        self._index_synced = False
+        self._sync_lock = threading.Lock()  # sync_index 可以在后台线程中执行
+        # session_id -> 已落盘的 JSONL 状态，用于判断能否只追加新消息
+        self._jsonl_state: Dict[str, Dict] = {}
+        # 会话对象的 LRU 缓存：GUI 读取会话只访问内存，磁盘只用于持久化（write-through）
+        self.cache_size = max(1, cache_size)
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        # 会话文件读写计数，用于发现多余的磁盘往返
+        self.io_stats = {"reads": 0, "writes": 0, "cache_hits": 0}
 
-    def _get_session_filepath(self, session_id: str) -> str:
+    @classmethod
+    def from_config(cls, cfg: Dict, **overrides) -> "HistoryManager":
+        """根据 user_config.json 中的 history_storage 配置创建，overrides 中的参数优先"""
+        options = cfg.get('history_storage') or {}
+        params = dict(
+            storage_format=options.get('format') or "jsonl",
+            compression_level=options.get('compression_level') or None,
+        )
+        params.update(overrides)
+        return cls(**params)
+
+    def _jsonl_path(self, session_id: str) -> str:
+        """按当前存储格式新建/重写时使用的 JSONL 路径"""
+        suffix = session_codec.FORMATS.get(self.storage_format, ".jsonl")
+        return os.path.join(self.history_dir, f"{session_id}{suffix}")
+
+    def _legacy_path(self, session_id: str) -> str:
         return os.path.join(self.history_dir, f"{session_id}.json")
 
-    def save_chat_session(self, session_id: str, messages: list, title: str = None, system_prompt: str = None) -> None:
+    def _session_files(self, session_id: str) -> List[str]:
+        """会话现有的全部文件，按 SESSION_SUFFIXES 的优先级排列"""
+        paths = (os.path.join(self.history_dir, f"{session_id}{suffix}") for suffix in SESSION_SUFFIXES)
+        return [p for p in paths if os.path.exists(p)]
+
+    def _get_session_filepath(self, session_id: str) -> str:
+        """返回会话当前所在的文件；不存在时返回按当前存储格式新建的路径"""
+        paths = self._session_files(session_id)
+        if paths:
+            return paths[0]
+        return self._legacy_path(session_id) if self.storage_format == "json" else self._jsonl_path(session_id)
+
+    def _remove_other_files(self, session_id: str, keep: str) -> None:
+        """整体重写后删除会话的其他格式文件（已迁移）"""
+        for path in self._session_files(session_id):
+            if path != keep:
+                os.remove(path)
+
+    def _codec_for(self, path: str):
+        """追加写时使用文件自身格式的编码器"""
+        storage_format = session_codec.format_of(path)
+        if storage_format not in self._codecs:
+            self._codecs[storage_format] = session_codec.make_codec(
+                storage_format, self.history_dir, self.compression_level)
+        return self._codecs[storage_format]
+
+    def save_chat_session(self, session_id: str, messages: list, title: str = None, system_prompt: str = None,
+                          summary: Optional[Dict] = None) -> None:
         """
         保存会话，包含标题和system prompt。
+        summary 为上下文管理生成的滚动摘要 {"content": str, "covers": int}，可选。
+        JSONL 格式下只追加上次保存之后新增的消息（以及变化了的 header）。
         """
-        filepath = self._get_session_filepath(session_id)
         # 兼容旧调用方式
         if isinstance(messages, dict):
             data = messages
@@ -27,44 +150,560 @@ class HistoryManager:
                 "system_prompt": system_prompt or "你是一个有帮助的AI助手。",
                 "messages": messages
             }
+            if summary:
+                data["summary"] = summary
+        if self._write_session(session_id, data):
+            self._cache_put(ChatSession.from_dict(session_id, data))
+
+    def _write_session(self, session_id: str, data: Dict) -> bool:
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
+            if self.storage_format != "json":
+                filepath = self._save_jsonl(session_id, data)
+            else:
+                filepath = self._legacy_path(session_id)
+                session_store.write_legacy_json(filepath, data)
+            self.io_stats["writes"] += 1
             print(f"[HistoryManager] Session '{session_id}' saved to {filepath}")
         except IOError as e:
             print(f"[HistoryManager] Error saving session '{session_id}': {e}")
+            return False
+        self._update_index(session_id, data)
+        return True
+
+    @staticmethod
+    def _message_key(messages: List[Dict]) -> Optional[str]:
+        return json.dumps(messages[-1], ensure_ascii=False, sort_keys=True) if messages else None
+
+    def _save_jsonl(self, session_id: str, data: Dict) -> str:
+        path = self._get_session_filepath(session_id)
+        if session_codec.format_of(path) is None:
+            path = self._jsonl_path(session_id)  # 旧 .json 会话，下面整体重写完成迁移
+        messages = data.get("messages", [])
+        header = session_store.header_of(data)
+        if session_id not in self._jsonl_state and os.path.exists(path):
+            self._read_session_file(session_id)  # 读取一次以建立追加状态
+        state = self._jsonl_state.get(session_id)
+
+        # 已落盘的消息必须是当前消息的前缀（按最后一条已保存消息校验）才能追加
+        can_append = (
+            state is not None
+            and os.path.exists(path)
+            and len(messages) >= state["count"]
+            and self._message_key(messages[:state["count"]]) == state["last"]
+            and not state["corrupt"]
+            and state["records"] - state["count"] - 1 < self.COMPACT_EXTRA_RECORDS
+            and (session_codec.format_of(path) != "jsonl.zst" or session_codec.zstd_available())
+        )
+        if can_append:
+            records = []
+            if header != state["header"]:
+                records.append(header)
+            records += [session_store.message_record(m) for m in messages[state["count"]:]]
+            if records:
+                session_store.append_jsonl(path, records, self._codec_for(path))
+            total_records = state["records"] + len(records)
+        else:
+            # 整体重写时使用当前配置的存储格式
+            path = self._jsonl_path(session_id)
+            total_records = session_store.write_jsonl(path, data, self.codec)
+            self._remove_other_files(session_id, keep=path)
+        self._jsonl_state[session_id] = {
+            "count": len(messages),
+            "last": self._message_key(messages),
+            "header": header,
+            "records": total_records,
+            "corrupt": False,
+        }
+        return path
+
+    def compact_chat_session(self, session_id: str) -> None:
+        """把会话整体重写为当前存储格式的紧凑 JSONL（同时完成从 .json 或其他格式的迁移）"""
+        data = self.load_chat_session(session_id)
+        if data is None:
+            return
+        self._rewrite_session(session_id, data)
+
+    def _rewrite_session(self, session_id: str, data: Dict) -> None:
+        path = self._jsonl_path(session_id)
+        session_store.write_jsonl(path, data, self.codec)
+        self.io_stats["writes"] += 1
+        self._remove_other_files(session_id, keep=path)
+        self._jsonl_state.pop(session_id, None)
+        self._update_index(session_id, data)
+
+    def compact_all(self, train_dictionary: bool = True,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        批量迁移/压缩：把全部会话整体重写为当前存储格式。
+        jsonl.zst 格式下先用小会话训练共享字典（样本不足时不使用字典）。
+        返回 {"sessions", "bytes_before", "bytes_after", "dictionary_id", "seconds"}。
+        :param progress: 每重写一个会话调用一次 progress(已完成数, 总数)
+        """
+        start = time.perf_counter()
+        self.flush()
+        files = self._scan_session_files()
+        bytes_before = sum(
+            os.path.getsize(path) for session_id in files for path in self._session_files(session_id))
+        dictionary_id = None
+        if train_dictionary and isinstance(self.codec, session_codec.ZstdCodec):
+            dictionary_id = self._train_dictionary(files)
+        for done, session_id in enumerate(files, 1):
+            session = self._sessions.get(session_id)
+            data = session.to_dict() if session else self._read_session_file(session_id, track_state=False)
+            if data is not None:
+                try:
+                    self._rewrite_session(session_id, data)
+                except OSError as e:
+                    print(f"[HistoryManager] Error compacting session '{session_id}': {e}")
+            if progress:
+                progress(done, len(files))
+        bytes_after = sum(os.path.getsize(path) for session_id in files for path in self._session_files(session_id))
+        return {
+            "sessions": len(files),
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "dictionary_id": dictionary_id,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _train_dictionary(self, files: Dict[str, os.stat_result], max_samples_bytes: int = 16 * 1024 * 1024):
+        """用小会话的 JSONL 内容训练共享字典，大会话不使用字典，也不作为样本"""
+        samples = []
+        total = 0
+        for session_id, st in sorted(files.items(), key=lambda item: -item[1].st_mtime):
+            if st.st_size > session_codec.DICT_MAX_INPUT:
+                continue  # 文件大小可能是压缩后的，下面再按内容大小过滤
+            data = self._read_session_file(session_id, track_state=False)
+            if data is None:
+                continue
+            payload = session_store.encode_records(
+                [session_store.header_of(data)] + [session_store.message_record(m) for m in data["messages"]]
+            ).encode('utf-8')
+            if len(payload) > session_codec.DICT_MAX_INPUT:
+                continue
+            samples.append(payload)
+            total += len(payload)
+            if total >= max_samples_bytes:
+                break
+        dictionary_id = session_codec.train_dictionary(self.history_dir, samples)
+        if dictionary_id is not None:
+            self.codec.reload_dictionary()
+            print(f"[HistoryManager] Trained zstd dictionary {dictionary_id} from {len(samples)} session(s).")
+        return dictionary_id
+
+    def export_archive(self, path: str, progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Dict:
+        """
+        把全部会话流式写入一个归档文件（格式见 history_archive），按修改时间倒序逐页读取索引、
+        逐个读取会话，内存占用与会话数量无关。
+        返回 {"sessions", "exported", "failed", "bytes", "seconds"}。
+        :param progress: 每处理一个会话调用一次 progress(已处理数, 总数)
+        """
+        start = time.perf_counter()
+        self.flush()
+        self._ensure_index()
+        total = self.index.count()
+        done = failed = 0
+        with ArchiveWriter(path, total) as writer:
+            after = None
+            while True:
+                page = self.index.list_sessions_page(after, ARCHIVE_PAGE_SIZE)
+                if not page:
+                    break
+                for meta in page:
+                    session_id = meta["id"]
+                    session = self._sessions.get(session_id)
+                    # 不放入缓存，避免冲掉活跃会话
+                    data = session.to_dict() if session else self._read_session_file(session_id, track_state=False)
+                    if data is None:
+                        failed += 1
+                    else:
+                        writer.write_session(session_id, meta["mtime"], data)
+                    done += 1
+                    if progress:
+                        progress(done, total)
+                after = (page[-1]["mtime"], page[-1]["id"])
+            exported = writer.sessions_written
+        print(f"[HistoryManager] Exported {exported} session(s) to {path}.")
+        return {
+            "sessions": done,
+            "exported": exported,
+            "failed": failed,
+            "bytes": os.path.getsize(path),
+            "seconds": time.perf_counter() - start,
+        }
+
+    def import_archive(self, path: str, overwrite: bool = False, batch_size: int = IMPORT_BATCH_SIZE,
+                       progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Dict:
+        """
+        从归档流式导入会话，按当前存储格式写入，并保留各会话原来的修改时间。
+
+        不经过 save_chat_session：每批会话先写入临时文件，整批落盘（一次 sync）后再改名，
+        元数据与全文索引在一个事务中批量写入；同时在内存中的只有一批会话。
+        返回 {"sessions", "imported", "skipped", "corrupt", "seconds"}。
+        :param overwrite: 覆盖同 ID 的已有会话，False 时跳过
+        :param progress: 每读取一个会话调用一次 progress(已处理数, 归档中的会话总数或 None)
+        """
+        start = time.perf_counter()
+        self.flush()
+        self._ensure_index()
+        done = imported = skipped = 0
+        batch: List[Tuple[str, str, Dict]] = []  # (session_id, 目标路径, 会话内容)
+        pending = set()  # 本批中的会话 ID，归档中重复的会话只导入第一个
+        with ArchiveReader(path) as reader:
+            total = reader.sessions
+            try:
+                for record in reader:
+                    done += 1
+                    session_id = record["id"]
+                    if session_id in pending or not overwrite and (
+                            self.index.get(session_id) is not None or self._session_files(session_id)):
+                        skipped += 1
+                    else:
+                        pending.add(session_id)
+                        batch.append((session_id, self._write_import_file(session_id, record), record))
+                        if len(batch) >= batch_size:
+                            imported += self._commit_import_batch(batch)
+                            batch, pending = [], set()
+                    if progress:
+                        progress(done, total)
+                if batch:
+                    imported += self._commit_import_batch(batch)
+            except BaseException:
+                # 尚未改名的临时文件不会被当作会话，删除即可；已提交的批次保留
+                for _, target, _ in batch:
+                    with contextlib.suppress(OSError):
+                        os.remove(f"{target}.tmp")
+                raise
+            corrupt = reader.corrupt
+        print(f"[HistoryManager] Imported {imported} session(s) from {path}, {skipped} skipped, {corrupt} corrupt.")
+        return {
+            "sessions": done,
+            "imported": imported,
+            "skipped": skipped,
+            "corrupt": corrupt,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _write_import_file(self, session_id: str, record: Dict) -> str:
+        """把导入的会话写入临时文件（不 fsync），修改时间设为归档中的值，返回目标路径"""
+        data = {
+            "title": record.get("title") or session_store.DEFAULT_TITLE,
+            "system_prompt": record.get("system_prompt") or session_store.DEFAULT_SYSTEM_PROMPT,
+            "messages": record["messages"],
+        }
+        if record.get("summary"):
+            data["summary"] = record["summary"]
+        if self.storage_format == "json":
+            path = self._legacy_path(session_id)
+            payload = json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
+        else:
+            path = self._jsonl_path(session_id)
+            payload = session_store.encode_session(data, self.codec)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(payload)
+        mtime = record.get("mtime")
+        if isinstance(mtime, (int, float)):
+            os.utime(f"{path}.tmp", (mtime, mtime))
+        record.update(data)
+        return path
+
+    def _commit_import_batch(self, batch: List[Tuple[str, str, Dict]]) -> int:
+        """一批临时文件落盘后改名为会话文件，再在一个事务中更新索引"""
+        session_store.sync_files([f"{path}.tmp" for _, path, _ in batch])
+        rows = []
+        for session_id, path, data in batch:
+            os.replace(f"{path}.tmp", path)
+            self._remove_other_files(session_id, keep=path)
+            self._jsonl_state.pop(session_id, None)
+            self._sessions.pop(session_id, None)
+            st = os.stat(path)
+            meta = self._build_meta(data)
+            rows.append((session_id, meta["title"], st.st_mtime, st.st_size, meta["message_count"], meta["preview"]))
+        session_store.fsync_dir(batch[0][1])
+        self.io_stats["writes"] += len(batch)
+        self.index.upsert_many(rows)
+        self.index.index_many((session_id, data["messages"]) for session_id, _, data in batch)
+        return len(batch)
+
+    def delete_chat_session(self, session_id: str) -> None:
+        """删除会话文件并从索引中移除，失败时抛出 OSError"""
+        paths = self._session_files(session_id)
+        if not paths:
+            raise FileNotFoundError(f"会话文件不存在: {session_id}")
+        for path in paths:
+            os.remove(path)
+        self._jsonl_state.pop(session_id, None)
+        self._sessions.pop(session_id, None)
+        self.index.remove(session_id)
+        print(f"[HistoryManager] Session '{session_id}' deleted.")
+
+    def _cache_put(self, session: ChatSession) -> None:
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.cache_size:
+            _, evicted = self._sessions.popitem(last=False)
+            if evicted.dirty:
+                self._write_session(evicted.session_id, evicted.to_dict())
+
+    def get_session(self, session_id: str) -> Optional[ChatSession]:
+        """返回内存中的会话对象，不在缓存中时从磁盘读取一次"""
+        if not session_id:
+            return None
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            self.io_stats["cache_hits"] += 1
+            return session
+        data = self._read_session_file(session_id)
+        if data is None:
+            return None
+        session = ChatSession.from_dict(session_id, data)
+        self._cache_put(session)
+        return session
+
+    def update_session(self, session_id: str, **fields) -> Optional[ChatSession]:
+        """
+        修改内存中的会话（title/system_prompt/messages/summary）并标记为 dirty，
+        在 flush() 或被 LRU 淘汰时写入磁盘（write-behind）。
+        """
+        session = self.get_session(session_id)
+        if session is None:
+            return None
+        for key, value in fields.items():
+            if key not in ("title", "system_prompt", "messages", "summary"):
+                raise ValueError(f"未知的会话字段: {key}")
+            setattr(session, key, value)
+        session.dirty = True
+        return session
+
+    def flush(self) -> None:
+        """把所有 dirty 的会话写入磁盘"""
+        for session in self._sessions.values():
+            if session.dirty and self._write_session(session.session_id, session.to_dict()):
+                session.dirty = False
+
+    def io_snapshot(self) -> Dict[str, int]:
+        return dict(self.io_stats)
 
     def load_chat_session(self, session_id: str):
         """
         加载会话，返回dict，兼容旧格式。
         旧格式会话加载时，尝试使用第一个用户消息作为标题。
+        优先从内存缓存读取，返回的是副本，修改后需调用 save_chat_session。
         """
+        session = self.get_session(session_id)
+        return session.to_dict() if session else None
+
+    def _read_session_file(self, session_id: str, track_state: bool = True) -> Optional[Dict]:
         filepath = self._get_session_filepath(session_id)
         if not os.path.exists(filepath):
             return None
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            # 兼容旧格式 (只有消息列表)
-            if isinstance(data, list):
-                # 尝试从旧格式消息列表中提取第一个用户消息作为标题
-                first_user_message = "(无内容)"
-                for msg in data:
-                    if msg.get("role") == "user" and msg.get("content"):
-                        first_user_message = msg["content"][:30] + ('...' if len(msg["content"]) > 30 else '')
-                        break
-
-                return {
-                    "title": first_user_message, # 使用第一个用户消息作为标题
-                    "system_prompt": "你是一个有帮助的AI助手。", # 默认 system prompt
-                    "messages": data
-                }
-            return data
+            self.io_stats["reads"] += 1
+            if session_codec.format_of(filepath):  # 压缩格式由 read_jsonl 按魔数识别
+                data = session_store.read_jsonl(filepath)
+                if data is None:
+                    return None
+                messages = data["messages"]
+                records, corrupt = data.pop("_records"), data.pop("_corrupt")
+                if track_state:
+                    self._jsonl_state[session_id] = {
+                        "count": len(messages),
+                        "last": self._message_key(messages),
+                        "header": session_store.header_of(data),
+                        "records": records,
+                        "corrupt": corrupt,  # 有损坏记录时下次保存整体重写
+                    }
+                return data
+            return session_store.read_legacy_json(filepath)
         except (IOError, json.JSONDecodeError) as e:
             print(f"[HistoryManager] Error loading session '{session_id}': {e}")
             return None
 
+    @staticmethod
+    def _build_meta(data) -> Dict:
+        """从会话内容提取索引所需的元数据"""
+        messages = data.get("messages", []) if isinstance(data, dict) else (data or [])
+        preview = "(无内容)"
+        for msg in messages:
+            if msg.get("role") == "user":
+                preview = (msg.get("content") or "")[:30]
+                break
+        title = data.get("title", "新对话") if isinstance(data, dict) else preview
+        return {"title": title, "message_count": len(messages), "preview": preview}
+
+    @staticmethod
+    def _messages_of(data) -> List[Dict]:
+        return data.get("messages", []) if isinstance(data, dict) else (data or [])
+
+    def _load_meta(self, session_id: str, use_cache: bool = True) -> Optional[Tuple[Dict, List[Dict]]]:
+        """同步索引用：会话的 (元数据, 消息列表)，由 SessionIndex.sync 分批写入索引"""
+        # 同步索引时不把会话放入缓存，避免冲掉活跃会话；文件在外部被修改时缓存已过期，不能使用
+        session = self._sessions.get(session_id) if use_cache else None
+        data = session.to_dict() if session else self._read_session_file(session_id, track_state=False)
+        if data is None:
+            return None
+        return self._build_meta(data), self._messages_of(data)
+
+    def _update_index(self, session_id: str, data) -> None:
+        try:
+            st = os.stat(self._get_session_filepath(session_id))
+        except OSError:
+            return
+        meta = self._build_meta(data)
+        self.index.upsert(session_id, meta["title"], st.st_mtime, st.st_size,
+                          meta["message_count"], meta["preview"])
+        self.index.index_messages(session_id, self._messages_of(data))
+
+    def _scan_session_files(self) -> Dict[str, os.stat_result]:
+        files = {}
+        ranks = {}
+        with os.scandir(self.history_dir) as it:
+            for entry in it:
+                for rank, suffix in enumerate(SESSION_SUFFIXES):
+                    if entry.name.endswith(suffix):
+                        session_id = entry.name[:-len(suffix)]
+                        # 同一会话有多个文件时按 SESSION_SUFFIXES 的优先级选择（如 .jsonl 优先于未迁移的 .json）
+                        if rank < ranks.get(session_id, len(SESSION_SUFFIXES)) and entry.is_file():
+                            files[session_id] = entry.stat()
+                            ranks[session_id] = rank
+                        break
+        return files
+
+    def sync_index(self) -> None:
+        """
+        用一次目录扫描校验索引：只重新解析新增或 mtime/大小变化的文件，
+        并移除已不存在的会话。可以在后台线程中调用（GUI 启动时即如此），
+        期间需要索引的调用会等待其完成。
+        """
+        with self._sync_lock:
+            self._sync_index()
+
+    def _sync_index(self) -> None:
+        try:
+            files = self._scan_session_files()
+        except OSError as e:
+            print(f"[HistoryManager] Error listing session files: {e}")
+            return
+        reparsed, _ = self.index.sync(files, self._load_meta)
+        self._index_synced = True
+        if reparsed:
+            print(f"[HistoryManager] Index synced, {len(reparsed)} session(s) re-read.")
+        # 升级前保存的会话还没有全文索引，补建一次
+        pending = self.index.unindexed_sessions()
+        if pending:
+            self.index.index_many(
+                (session_id, self._messages_of(data))
+                for session_id, data in ((i, self._read_session_file(i, track_state=False)) for i in pending)
+                if data is not None
+            )
+            print(f"[HistoryManager] Full-text index built for {len(pending)} session(s).")
+
+    def refresh(self, session_ids: Optional[Iterable[str]] = None) -> Tuple[List[Dict], List[str]]:
+        """
+        把外部对历史目录的修改（从其他机器同步来的文件、脚本写入的会话）应用到索引。
+        session_ids 为 None 时扫描整个目录（只 stat，未变化的文件不解析），否则只检查这些会话。
+        自己保存的会话在写入时已更新索引，不会被当作变化。
+        可以在后台线程中调用；返回 (新增或变化的会话元数据, 已删除的会话 ID)，
+        内存中对应的缓存需随后在 GUI 线程中调用 discard_cached 丢弃。
+        """
+        with self._sync_lock:
+            if session_ids is None:
+                try:
+                    files = self._scan_session_files()
+                except OSError as e:
+                    print(f"[HistoryManager] Error listing session files: {e}")
+                    return [], []
+            else:
+                session_ids = list(session_ids)
+                files = {}
+                for session_id in session_ids:
+                    paths = self._session_files(session_id)
+                    if paths:
+                        try:
+                            files[session_id] = os.stat(paths[0])
+                        except OSError:
+                            pass
+            changed, removed = self.index.sync(
+                files, lambda session_id: self._load_meta(session_id, use_cache=False), session_ids)
+        updated = [meta for meta in (self.index.get(session_id) for session_id in changed) if meta]
+        if updated or removed:
+            print(f"[HistoryManager] External changes: {len(updated)} updated, {len(removed)} removed.")
+        return updated, removed
+
+    def discard_cached(self, session_ids: Iterable[str]) -> None:
+        """
+        丢弃会话的内存缓存与追加状态（文件已在外部修改或删除），下次访问时重新读取。
+        有未保存修改的会话保留内存中的版本，之后写入时覆盖外部修改。
+        """
+        for session_id in session_ids:
+            self._jsonl_state.pop(session_id, None)
+            session = self._sessions.get(session_id)
+            if session is None:
+                continue
+            if session.dirty:
+                print(f"[HistoryManager] Session '{session_id}' changed on disk but has unsaved edits; keeping them.")
+            else:
+                del self._sessions[session_id]
+
+    def iter_session_files(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        逐个读取目录中的全部会话文件，返回 (session_id, 会话内容)；只读，
+        不经过内存缓存也不更新追加写状态，无法读取的会话会被跳过
+        """
+        for session_id in self._scan_session_files():
+            data = self._read_session_file(session_id, track_state=False)
+            if data is not None:
+                yield session_id, data
+
+    def recent_session_files(self, limit: int) -> List[str]:
+        """最近修改的 limit 个会话的文件路径"""
+        self._ensure_index()
+        return [self._get_session_filepath(meta["id"]) for meta in self.index.list_sessions(limit)]
+
+    def _ensure_index(self) -> None:
+        if not self._index_synced:
+            with self._sync_lock:
+                if not self._index_synced:  # 可能刚由后台同步完成
+                    self._sync_index()
+
+    def list_sessions(self) -> List[Dict]:
+        """
+        返回全部会话的元数据（id, title, mtime, size, message_count, preview），
+        按修改时间倒序。
+        """
+        self._ensure_index()
+        return self.index.list_sessions()
+
+    def search(self, query: str, limit: int = 50) -> List[Dict]:
+        """
+        全文搜索会话标题和消息内容，见 SessionIndex.search。
+        消息命中的 seq 是该消息在会话 messages 中的下标。
+        """
+        self._ensure_index()
+        return self.index.search(query, limit)
+
+    def list_sessions_page(self, after: Optional[Tuple[float, str]] = None, limit: int = 200) -> List[Dict]:
+        """按修改时间倒序分页列出会话元数据，见 SessionIndex.list_sessions_page"""
+        self._ensure_index()
+        return self.index.list_sessions_page(after, limit)
+
+    def get_session_meta(self, session_id: str, wait_for_sync: bool = True) -> Optional[Dict]:
+        """
+        :param wait_for_sync: 为 False 时不等待后台的目录同步完成，直接查询索引
+                              （本进程保存的会话在保存时已写入索引）
+        """
+        if wait_for_sync:
+            self._ensure_index()
+        return self.index.get(session_id)
+
     def get_session_title(self, session_id: str) -> str:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            return session.title
+        meta = self.get_session_meta(session_id)
+        if meta:
+            return meta["title"]
         data = self.load_chat_session(session_id)
         if data and isinstance(data, dict):
             return data.get("title", "新对话")
@@ -83,37 +722,15 @@ class HistoryManager:
         return data or []
 
     def get_session_preview(self, session_id: str) -> str:
-        data = self.load_chat_session(session_id)
-        if data and isinstance(data, dict):
-            msgs = data.get("messages", [])
-            for msg in msgs:
-                if msg["role"] == "user":
-                    return msg["content"][:30]
-            return "(无内容)"
-        elif isinstance(data, list):
-            for msg in data:
-                if msg["role"] == "user":
-                    return msg["content"][:30]
-            return "(无内容)"
-        return "(无内容)"
+        meta = self.get_session_meta(session_id)
+        return meta["preview"] if meta else "(无内容)"
 
     def get_all_session_ids(self) -> List[str]:
         """
-        Returns a list of all saved session IDs (filenames without .json).
+        Returns a list of all saved session IDs (filenames without .json/.jsonl).
         Sorted by modification time, newest first.
         """
-        try:
-            files = [
-                f for f in os.listdir(self.history_dir) 
-                if os.path.isfile(os.path.join(self.history_dir, f)) and f.endswith(".json")
-            ]
-            # Sort by modification time, newest first
-            files.sort(key=lambda f: os.path.getmtime(os.path.join(self.history_dir, f)), reverse=True)
-            session_ids = [os.path.splitext(f)[0] for f in files]
-            return session_ids
-        except OSError as e:
-            print(f"[HistoryManager] Error listing session files: {e}")
-            return []
+        return [meta["id"] for meta in self.list_sessions()]
 
     def generate_session_id(self) -> str:
         """Generates a new session ID based on the current timestamp."""
@@ -124,6 +741,7 @@ if __name__ == '__main__':
     manager = HistoryManager(history_dir="../chat_history_test") # Use a test directory
 
     # Clean up test directory if it exists from previous runs
+    manager.index.close()
     if os.path.exists(manager.history_dir):
         for f in os.listdir(manager.history_dir):
             os.remove(os.path.join(manager.history_dir, f))
@@ -155,6 +773,7 @@ if __name__ == '__main__':
     print(f"Preview for session '{session2_id}':", manager.get_session_preview(session2_id))
 
     # Clean up test directory
+    manager.index.close()
     if os.path.exists(manager.history_dir):
         for f in os.listdir(manager.history_dir):
             os.remove(os.path.join(manager.history_dir, f))
@@ -0,0 +1,132 @@
+# app/history_watcher.py
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set
+from PyQt6.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+from app.history_manager import HistoryManager, SESSION_SUFFIXES
+
+
+class HistoryWatcher(QObject):
+    """
+    监视历史目录，把外部修改（同步工具、脚本写入的会话）以增量方式应用到索引和侧边栏。
+
+    QFileSystemWatcher 监视目录本身（新建/删除/重命名，同步工具通常先写临时文件再重命名）
+    以及最近修改的若干个会话文件（原地追加写只会触发文件级事件；监视全部文件会耗尽 inotify 配额）。
+    事件先合并（debounce_ms 内没有新事件，或从第一个事件起已过 max_delay_ms），
+    再在后台线程中计算差异：只有文件事件时只 stat 这些会话，有目录事件时扫描一次目录
+    （只 stat，不解析未变化的文件），结果通过 changes_ready 投递到 GUI 线程。
+    自己保存的会话在写入时已经更新了索引，不会被当作变化。
+    """
+
+    changes_ready = pyqtSignal(list, list)  # 新增或变化的会话元数据, 已删除的会话 ID
+    _refreshed = pyqtSignal(list, list, object)  # 后台线程 -> GUI 线程：同上，以及需要监视的文件（出错时为 None）
+
+    def __init__(self, history_manager: HistoryManager, debounce_ms: int = 500, max_delay_ms: int = 3000,
+                 watch_recent_files: int = 50, parent=None):
+        """
+        :param watch_recent_files: 单独监视的最近会话文件数量
+        """
+        super().__init__(parent)
+        self.history_manager = history_manager
+        self.max_delay = max_delay_ms / 1000
+        self.watch_recent_files = watch_recent_files
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._start_refresh)
+        self._refreshed.connect(self._on_refreshed)
+        self._first_event: Optional[float] = None
+        self._dir_changed = False
+        self._changed_ids: Set[str] = set()
+        self._running = False
+        self.stats: Dict[str, int] = {"events": 0, "refreshes": 0, "full_scans": 0}
+
+    def start(self) -> bool:
+        """开始监视（应在初次同步索引之后调用），目录无法监视时返回 False"""
+        if not self._watcher.addPath(os.path.abspath(self.history_manager.history_dir)):
+            print(f"[HistoryWatcher] Cannot watch {self.history_manager.history_dir}; external changes will not be seen.")
+            return False
+        self._watch_files(self.history_manager.recent_session_files(self.watch_recent_files))
+        return True
+
+    def stop(self) -> None:
+        self._timer.stop()
+        paths = self._watcher.directories() + self._watcher.files()
+        if paths:
+            self._watcher.removePaths(paths)
+
+    def _watch_files(self, paths: List[str]) -> None:
+        wanted = {os.path.abspath(p) for p in paths if os.path.exists(p)}
+        watched = set(self._watcher.files())
+        if watched - wanted:
+            self._watcher.removePaths(list(watched - wanted))
+        if wanted - watched:
+            self._watcher.addPaths(list(wanted - watched))
+
+    @staticmethod
+    def _session_id_of(path: str) -> Optional[str]:
+        name = os.path.basename(path)
+        for suffix in SESSION_SUFFIXES:
+            if name.endswith(suffix):
+                return name[:-len(suffix)]
+        return None
+
+    def _on_directory_changed(self, path: str):
+        self._dir_changed = True
+        self._schedule()
+
+    def _on_file_changed(self, path: str):
+        session_id = self._session_id_of(path)
+        if session_id:
+            self._changed_ids.add(session_id)
+            self._schedule()
+
+    def _schedule(self):
+        self.stats["events"] += 1
+        now = time.monotonic()
+        if self._first_event is None:
+            self._first_event = now
+        # 持续不断的事件（如同步大量文件）最多推迟 max_delay
+        if now - self._first_event < self.max_delay or not self._timer.isActive():
+            self._timer.start()
+
+    def _start_refresh(self):
+        if self._running:
+            return  # 完成后会再检查是否有新的事件
+        full_scan, session_ids = self._dir_changed, list(self._changed_ids)
+        self._first_event = None
+        self._dir_changed = False
+        self._changed_ids.clear()
+        self._running = True
+        self.stats["refreshes"] += 1
+        if full_scan:
+            self.stats["full_scans"] += 1
+        threading.Thread(
+            target=self._refresh, args=(None if full_scan else session_ids,),
+            name="HistoryWatcher", daemon=True,
+        ).start()
+
+    def _refresh(self, session_ids: Optional[List[str]]):
+        try:
+            updated, removed = self.history_manager.refresh(session_ids)
+            paths = self.history_manager.recent_session_files(self.watch_recent_files)
+        except Exception as e:
+            print(f"[HistoryWatcher] Error applying external changes: {e}")
+            updated, removed, paths = [], [], None
+        self._refreshed.emit(updated, removed, paths)  # 跨线程发射，以队列方式投递到 GUI 线程
+
+    def _on_refreshed(self, updated: List[dict], removed: List[str], paths: Optional[List[str]]):
+        self._running = False
+        if paths is not None:
+            # 以原子重命名方式替换的文件会从监视列表中移除，这里重新加入
+            self._watch_files(paths)
+        if updated or removed:
+            self.history_manager.discard_cached([meta["id"] for meta in updated] + removed)
+            self.changes_ready.emit(updated, removed)
+        if self._dir_changed or self._changed_ids:
+            self._timer.start()
@@ -0,0 +1,237 @@
+# app/markdown_render.py
+
+import html
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})\s*([^\s`]*)[^`]*$")
+HEADING_RE = re.compile(r"^ {0,3}(#{1,6})\s+(.*?)(\s+#+)?\s*$")
+HR_RE = re.compile(r"^ {0,3}([-*_])(\s*\1){2,}\s*$")
+LIST_RE = re.compile(r"^(\s*)([-*+]|\d{1,9}[.)])\s+(.*)$")
+QUOTE_RE = re.compile(r"^ {0,3}>\s?(.*)$")
+TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+
+INLINE_CODE_RE = re.compile(r"(`+)(.+?)\1")
+LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)\s]+)(?:\s+&quot;.*?&quot;)?\)")
+BOLD_RE = re.compile(r"\*\*(?!\s)(.+?)(?<!\s)\*\*|__(?!\s)(.+?)(?<!\s)__")
+ITALIC_RE = re.compile(r"(?<![*\w])\*(?![\s*])(.+?)(?<![\s*])\*(?![*\w])")
+STRIKE_RE = re.compile(r"~~(?!\s)(.+?)(?<!\s)~~")
+
+# 聊天区中标题不宜过大：# -> h2, ## -> h3, 其余 -> h4
+HEADING_TAGS = {1: "h2", 2: "h3"}
+INLINE_CODE_STYLE = "background-color:#3c3c3c;"
+TABLE_ATTRS = 'border="1" cellspacing="0" cellpadding="4" style="border-color:#555555;"'
+
+
+class MarkdownBlock:
+    """一个完整的 Markdown 块：围栏代码块（kind="code"）或其余内容（kind="text"）"""
+
+    def __init__(self, kind: str, source: str, lang: str = "", code: str = ""):
+        self.kind = kind
+        self.source = source
+        self.lang = lang  # 代码块的语言标记
+        self.code = code  # 代码块去掉围栏后的内容
+
+    @classmethod
+    def code_block(cls, source: str) -> "MarkdownBlock":
+        lines = source.rstrip("\n").split("\n")
+        match = FENCE_RE.match(lines[0])
+        body = lines[1:]
+        if body and match and _closes_fence(body[-1], match.group(1)):
+            body = body[:-1]
+        return cls("code", source, match.group(2) if match else "", "\n".join(body))
+
+
+def _closes_fence(line: str, fence: str) -> bool:
+    stripped = line.strip()
+    return len(line) - len(line.lstrip(" ")) <= 3 and stripped.startswith(fence) \
+        and stripped == fence[0] * len(stripped)
+
+
+class MarkdownStream:
+    """
+    流式回复的增量 Markdown 分块器。
+
+    每次 feed 只扫描新到达的完整行：遇到空行、标题/分隔线，或围栏代码块开始/结束时，
+    之前的内容成为完整的块并交给调用方渲染（之后不再改变）；
+    最后一个尚未结束的块（tail）由调用方以纯文本显示，整条回复不会被反复重新解析。
+    """
+
+    def __init__(self):
+        self._pending = ""  # 尚未交出的文本，即 tail
+        self._scan = 0  # _pending 中下一行的起始位置
+        self._fence: Optional[str] = None  # 未闭合的围栏，如 "```"
+
+    @property
+    def tail(self) -> str:
+        return self._pending
+
+    @property
+    def in_code(self) -> bool:
+        """tail 是否为未闭合的代码块"""
+        return self._fence is not None
+
+    def feed(self, text: str) -> List[MarkdownBlock]:
+        """追加文本，返回因此完整的块"""
+        self._pending += text
+        blocks: List[MarkdownBlock] = []
+        while True:
+            end = self._pending.find("\n", self._scan)
+            if end < 0:
+                return blocks
+            start, self._scan = self._scan, end + 1
+            line = self._pending[start:end]
+            if self._fence is not None:
+                if _closes_fence(line, self._fence):
+                    blocks.append(MarkdownBlock.code_block(self._take(end + 1)))
+                    self._fence = None
+                continue
+            if not line.strip():
+                self._emit_text(blocks, start)
+                self._take(end + 1 - start)  # 丢弃空行
+                continue
+            fence = FENCE_RE.match(line)
+            if fence:
+                self._emit_text(blocks, start)
+                self._fence = fence.group(1)
+            elif HEADING_RE.match(line) or HR_RE.match(line):
+                self._emit_text(blocks, start)
+                blocks.append(MarkdownBlock("text", self._take(end + 1 - start)))
+
+    def finish(self) -> List[MarkdownBlock]:
+        """回复结束：剩余内容（包括未闭合的代码块）作为最后的块交出"""
+        blocks: List[MarkdownBlock] = []
+        if self._fence is not None:
+            blocks.append(MarkdownBlock.code_block(self._take(len(self._pending))))
+            self._fence = None
+        else:
+            self._emit_text(blocks, len(self._pending))
+        self._pending, self._scan = "", 0
+        return blocks
+
+    def _take(self, length: int) -> str:
+        taken, self._pending = self._pending[:length], self._pending[length:]
+        self._scan -= length
+        return taken
+
+    def _emit_text(self, blocks: List[MarkdownBlock], end: int):
+        if end > 0:
+            source = self._take(end)
+            if source.strip():
+                blocks.append(MarkdownBlock("text", source))
+
+
+def split_blocks(text: str) -> List[MarkdownBlock]:
+    """把完整的 Markdown 文本分成块"""
+    stream = MarkdownStream()
+    return stream.feed(text) + stream.finish()
+
+
+def render_inline(text: str) -> str:
+    """行内格式：代码、链接、粗体、斜体、删除线"""
+    parts = []
+    last = 0
+    for match in INLINE_CODE_RE.finditer(text):
+        parts.append(_render_emphasis(text[last:match.start()]))
+        parts.append(f'<code style="{INLINE_CODE_STYLE}">{html.escape(match.group(2).strip())}</code>')
+        last = match.end()
+    parts.append(_render_emphasis(text[last:]))
+    return "".join(parts)
+
+
+def _render_emphasis(text: str) -> str:
+    text = html.escape(text)
+    text = LINK_RE.sub(r'<a href="\2">\1</a>', text)
+    text = BOLD_RE.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = ITALIC_RE.sub(r"<i>\1</i>", text)
+    return STRIKE_RE.sub(r"<s>\1</s>", text)
+
+
+def _table_cells(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+@lru_cache(maxsize=4096)
+def render_text(source: str) -> str:
+    """
+    把一个非代码块渲染为 QTextDocument 支持的 HTML 子集：
+    标题、分隔线、引用、（嵌套）列表、表格与段落。按内容缓存，重新打开会话时直接复用。
+    """
+    lines = source.rstrip("\n").split("\n")
+    out: List[str] = []
+    paragraph: List[str] = []
+    lists: List[tuple] = []  # 打开的列表 [(标签, 缩进)]
+
+    def flush_paragraph():
+        if paragraph:
+            out.append("<p>" + "<br>".join(render_inline(line) for line in paragraph) + "</p>")
+            paragraph.clear()
+
+    def close_lists(indent: int = -1):
+        while lists and lists[-1][1] > indent:
+            out.append(f"</li></{lists.pop()[0]}>")
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        heading = HEADING_RE.match(line)
+        if heading:
+            flush_paragraph()
+            close_lists()
+            tag = HEADING_TAGS.get(len(heading.group(1)), "h4")
+            out.append(f"<{tag}>{render_inline(heading.group(2))}</{tag}>")
+            continue
+        if HR_RE.match(line):
+            flush_paragraph()
+            close_lists()
+            out.append("<hr>")
+            continue
+        if "|" in line and i < len(lines) and TABLE_SEP_RE.match(lines[i]):
+            flush_paragraph()
+            close_lists()
+            rows = [f"<tr>{''.join(f'<th>{render_inline(c)}</th>' for c in _table_cells(line))}</tr>"]
+            i += 1
+            while i < len(lines) and "|" in lines[i]:
+                rows.append(f"<tr>{''.join(f'<td>{render_inline(c)}</td>' for c in _table_cells(lines[i]))}</tr>")
+                i += 1
+            out.append(f"<table {TABLE_ATTRS}>{''.join(rows)}</table>")
+            continue
+        quote = QUOTE_RE.match(line)
+        if quote:
+            flush_paragraph()
+            close_lists()
+            quoted = [quote.group(1)]
+            while i < len(lines) and QUOTE_RE.match(lines[i]):
+                quoted.append(QUOTE_RE.match(lines[i]).group(1))
+                i += 1
+            out.append("<blockquote>" + "<br>".join(render_inline(q) for q in quoted) + "</blockquote>")
+            continue
+        item = LIST_RE.match(line)
+        if item:
+            flush_paragraph()
+            indent, marker = len(item.group(1).expandtabs(4)), item.group(2)
+            tag = "ul" if marker[0] in "-*+" else "ol"
+            close_lists(indent)
+            if lists and lists[-1][1] == indent and lists[-1][0] != tag:
+                out.append(f"</li></{lists.pop()[0]}>")
+            if lists and lists[-1][1] == indent:
+                out.append("</li><li>")
+            else:
+                out.append("<ul><li>" if tag == "ul" else f'<ol start="{int(marker[:-1])}"><li>')
+                lists.append((tag, indent))
+            out.append(render_inline(item.group(3)))
+            continue
+        if lists:
+            out.append("<br>" + render_inline(line.strip()))  # 列表项的续行
+            continue
+        paragraph.append(line)
+    flush_paragraph()
+    close_lists()
+    return "".join(out)
@@ -0,0 +1,300 @@
+# app/metrics.py
+
+import json
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Any
+
+from app.context_manager import estimate_text_tokens
+from app.usage_ledger import UsageLedger
+
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _field(value: Any, name: str) -> Any:
+    """usage 可能是 SDK 对象，也可能是普通 dict（例如从缓存恢复的响应）"""
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class RequestMetrics:
+    """
+    单次请求的耗时与用量
+
+    时间点由 QwenAPIClient 在请求的各个阶段打点（均为 perf_counter 秒数）：
+    queue_time   提交到第一次真正发出请求（限速、并发上限的等待）
+    connect_time 最后一次尝试发出请求到收到响应头
+    ttft         提交到收到首个内容 token
+    total        提交到请求结束
+    """
+
+    __slots__ = (
+        "tag", "session_id", "model", "stream", "timestamp", "cached", "retries", "error_type",
+        "queue_time", "connect_time", "ttft", "total",
+        "chunks", "gap_mean", "gap_p95", "gap_max",
+        "prompt_tokens", "cached_prompt_tokens", "completion_tokens", "usage_estimated",
+        "_start", "_attempt_start", "_last_token", "_gaps",
+    )
+
+    def __init__(self, model: str, stream: bool, tag: Optional[str] = None, session_id: Optional[str] = None):
+        self.tag = tag
+        self.session_id = session_id
+        self.model = model
+        self.stream = stream
+        self.timestamp = time.time()
+        self.cached = False
+        self.retries = 0
+        self.error_type: Optional[str] = None
+        self.queue_time: Optional[float] = None
+        self.connect_time: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.total: Optional[float] = None
+        self.chunks = 0
+        self.gap_mean: Optional[float] = None
+        self.gap_p95: Optional[float] = None
+        self.gap_max: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.cached_prompt_tokens: Optional[int] = None  # 命中服务端前缀缓存的 prompt tokens
+        self.completion_tokens: Optional[int] = None
+        self.usage_estimated = False
+        self._start = time.perf_counter()
+        self._attempt_start = self._start
+        self._last_token: Optional[float] = None
+        self._gaps: List[float] = []
+
+    def attempt_started(self) -> None:
+        now = time.perf_counter()
+        if self.queue_time is None:
+            self.queue_time = now - self._start
+        self._attempt_start = now
+
+    def connected(self) -> None:
+        self.connect_time = time.perf_counter() - self._attempt_start
+
+    def token(self) -> None:
+        now = time.perf_counter()
+        if self._last_token is None:
+            self.ttft = now - self._start
+        else:
+            self._gaps.append(now - self._last_token)
+        self._last_token = now
+        self.chunks += 1
+
+    def on_retry(self, attempt: int, error: Exception, delay: float) -> None:
+        self.retries = attempt
+        # 之前的尝试没有产生输出，首 token 时间从头计算
+        self._last_token = None
+
+    def set_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens = _field(usage, "prompt_tokens")
+        self.completion_tokens = _field(usage, "completion_tokens")
+        # OpenAI 兼容接口在 prompt_tokens_details.cached_tokens 中报告命中前缀缓存的部分，不支持时没有该字段
+        details = _field(usage, "prompt_tokens_details")
+        if details is not None:
+            self.cached_prompt_tokens = _field(details, "cached_tokens")
+
+    @property
+    def uncached_prompt_tokens(self) -> Optional[int]:
+        if self.prompt_tokens is None:
+            return None
+        return self.prompt_tokens - (self.cached_prompt_tokens or 0)
+
+    def finish(self, content: Optional[str] = None, error_type: Optional[str] = None) -> "RequestMetrics":
+        self.total = time.perf_counter() - self._start
+        self.error_type = error_type
+        if self._gaps:
+            ordered = sorted(self._gaps)
+            self.gap_mean = statistics.fmean(ordered)
+            self.gap_p95 = _percentile(ordered, 0.95)
+            self.gap_max = ordered[-1]
+        self._gaps = []
+        if self.completion_tokens is None and content:
+            # 服务端没有返回 usage 时按字符估算
+            self.completion_tokens = estimate_text_tokens(content)
+            self.usage_estimated = True
+        return self
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """生成速度：completion tokens / 首 token 之后的时长"""
+        if not self.completion_tokens or self.total is None:
+            return None
+        duration = self.total - (self.ttft or 0.0)
+        if duration <= 0:
+            return None
+        return self.completion_tokens / duration
+
+    def to_dict(self) -> Dict:
+        tps = self.tokens_per_second
+        return {
+            "timestamp": self.timestamp,
+            "tag": self.tag,
+            "session_id": self.session_id,
+            "model": self.model,
+            "stream": self.stream,
+            "cached": self.cached,
+            "retries": self.retries,
+            "error_type": self.error_type,
+            "queue_ms": _ms(self.queue_time),
+            "connect_ms": _ms(self.connect_time),
+            "ttft_ms": _ms(self.ttft),
+            "total_ms": _ms(self.total),
+            "chunks": self.chunks,
+            "gap_mean_ms": _ms(self.gap_mean),
+            "gap_p95_ms": _ms(self.gap_p95),
+            "gap_max_ms": _ms(self.gap_max),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "uncached_prompt_tokens": self.uncached_prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "usage_estimated": self.usage_estimated,
+            "tokens_per_second": round(tps, 1) if tps is not None else None,
+        }
+
+
+class MetricsRecorder:
+    """
+    保存最近若干次请求的指标（环形缓冲），可选地追加写入 JSONL 日志与持久化的用量账本（UsageLedger）
+
+    未启用时 QwenAPIClient 的 metrics 为 None，请求路径上只多一次 None 判断。
+    """
+
+    def __init__(self, capacity: int = 200, log_path: Optional[str] = None,
+                 ledger: Optional[UsageLedger] = None):
+        self._records: deque = deque(maxlen=max(1, capacity))
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        self.log_path = log_path
+        self._log_file = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            self._log_file = open(log_path, 'a', encoding='utf-8')
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> Optional["MetricsRecorder"]:
+        """根据 user_config.json 中的 metrics 配置创建，未启用时返回 None"""
+        options = cfg.get('metrics') or {}
+        if not options.get('enabled', True):
+            return None
+        return cls(capacity=int(options.get('capacity', 200)), log_path=options.get('log_path') or None,
+                   ledger=UsageLedger.from_config(cfg))
+
+    def record(self, metrics: RequestMetrics) -> None:
+        with self._lock:
+            self._records.append(metrics)
+            if self._log_file:
+                self._log_file.write(json.dumps(metrics.to_dict(), ensure_ascii=False) + "\n")
+                self._log_file.flush()
+        if self.ledger:
+            try:
+                self.ledger.record(metrics.to_dict())
+            except sqlite3.Error as e:  # 账本写入失败不影响请求本身
+                print(f"[MetricsRecorder] Failed to write usage ledger: {e}")
+
+    def recent(self, n: Optional[int] = None) -> List[Dict]:
+        """返回最近 n 条（默认全部）指标，按时间从旧到新"""
+        with self._lock:
+            records = list(self._records)
+        if n is not None:
+            records = records[-n:]
+        return [m.to_dict() for m in records]
+
+    def last(self) -> Optional[RequestMetrics]:
+        with self._lock:
+            return self._records[-1] if self._records else None
+
+    def find(self, tag: str, model: Optional[str] = None) -> Optional[RequestMetrics]:
+        """最近一条带有该标签（及模型）的指标"""
+        with self._lock:
+            for metrics in reversed(self._records):
+                if metrics.tag == tag and (model is None or metrics.model == model):
+                    return metrics
+        return None
+
+    def summary(self, window: int = 20) -> Dict:
+        """最近 window 次请求的滚动汇总（中位数）"""
+        with self._lock:
+            records = list(self._records)[-window:]
+        return self._summarize(records)
+
+    def by_model(self, window: Optional[int] = None) -> Dict[str, Dict]:
+        """按模型分别汇总最近 window 次（默认全部）请求，用于比较各模型的速度与用量"""
+        with self._lock:
+            records = list(self._records)
+        if window is not None:
+            records = records[-window:]
+        grouped: Dict[str, List[RequestMetrics]] = {}
+        for metrics in records:
+            grouped.setdefault(metrics.model, []).append(metrics)
+        return {model: self._summarize(items) for model, items in grouped.items()}
+
+    @staticmethod
+    def _summarize(records: List[RequestMetrics]) -> Dict:
+        ok = [m for m in records if m.error_type is None and not m.cached]
+        ttfts = sorted(m.ttft for m in ok if m.ttft is not None)
+        totals = sorted(m.total for m in ok if m.total is not None)
+        tps = sorted(t for t in (m.tokens_per_second for m in ok) if t is not None)
+        prompt_tokens = sum(m.prompt_tokens or 0 for m in records)
+        cached_prompt_tokens = sum(m.cached_prompt_tokens or 0 for m in records)
+        # 命中率只统计报告了 cached_tokens 的请求，服务端不支持时为 None 而不是 0
+        reported_prompt_tokens = sum(m.prompt_tokens or 0 for m in records if m.cached_prompt_tokens is not None)
+        return {
+            "requests": len(records),
+            "errors": sum(1 for m in records if m.error_type is not None),
+            "cached": sum(1 for m in records if m.cached),
+            "retries": sum(m.retries for m in records),
+            "ttft_p50_ms": _ms(statistics.median(ttfts)) if ttfts else None,
+            "total_p50_ms": _ms(statistics.median(totals)) if totals else None,
+            "tokens_per_second_p50": round(statistics.median(tps), 1) if tps else None,
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_prompt_tokens,
+            "prompt_cache_hit_rate": (round(cached_prompt_tokens / reported_prompt_tokens, 3)
+                                      if reported_prompt_tokens else None),
+            "completion_tokens": sum(m.completion_tokens or 0 for m in records),
+        }
+
+    def format_status(self) -> str:
+        """状态栏文本：最近一次请求 + 滚动中位数"""
+        last = self.last()
+        if last is None:
+            return ""
+        parts = []
+        if last.cached:
+            parts.append("缓存命中")
+        elif last.ttft is not None:
+            parts.append(f"首字 {last.ttft * 1000:.0f} ms")
+        tps = last.tokens_per_second
+        if tps is not None and not last.cached:
+            parts.append(f"{tps:.0f} tokens/s")
+        if last.cached_prompt_tokens and last.prompt_tokens and not last.cached:
+            parts.append(f"前缀缓存 {last.cached_prompt_tokens}/{last.prompt_tokens} tokens")
+        if last.retries:
+            parts.append(f"重试 {last.retries} 次")
+        summary = self.summary()
+        if summary["requests"] > 1 and summary["ttft_p50_ms"] is not None:
+            parts.append(f"近 {summary['requests']} 次首字中位 {summary['ttft_p50_ms']:.0f} ms")
+        return " · ".join(parts)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log_file:
+                self._log_file.close()
+                self._log_file = None
+        if self.ledger:
+            self.ledger.close()
+            self.ledger = None
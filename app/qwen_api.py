@@ -1,32 +1,40 @@
 # app/qwen_api.py
 
+import asyncio
 import os
 import json
+import time
 import traceback
-from openai import AsyncOpenAI
+from email.utils import parsedate_to_datetime
 from typing import List, Dict, Optional, Union, Callable, Any, Tuple
-from dotenv import load_dotenv
 import config
-from app.models.qwen_plus_latest import QwenAPIClient, QwenAPIException
-
-# 加载 .env 文件中的环境变量
-load_dotenv()
+from app.response_cache import ResponseCache
+from app.request_scheduler import RequestScheduler
+from app.metrics import MetricsRecorder, RequestMetrics
 
 
 class QwenAPIException(Exception):
     """自定义异常类，用于封装 Qwen API 调用过程中的异常"""
 
-    def __init__(self, error_type: str, message: str, details: Optional[Dict] = None):
+    def __init__(self, error_type: str, message: str, details: Optional[Dict] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None,
+                 status_code: Optional[int] = None):
         """
         初始化异常
 
         :param error_type: 错误类型，如 'api_error', 'connection_error', 'auth_error' 等
         :param message: 错误消息
         :param details: 错误详情，可包含原始异常信息、请求参数等
+        :param retryable: 是否可以重试（限流、超时、连接失败、5xx）
+        :param retry_after: 服务端通过 Retry-After 建议的等待秒数
+        :param status_code: HTTP 状态码（如有）
         """
         self.error_type = error_type
         self.message = message
         self.details = details or {}
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.status_code = status_code
         super().__init__(self.message)
 
     def __str__(self):
@@ -37,6 +45,8 @@ class QwenAPIException(Exception):
         return {
             "error_type": self.error_type,
             "message": self.message,
+            "status_code": self.status_code,
+            "retryable": self.retryable,
             "details": self.details,
         }
 
@@ -56,6 +66,9 @@ class QwenAPIClient:
         max_tokens: int = 2048,
         stream: bool = True,
         base_url: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        metrics: Optional[MetricsRecorder] = None,
     ):
         cfg = config.get_config()
         self.api_key = api_key or cfg.get('api_key')
@@ -69,13 +82,38 @@ class QwenAPIClient:
         self.max_tokens = max_tokens
         self.stream = stream
         self.base_url = base_url or cfg.get('api_base_url', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
-        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        # openai SDK 导入较慢，推迟到第一次请求时再导入并创建客户端
+        self._client = None
+        # 可选的回复缓存，只缓存确定性 (temperature == 0) 或显式选择缓存的请求
+        self.cache = cache
+        # 限速、并发上限与退避重试
+        self.scheduler = scheduler or RequestScheduler.from_config(cfg)
+        # 每次请求的耗时与用量指标，未启用时为 None
+        self.metrics = metrics if metrics is not None else MetricsRecorder.from_config(cfg)
+
+    @property
+    def client(self):
+        """AsyncOpenAI 客户端，第一次访问时创建（应在事件循环线程中访问）"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            # 重试交给 RequestScheduler 统一处理，关闭 SDK 自带的重试以免叠加
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    async def close(self) -> None:
+        """关闭连接池；客户端尚未创建时什么也不做"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
 
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
         callback: Optional[Callable[[str], None]] = None,
         extra_params: Optional[Dict[str, Any]] = None,
+        use_cache: Optional[bool] = None,
+        tag: Optional[str] = None,
+        session_id: Optional[str] = None,
     ) -> Union[Dict, str]:
         """
         发送聊天完成请求并返回结果 (OpenAI 兼容模式)
@@ -83,6 +121,9 @@ class QwenAPIClient:
         :param messages: 对话历史，格式为 [{"role": "user", "content": "..."}, ...]
         :param callback: 如果是流式输出，每收到一段内容会调用该函数
         :param extra_params: 其他传递给 OpenAI API 的可选参数
+        :param use_cache: True 强制使用缓存，False 跳过缓存，None 时仅缓存 temperature 为 0 的请求
+        :param tag: 记录在请求指标中的标签，如 "chat"、"summary"
+        :param session_id: 请求所属的会话，记录在请求指标（及用量账本）中
         :return: 响应内容（流式时为拼接的完整字符串，非流式时为模型回复的字符串或错误时的字典）
         """
         request_params = {
@@ -94,36 +135,90 @@ class QwenAPIClient:
             "stream": self.stream,
             **(extra_params or {}),
         }
+        if request_params["stream"] and callback:
+            # 流式响应的最后一个 chunk 带上 token 用量
+            request_params.setdefault("stream_options", {"include_usage": True})
+        metrics = RequestMetrics(request_params["model"], request_params["stream"], tag, session_id) \
+            if self.metrics else None
+
+        cache_key = None
+        if self.cache is not None and self._is_cacheable(request_params, use_cache):
+            cache_key = ResponseCache.make_key(request_params)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"[OpenAIClient] Cache hit ({len(cached)} chars), stats: {self.cache.stats}")
+                if request_params["stream"] and callback:
+                    await ResponseCache.replay(cached, callback)
+                if metrics:
+                    metrics.cached = True
+                    self.metrics.record(metrics.finish(cached))
+                return cached
 
         try:
-            if self.stream and callback:
-                full_response_content = ""
+            result = await self.scheduler.run(
+                (self.api_key, request_params["model"]),
+                lambda: self._request(request_params, callback, metrics),
+                on_retry=metrics.on_retry if metrics else None,
+            )
+        except BaseException as e:
+            # 包括取消 (CancelledError)
+            if metrics:
+                error_type = "cancelled" if isinstance(e, asyncio.CancelledError) else getattr(
+                    e, "error_type", e.__class__.__name__)
+                self.metrics.record(metrics.finish(error_type=error_type))
+            raise
+        if metrics:
+            self.metrics.record(metrics.finish(result if isinstance(result, str) else None))
+        if cache_key and isinstance(result, str) and result:
+            self.cache.put(cache_key, result)
+        return result
+
+    @staticmethod
+    def _is_cacheable(request_params: Dict, use_cache: Optional[bool]) -> bool:
+        if use_cache is not None:
+            return use_cache
+        return request_params.get("temperature") == 0
+
+    async def _request(
+        self,
+        request_params: Dict[str, Any],
+        callback: Optional[Callable[[str], None]],
+        metrics: Optional[RequestMetrics] = None,
+    ) -> Union[Dict, str]:
+        """实际发起 API 请求（不经过缓存），失败时抛出 QwenAPIException"""
+        full_response_content = ""
+        if metrics:
+            metrics.attempt_started()
+        try:
+            if request_params["stream"] and callback:
+                # 只发起一次请求，直接从响应中读取流；非 2xx 状态码由 SDK 抛出 APIStatusError，
+                # 与其他异常一样经 _classify_error 分类（429 带上 retry_after 交给调度器）
                 response_obj = await self.client.chat.completions.with_raw_response.create(
                     **request_params
                 )
-                # 检查响应状态码，但不使用 async with
-                if response_obj.status_code != 200:
-                    error_content = await response_obj.parse()
-                    print(
-                        f"[OpenAIClient ERROR] API Error Status {response_obj.status_code}: {error_content}"
-                    )
-                    raise QwenAPIException(
-                        error_type="api_error",
-                        message=f"API 调用错误: {error_content}",
-                        details={"original_error": str(error_content), "request_params": request_params}
-                    )
-
-                # 如果状态码是200，则继续处理流式响应
-                stream = await self.client.chat.completions.create(**request_params) # 重新创建流
-                async for chunk in stream:
-                    if chunk.choices:
-                        content = chunk.choices[0].delta.content
-                        if content:
-                            callback(content)
-                            full_response_content += content
+                if metrics:
+                    metrics.connected()
+
+                stream = response_obj.parse()
+                try:
+                    async for chunk in stream:
+                        if chunk.choices:
+                            content = chunk.choices[0].delta.content
+                            if content:
+                                if metrics:
+                                    metrics.token()
+                                callback(content)
+                                full_response_content += content
+                        if metrics and chunk.usage:
+                            metrics.set_usage(chunk.usage)
+                finally:
+                    await stream.close()
                 return full_response_content
             else:
                 completion = await self.client.chat.completions.create(**request_params)
+                if metrics:
+                    metrics.connected()
+                    metrics.set_usage(completion.usage)
                 if completion.choices:
                     return completion.choices[0].message.content or ""
                 return ""
@@ -131,41 +226,80 @@ class QwenAPIClient:
             # 直接重新抛出已经格式化的 QwenAPIException
             raise
         except Exception as e:
+            error_type, user_message, retryable = self._classify_error(e)
+            if full_response_content:
+                # 已经输出了部分内容，重试会让回复重复，交给调用方处理
+                retryable = False
+            response = getattr(e, "response", None)
+            status_code = getattr(e, "status_code", None)
             error_details = {
                 "original_error": str(e),
+                "exception_class": e.__class__.__name__,
                 "traceback": traceback.format_exc(),
                 "request_params": self._sanitize_params(request_params),
             }
-            
-            error_str = str(e).lower()
-            error_class = e.__class__.__name__
-            
-            # 根据错误信息或类名分类异常
-            if "api" in error_str or "api" in error_class:
-                error_type = "api_error"
-                user_message = f"API 调用错误: {e}"
-            elif "connect" in error_str or "network" in error_str or "timeout" in error_str:
-                error_type = "connection_error"
-                user_message = "连接服务器失败，请检查网络连接"
-            elif "rate" in error_str or "limit" in error_str or "quota" in error_str:
-                error_type = "rate_limit_error"
-                user_message = "API 调用频率超限，请稍后再试"
-            elif "auth" in error_str or "key" in error_str or "token" in error_str or "permission" in error_str:
-                error_type = "auth_error"
-                user_message = "API 密钥无效或已过期，请检查您的 API 密钥"
-            else:
-                error_type = "unknown_error"
-                user_message = f"未知错误: {e}"
-            
-            print(f"[OpenAIClient ERROR] {error_type}: {e}")
-            print(traceback.format_exc())
-            
+
+            print(f"[OpenAIClient ERROR] {error_type} ({e.__class__.__name__}, status={status_code}): {e}")
+            if not retryable:
+                print(traceback.format_exc())
+
             raise QwenAPIException(
                 error_type=error_type,
                 message=user_message,
                 details=error_details,
+                retryable=retryable,
+                retry_after=self._retry_after(response) if response is not None else None,
+                status_code=status_code,
             )
 
+    @staticmethod
+    def _classify_error(e: Exception) -> Tuple[str, str, bool]:
+        """
+        根据 openai SDK 的异常类型分类错误
+
+        :return: 元组 (错误类型, 用户友好的错误消息, 是否可重试)
+        """
+        import openai  # 延迟导入，见 client
+
+        if isinstance(e, openai.APITimeoutError):
+            return "timeout_error", "请求超时，请稍后再试", True
+        if isinstance(e, openai.APIConnectionError):
+            return "connection_error", "连接服务器失败，请检查网络连接", True
+        if isinstance(e, openai.RateLimitError):
+            return "rate_limit_error", "API 调用频率超限，请稍后再试", True
+        if isinstance(e, (openai.AuthenticationError, openai.PermissionDeniedError)):
+            return "auth_error", "API 密钥无效或已过期，请检查您的 API 密钥", False
+        if isinstance(e, openai.InternalServerError):
+            return "server_error", f"服务端错误 ({e.status_code})，请稍后再试", True
+        if isinstance(e, openai.APIStatusError):
+            # 408 请求超时、409 冲突按官方 SDK 的约定可以重试
+            return "api_error", f"API 调用错误: {e}", e.status_code in (408, 409)
+        if isinstance(e, openai.APIError):
+            return "api_error", f"API 调用错误: {e}", False
+        return "unknown_error", f"未知错误: {e}", False
+
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        """解析 Retry-After（秒数或 HTTP 日期）与 retry-after-ms 响应头"""
+        headers = response.headers
+        value = headers.get("retry-after-ms")
+        if value:
+            try:
+                return float(value) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
     def _sanitize_params(self, params: Dict) -> Dict:
         """
         清理请求参数，移除敏感信息
@@ -0,0 +1,97 @@
+# app/render_scheduler.py
+
+import math
+import time
+from collections import deque
+from PyQt6.QtCore import QObject, QTimer
+
+
+class StreamRenderScheduler(QObject):
+    """
+    按显示帧批量渲染流式 token
+
+    收到的 token 先进入缓冲区，每帧（约 16 ms）最多向 ChatArea 做一次插入。
+    默认模式下每帧把缓冲区全部写出；打字机动画模式下每帧写出若干字符，
+    但任何 token 在缓冲区中停留都不会超过 max_lag_ms，动画不会落后于网络。
+    """
+
+    FRAME_INTERVAL_MS = 16
+
+    def __init__(self, chat_area, typing_animation: bool = False, chars_per_frame: int = 2,
+                 max_lag_ms: int = 300, parent=None):
+        super().__init__(parent)
+        self.chat_area = chat_area
+        self.typing_animation = typing_animation
+        self.chars_per_frame = max(1, chars_per_frame)
+        self.max_lag = max_lag_ms / 1000
+        self._chunks = deque()  # [到达时间, 文本]
+        self._pending_len = 0
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.FRAME_INTERVAL_MS)
+        self._timer.timeout.connect(self._on_frame)
+
+    @property
+    def pending(self) -> int:
+        """尚未写入 ChatArea 的字符数"""
+        return self._pending_len
+
+    def push(self, text: str):
+        if not text:
+            return
+        self._chunks.append([time.monotonic(), text])
+        self._pending_len += len(text)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _take(self, count: int) -> str:
+        parts = []
+        while self._chunks and count > 0:
+            chunk = self._chunks[0]
+            text = chunk[1]
+            if len(text) <= count:
+                self._chunks.popleft()
+                parts.append(text)
+                count -= len(text)
+            else:
+                parts.append(text[:count])
+                chunk[1] = text[count:]
+                count = 0
+        result = "".join(parts)
+        self._pending_len -= len(result)
+        return result
+
+    def _typing_count(self) -> int:
+        # 已超过最大延迟的内容必须在本帧写出，其余按固定速度与积压量平滑输出
+        deadline = time.monotonic() - self.max_lag
+        overdue = 0
+        for arrived, text in self._chunks:
+            if arrived > deadline:
+                break
+            overdue += len(text)
+        frames_per_lag = max(1, int(self.max_lag * 1000 / self.FRAME_INTERVAL_MS))
+        return max(self.chars_per_frame, overdue, math.ceil(self._pending_len / frames_per_lag))
+
+    def _on_frame(self):
+        if not self._pending_len:
+            self._timer.stop()
+            return
+        count = self._typing_count() if self.typing_animation else self._pending_len
+        self._write(self._take(count))
+        if not self._pending_len:
+            self._timer.stop()
+
+    def _write(self, text: str):
+        if text and self.chat_area:
+            self.chat_area.stream_token(text)
+
+    def flush(self):
+        """立即写出全部缓冲内容（流结束或出错时调用）"""
+        self._timer.stop()
+        if self._pending_len:
+            self._write(self._take(self._pending_len))
+
+    def clear(self):
+        """丢弃缓冲内容"""
+        self._timer.stop()
+        self._chunks.clear()
+        self._pending_len = 0
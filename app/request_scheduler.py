@@ -0,0 +1,146 @@
+# app/request_scheduler.py
+
+import asyncio
+import random
+import time
+from typing import Dict, Optional, Callable, Awaitable, Any, Tuple
+
+
+class TokenBucket:
+    """令牌桶限速：rate 为每秒补充的令牌数，capacity 为允许的突发量"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回等待的秒数"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def drain(self) -> None:
+        """收到限流响应时清空令牌，让同一 key 的其他请求也放慢"""
+        self._refill()
+        self.tokens = 0
+
+
+class RequestScheduler:
+    """
+    API 请求调度：每个 (API Key, 模型) 一个令牌桶、全局并发上限、
+    可重试错误的指数退避（带抖动）并遵循 Retry-After。
+
+    是否可重试由异常的 retryable / retry_after 属性决定（见 QwenAPIException）。
+    服务端要求的 Retry-After 超过 max_delay 时不再重试，直接抛出该错误（提前重试只会再次被限流）。
+    requests_per_minute 不大于 0 时不限速（不使用令牌桶），并发上限与重试照常生效。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60,
+        burst: Optional[float] = None,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+    ):
+        self.rate = requests_per_minute / 60.0 if requests_per_minute > 0 else None
+        self.burst = burst if burst is not None else max(1.0, min(requests_per_minute, 10))
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"requests": 0, "attempts": 0, "retries": 0, "rate_limited": 0, "failures": 0, "throttle_wait": 0.0}
+
+    @classmethod
+    def from_config(cls, cfg: Dict, **overrides) -> "RequestScheduler":
+        """根据 rate_limits 配置创建调度器，overrides 中的参数优先"""
+        options = cfg.get('rate_limits') or {}
+        params = dict(
+            requests_per_minute=float(options.get('requests_per_minute', 60)),
+            max_concurrency=int(options.get('max_concurrency', 4)),
+            max_retries=int(options.get('max_retries', 3)),
+            base_delay=float(options.get('base_delay', 0.5)),
+            max_delay=float(options.get('max_delay', 20.0)),
+        )
+        params.update(overrides)
+        return cls(**params)
+
+    def _bucket(self, key: Tuple[str, str]) -> Optional[TokenBucket]:
+        if self.rate is None:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次重试前的等待时间；有 Retry-After 时以它为准（不截断，是否等待由 run 判断）"""
+        if retry_after is not None:
+            return max(retry_after, 0.0)
+        # full jitter: [0, base * 2^attempt]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(
+        self,
+        key: Tuple[str, str],
+        factory: Callable[[], Awaitable[Any]],
+        on_retry: Optional[Callable[[int, Exception, float], None]] = None,
+    ) -> Any:
+        """
+        在限速与并发上限下执行 factory()，可重试的错误按退避策略重试
+
+        :param key: 限速维度，通常为 (api_key, model)
+        :param factory: 每次尝试都会调用，返回新的协程
+        :param on_retry: 重试前回调 (第几次重试, 异常, 等待秒数)
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        bucket = self._bucket(key)
+        self.stats["requests"] += 1
+        attempt = 0
+        while True:
+            if bucket is not None:
+                self.stats["throttle_wait"] += await bucket.acquire()
+            self.stats["attempts"] += 1
+            try:
+                async with self._semaphore:
+                    return await factory()
+            except Exception as e:
+                retryable = getattr(e, "retryable", False)
+                if getattr(e, "error_type", None) == "rate_limit_error":
+                    self.stats["rate_limited"] += 1
+                    if bucket is not None:
+                        bucket.drain()
+                if not retryable or attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                delay = self.backoff_delay(attempt, getattr(e, "retry_after", None))
+                if delay > self.max_delay:
+                    self.stats["failures"] += 1
+                    print(f"[RequestScheduler] Retry-After {delay:.1f}s exceeds max_delay {self.max_delay:.1f}s, "
+                          f"giving up: {e}")
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                print(f"[RequestScheduler] Retry {attempt}/{self.max_retries} in {delay:.2f}s after: {e}")
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)
@@ -0,0 +1,148 @@
+# app/response_cache.py
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Callable
+
+# 参与缓存键计算的请求参数
+KEY_PARAMS = ("model", "temperature", "top_p", "max_tokens")
+
+
+class ResponseCache:
+    """
+    对话回复缓存：内存 LRU + 磁盘 SQLite 两级
+
+    缓存键是 (model, temperature, top_p, max_tokens, messages) 规范化 JSON 的 SHA-256。
+    磁盘层按 TTL 和总字节数淘汰（最久未访问的先删除）。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access);
+    """
+
+    def __init__(self, db_path: str, max_memory_entries: int = 128,
+                 max_disk_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max(1, max_memory_entries)
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (content, created)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "bytes_saved": 0}
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> Optional["ResponseCache"]:
+        """根据 user_config.json 中的 response_cache 配置创建缓存，未启用时返回 None"""
+        options = cfg.get('response_cache') or {}
+        if not options.get('enabled'):
+            return None
+        return cls(
+            options.get('path', os.path.join('.qwen_cache', 'responses.sqlite3')),
+            max_memory_entries=int(options.get('max_memory_entries', 128)),
+            max_disk_bytes=int(options.get('max_disk_mb', 64)) * 1024 * 1024,
+            ttl_seconds=float(options.get('ttl_hours', 168)) * 3600,
+        )
+
+    @staticmethod
+    def make_key(request_params: Dict) -> str:
+        canonical = {k: request_params.get(k) for k in KEY_PARAMS}
+        canonical["messages"] = [
+            {"role": m.get("role"), "content": m.get("content")} for m in request_params.get("messages", [])
+        ]
+        payload = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._record_hit("memory_hits", entry[0])
+                return entry[0]
+            if entry is not None:
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT content, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, row[0], row[1])
+            self._record_hit("disk_hits", row[0])
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._remember(key, content, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now),
+            )
+            self.stats["stores"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _remember(self, key: str, content: str, created: float) -> None:
+        self._memory[key] = (content, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _record_hit(self, tier: str, content: str) -> None:
+        self.stats["hits"] += 1
+        self.stats[tier] += 1
+        self.stats["bytes_saved"] += len(content.encode("utf-8"))
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if total - freed <= self.max_disk_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    async def replay(content: str, callback: Callable[[str], None], chunk_size: int = 16) -> None:
+        """把缓存的回复按流式的方式回放给 callback"""
+        for i in range(0, len(content), chunk_size):
+            callback(content[i:i + chunk_size])
+            await asyncio.sleep(0)
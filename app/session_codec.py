@@ -0,0 +1,215 @@
+# app/session_codec.py
+
+"""
+压缩的 JSONL 会话文件
+
+压缩格式的内容仍是 JSONL（见 session_store），只是按帧压缩后写入：整体重写时整个文件
+是一帧，追加时新增的记录单独压缩成一帧接在文件末尾。gzip（多成员）与 zstd（多帧）都
+允许这样拼接，读取时依次解压全部帧；崩溃导致的不完整末帧会被忽略并标记为损坏，
+下次保存时整体重写。
+
+    jsonl.gz   只依赖标准库
+    jsonl.zst  需要可选依赖 zstandard；可以使用在已有会话上训练的共享字典，
+               对只有几 KB 的小会话压缩率提升明显
+
+字典保存在历史目录中的 .zstd_dict_<id> 文件，帧头记录了字典 ID，读取时按 ID 加载，
+因此重新训练字典不影响已有文件；字典文件一旦写入就不再修改或删除。
+文件格式按开头的魔数识别，与扩展名无关。
+"""
+
+import gzip
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时只能使用 jsonl / jsonl.gz
+    zstandard = None
+
+# 存储格式 -> 文件扩展名
+FORMATS = {"jsonl": ".jsonl", "jsonl.gz": ".jsonl.gz", "jsonl.zst": ".jsonl.zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+DICT_PREFIX = ".zstd_dict_"
+# 超过该大小的内容不使用字典：大会话自身的重复已经足够，字典几乎没有收益
+DICT_MAX_INPUT = 128 * 1024
+
+
+def zstd_available() -> bool:
+    return zstandard is not None
+
+
+def format_of(path: str) -> Optional[str]:
+    """按扩展名返回存储格式，不是 JSONL 会话文件时返回 None"""
+    for storage_format, suffix in sorted(FORMATS.items(), key=lambda item: -len(item[1])):
+        if path.endswith(suffix):
+            return storage_format
+    return None
+
+
+class GzipCodec:
+    name = "jsonl.gz"
+
+    def __init__(self, level: Optional[int] = None):
+        self.level = level or 6
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+
+class ZstdCodec:
+    name = "jsonl.zst"
+
+    def __init__(self, dict_dir: str, level: Optional[int] = None, use_dictionary: bool = True):
+        """
+        :param dict_dir: 共享字典所在目录（即历史目录）
+        :param use_dictionary: 是否对小会话使用目录中最新训练的字典
+        """
+        if zstandard is None:
+            raise RuntimeError("jsonl.zst 格式需要安装 zstandard（pip install zstandard）")
+        self.dict_dir = dict_dir
+        self.level = level or 3
+        self.use_dictionary = use_dictionary
+        self._plain = zstandard.ZstdCompressor(level=self.level)
+        self._with_dict = None
+        self.dictionary_id = None
+        self.reload_dictionary()
+
+    def reload_dictionary(self) -> None:
+        """重新选用目录中最新的字典（训练新字典后调用）"""
+        self._with_dict = None
+        self.dictionary_id = None
+        if not self.use_dictionary:
+            return
+        dict_id = latest_dictionary_id(self.dict_dir)
+        if dict_id is not None:
+            self._with_dict = zstandard.ZstdCompressor(level=self.level, dict_data=load_dictionary(self.dict_dir, dict_id))
+            self.dictionary_id = dict_id
+
+    def compress(self, data: bytes) -> bytes:
+        if self._with_dict is not None and len(data) <= DICT_MAX_INPUT:
+            return self._with_dict.compress(data)
+        return self._plain.compress(data)
+
+
+def make_codec(storage_format: str, dict_dir: str, level: Optional[int] = None):
+    """返回存储格式对应的编码器；jsonl（不压缩）返回 None"""
+    if storage_format == "jsonl.gz":
+        return GzipCodec(level)
+    if storage_format == "jsonl.zst":
+        return ZstdCodec(dict_dir, level)
+    if storage_format == "jsonl":
+        return None
+    raise ValueError(f"未知的会话存储格式: {storage_format}")
+
+
+def decompress(raw: bytes, dict_dir: str) -> Tuple[bytes, bool]:
+    """
+    按魔数识别并解压文件内容，未压缩的内容原样返回。
+    返回 (内容, 是否有损坏/不完整的帧)；损坏帧之前的内容仍然可用。
+    """
+    if raw.startswith(GZIP_MAGIC):
+        return _gunzip_members(raw)
+    if raw.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise OSError("该会话以 zstd 压缩，需要安装 zstandard（pip install zstandard）才能读取")
+        return _unzstd_frames(raw, dict_dir)
+    return raw, False
+
+
+def _gunzip_members(raw: bytes) -> Tuple[bytes, bool]:
+    chunks = []
+    while raw:
+        decoder = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            chunk = decoder.decompress(raw)
+        except zlib.error:
+            return b"".join(chunks), True
+        if not decoder.eof:
+            return b"".join(chunks), True  # 末尾成员不完整（未经 CRC 校验），整帧丢弃
+        chunks.append(chunk)
+        raw = decoder.unused_data
+    return b"".join(chunks), False
+
+
+def _unzstd_frames(raw: bytes, dict_dir: str) -> Tuple[bytes, bool]:
+    chunks = []
+    decompressors: Dict[int, "zstandard.ZstdDecompressor"] = {}
+    while raw:
+        try:
+            dict_id = zstandard.get_frame_parameters(raw).dict_id
+            if dict_id not in decompressors:
+                dict_data = load_dictionary(dict_dir, dict_id) if dict_id else None
+                decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+            decoder = decompressors[dict_id].decompressobj()
+            chunk = decoder.decompress(raw)
+        except zstandard.ZstdError:
+            return b"".join(chunks), True
+        if not decoder.eof:
+            return b"".join(chunks), True
+        chunks.append(chunk)
+        raw = decoder.unused_data
+    return b"".join(chunks), False
+
+
+# 字典按路径缓存，同一进程中多个 HistoryManager 可以共用
+_dictionaries: Dict[str, "zstandard.ZstdCompressionDict"] = {}
+
+
+def dictionary_path(dict_dir: str, dict_id: int) -> str:
+    return os.path.join(dict_dir, f"{DICT_PREFIX}{dict_id}")
+
+
+def load_dictionary(dict_dir: str, dict_id: int) -> "zstandard.ZstdCompressionDict":
+    path = dictionary_path(dict_dir, dict_id)
+    dictionary = _dictionaries.get(path)
+    if dictionary is None:
+        try:
+            with open(path, 'rb') as f:
+                dictionary = zstandard.ZstdCompressionDict(f.read())
+        except FileNotFoundError:
+            raise OSError(f"缺少 zstd 字典文件 {path}") from None
+        _dictionaries[path] = dictionary
+    return dictionary
+
+
+def latest_dictionary_id(dict_dir: str) -> Optional[int]:
+    """返回目录中最近训练（修改时间最新）的字典 ID"""
+    try:
+        names = os.listdir(dict_dir)
+    except OSError:
+        return None
+    candidates = []
+    for name in names:
+        suffix = name[len(DICT_PREFIX):]
+        if name.startswith(DICT_PREFIX) and suffix.isdigit():
+            candidates.append((os.path.getmtime(os.path.join(dict_dir, name)), int(suffix)))
+    return max(candidates)[1] if candidates else None
+
+
+def train_dictionary(dict_dir: str, samples: List[bytes], dict_size: int = 64 * 1024) -> Optional[int]:
+    """
+    用会话内容训练共享字典并保存到 dict_dir，返回字典 ID；
+    样本太少或训练失败时返回 None（此时继续不用字典压缩）。
+    """
+    if zstandard is None or len(samples) < 8:
+        return None
+    try:
+        dictionary = zstandard.train_dictionary(dict_size, samples)
+    except zstandard.ZstdError as e:
+        print(f"[SessionCodec] Dictionary training failed: {e}")
+        return None
+    dict_id = dictionary.dict_id()
+    path = dictionary_path(dict_dir, dict_id)
+    if not os.path.exists(path):  # 已有文件的帧依赖它，不覆盖
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(dictionary.as_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    else:
+        os.utime(path)  # 作为最新字典
+    _dictionaries[path] = dictionary
+    return dict_id
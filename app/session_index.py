@@ -0,0 +1,394 @@
+# app/session_index.py
+
+import hashlib
+import json
+import operator
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Dict, Optional, Callable, Iterable, Iterator, Tuple
+
+# 字母数字串（含中日韩文字），其余字符视为分隔符
+_WORD_RE = re.compile(r"[^\W_]+")
+# 词中连续的 CJK 片段（第 1 组）或非 CJK 片段（第 2 组），与 _runs 的切分一致
+_RUN_RE = re.compile(r"((?:(?![\W_])[\u2e80-\U0010ffff])+)|((?:(?![\W_])[^\u2e80-\U0010ffff])+)")
+# 同一会话的消息在全文索引中的 rowid 为 (sid << SEQ_BITS) + 消息序号
+SEQ_BITS = 20
+# 搜索时参与相关度排序的最近命中条数
+RANK_WINDOW = 1000
+SNIPPET_RADIUS = 24
+# 同步目录时每个事务写入的会话数（元数据与全文索引）；分批是为了不把全部消息同时留在内存中
+SYNC_BATCH_SIZE = 256
+
+
+def _is_cjk(ch: str) -> bool:
+    return ord(ch) >= 0x2E80
+
+
+def _runs(word: str) -> Iterator[Tuple[str, bool]]:
+    """把一个词切成连续的 CJK / 非 CJK 片段"""
+    start = 0
+    for i in range(1, len(word) + 1):
+        if i == len(word) or _is_cjk(word[i]) != _is_cjk(word[start]):
+            yield word[start:i], _is_cjk(word[start])
+            start = i
+
+
+def segment_text(text: str) -> str:
+    """
+    为全文索引切词：中日韩文字切成重叠的二元组（每段末尾再加一个单字），
+    其余按词保留，交给 FTS5 的 unicode61 分词器。
+    例如 "命中缓存" -> "命中 中缓 缓存 存"
+    """
+    # 建索引（尤其是批量导入）时的热点：用一次正则扫描代替逐字判断
+    tokens = []
+    for cjk, other in _RUN_RE.findall(text):
+        if cjk:
+            tokens.extend(map(operator.add, cjk, cjk[1:]))
+            tokens.append(cjk[-1])
+        else:
+            tokens.append(other)
+    return " ".join(tokens)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """把用户输入转换为 FTS5 MATCH 表达式，各个词之间为 AND"""
+    phrases = []
+    for word in _WORD_RE.findall(query):
+        for run, cjk in _runs(word):
+            if cjk and len(run) == 1:
+                phrases.append(f"{run}*")  # 以该字开头的二元组，或段末的单字
+            elif cjk:
+                phrases.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+            else:
+                phrases.append(f'"{run}"*')
+    return " ".join(phrases) or None
+
+
+def message_text(message: Dict) -> str:
+    """消息的纯文本内容（多模态消息只取其中的文本部分）"""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _message_key(message: Dict) -> str:
+    payload = json.dumps([message.get("role"), message_text(message)], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def make_snippet(text: str, query: str) -> str:
+    """截取命中位置附近的一段文字"""
+    lowered = text.lower()
+    pos = -1
+    for word in _WORD_RE.findall(query.lower()):
+        pos = lowered.find(word)
+        if pos >= 0:
+            break
+    if pos < 0:
+        pos = 0
+    start = max(0, pos - SNIPPET_RADIUS)
+    end = min(len(text), pos + SNIPPET_RADIUS * 2)
+    snippet = " ".join(text[start:end].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class SessionIndex:
+    """
+    会话元数据索引（SQLite）
+
+    为每个会话保存 id、标题、文件 mtime/大小、消息条数和预览，
+    侧边栏列出会话时只需查询索引，不必解析每个会话文件。
+    通过比较文件的 mtime 和大小判断索引是否过期。
+
+    消息内容另有 FTS5 全文索引（message_fts），按会话增量更新：
+    已索引的消息仍是当前消息的前缀时只插入新增的消息，否则重建该会话的条目。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL,
+            message_count INTEGER NOT NULL,
+            preview TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_mtime ON sessions (mtime DESC);
+        CREATE TABLE IF NOT EXISTS fts_sessions (
+            sid INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL UNIQUE,
+            message_count INTEGER NOT NULL,
+            last_key TEXT
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+            body, content UNINDEXED, role UNINDEXED, tokenize = 'unicode61'
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+
+    def upsert(self, session_id: str, title: str, mtime: float, size: int,
+               message_count: int, preview: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, title, mtime, size, message_count, preview) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, title, mtime, size, message_count, preview),
+            )
+            self._conn.commit()
+
+    def upsert_many(self, rows: Iterable[Tuple[str, str, float, int, int, str]]) -> None:
+        """在一个事务中写入多个会话的元数据，rows 为 (id, title, mtime, size, message_count, preview)"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions (id, title, mtime, size, message_count, preview) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def remove(self, session_id: str) -> None:
+        with self._lock:
+            self._remove(session_id)
+            self._conn.commit()
+
+    def _remove(self, session_id: str) -> None:
+        self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        row = self._conn.execute("SELECT sid FROM fts_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row:
+            self._delete_fts_rows(row["sid"])
+            self._conn.execute("DELETE FROM fts_sessions WHERE sid = ?", (row["sid"],))
+
+    def _delete_fts_rows(self, sid: int) -> None:
+        # 按 rowid 范围删除，无需扫描整个全文索引
+        self._conn.execute(
+            "DELETE FROM message_fts WHERE rowid BETWEEN ? AND ?",
+            (sid << SEQ_BITS, ((sid + 1) << SEQ_BITS) - 1),
+        )
+
+    def index_messages(self, session_id: str, messages: List[Dict]) -> int:
+        """
+        增量更新会话的全文索引
+
+        :return: 本次写入索引的消息条数
+        """
+        return self.index_many([(session_id, messages)])
+
+    def index_many(self, sessions: Iterable[Tuple[str, List[Dict]]]) -> int:
+        """在一个事务中更新多个会话的全文索引（用于批量补建），返回写入的消息条数"""
+        written = 0
+        with self._lock:
+            for session_id, messages in sessions:
+                written += self._index_session(session_id, messages)
+            self._conn.commit()
+        return written
+
+    def _index_session(self, session_id: str, messages: List[Dict]) -> int:
+        row = self._conn.execute(
+            "SELECT sid, message_count, last_key FROM fts_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            sid = self._conn.execute(
+                "INSERT INTO fts_sessions (session_id, message_count) VALUES (?, 0)", (session_id,)
+            ).lastrowid
+            start = 0
+        else:
+            sid, start = row["sid"], row["message_count"]
+            is_prefix = start <= len(messages) and (
+                start == 0 or _message_key(messages[start - 1]) == row["last_key"]
+            )
+            if not is_prefix:
+                self._delete_fts_rows(sid)
+                start = 0
+        new_rows = []
+        for seq in range(start, min(len(messages), 1 << SEQ_BITS)):
+            text = message_text(messages[seq])
+            if text:
+                new_rows.append(((sid << SEQ_BITS) + seq, segment_text(text), text, messages[seq].get("role")))
+        if new_rows:
+            self._conn.executemany(
+                "INSERT INTO message_fts (rowid, body, content, role) VALUES (?, ?, ?, ?)", new_rows
+            )
+        self._conn.execute(
+            "UPDATE fts_sessions SET message_count = ?, last_key = ? WHERE sid = ?",
+            (len(messages), _message_key(messages[-1]) if messages else None, sid),
+        )
+        return len(new_rows)
+
+    def unindexed_sessions(self) -> List[str]:
+        """在会话索引中但还没有全文索引的会话（例如升级前保存的会话）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM sessions WHERE id NOT IN (SELECT session_id FROM fts_sessions)"
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def search(self, query: str, limit: int = 50) -> List[Dict]:
+        """
+        搜索会话标题和消息内容
+
+        :return: 标题命中（seq 为 None）在前，随后是最近 RANK_WINDOW 条消息命中中按 bm25 排序的前 limit 条，
+                 每项包含 session_id, title, seq, role, snippet
+        """
+        query = query.strip()
+        match = build_match_query(query)
+        if not match:
+            return []
+        like = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self._lock:
+            title_rows = self._conn.execute(
+                "SELECT id, title, preview FROM sessions WHERE title LIKE ? ESCAPE '\\' "
+                "ORDER BY mtime DESC LIMIT 10",
+                (like,),
+            ).fetchall()
+            # 只对最近的 RANK_WINDOW 条命中计算 bm25 排序（按 rowid 倒序可以提前结束），
+            # 再读取前 limit 条的内容和会话信息；常见词命中数万条时也能保持毫秒级
+            message_rows = self._conn.execute(
+                "SELECT f.rowid AS rowid, f.content AS content, f.role AS role, "
+                "       s.session_id AS session_id, t.title AS title "
+                "FROM (SELECT rowid, score FROM ("
+                "          SELECT rowid, bm25(message_fts) AS score FROM message_fts "
+                "          WHERE message_fts MATCH ? ORDER BY rowid DESC LIMIT ?"
+                "      ) ORDER BY score LIMIT ?) AS hit "
+                "JOIN message_fts f ON f.rowid = hit.rowid "
+                "JOIN fts_sessions s ON s.sid = (hit.rowid >> ?) "
+                "LEFT JOIN sessions t ON t.id = s.session_id "
+                "ORDER BY hit.score",
+                (match, RANK_WINDOW, limit, SEQ_BITS),
+            ).fetchall()
+        hits = [
+            {"session_id": row["id"], "title": row["title"], "seq": None, "role": None, "snippet": row["preview"]}
+            for row in title_rows
+        ]
+        hits += [
+            {
+                "session_id": row["session_id"],
+                "title": row["title"] or row["session_id"],
+                "seq": row["rowid"] & ((1 << SEQ_BITS) - 1),
+                "role": row["role"],
+                "snippet": make_snippet(row["content"], query),
+            }
+            for row in message_rows
+        ]
+        return hits
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_sessions(self, limit: Optional[int] = None) -> List[Dict]:
+        """按修改时间倒序返回全部（或最近 limit 个）会话元数据"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM sessions ORDER BY mtime DESC, id DESC LIMIT ?", (-1 if limit is None else limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_sessions_page(self, after: Optional[Tuple[float, str]], limit: int) -> List[Dict]:
+        """
+        按页列出会话（与 list_sessions 相同：修改时间倒序，相同时按 id 倒序），
+        after 为上一页最后一个会话的 (mtime, id)；
+        使用键集分页，翻到第几页都只扫描 idx_sessions_mtime 上的一段
+        """
+        with self._lock:
+            if after is None:
+                rows = self._conn.execute(
+                    "SELECT * FROM sessions ORDER BY mtime DESC, id DESC LIMIT ?", (limit,)
+                ).fetchall()
+            else:
+                mtime, session_id = after
+                rows = self._conn.execute(
+                    "SELECT * FROM sessions WHERE mtime <= ? AND NOT (mtime = ? AND id >= ?) "
+                    "ORDER BY mtime DESC, id DESC LIMIT ?",
+                    (mtime, mtime, session_id, limit),
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def sync(self, files: Dict[str, os.stat_result],
+             load_meta: Callable[[str], Optional[Tuple[Dict, Optional[List[Dict]]]]],
+             session_ids: Optional[Iterable[str]] = None) -> Tuple[List[str], List[str]]:
+        """
+        使索引与目录内容一致；新增或变化的会话每 SYNC_BATCH_SIZE 个在一个事务中写入元数据和全文索引
+
+        :param files: {session_id: stat_result}，来自一次 os.scandir
+        :param load_meta: 为新增/已变化的会话解析 (元数据, 消息列表) 的回调，返回 None 表示文件无法读取，
+                          消息列表为 None 时不更新该会话的全文索引
+        :param session_ids: 只校验这些会话（files 中也只包含它们现有的文件），None 表示整个目录
+        :return: (重新解析的会话 ID, 已移除的会话 ID)
+        """
+        with self._lock:
+            if session_ids is None:
+                rows = self._conn.execute("SELECT id, mtime, size FROM sessions").fetchall()
+            else:
+                rows = [
+                    row for session_id in session_ids
+                    for row in self._conn.execute("SELECT id, mtime, size FROM sessions WHERE id = ?", (session_id,))
+                ]
+            indexed = {row["id"]: (row["mtime"], row["size"]) for row in rows}
+        stale = [
+            session_id for session_id, st in files.items()
+            if indexed.get(session_id) != (st.st_mtime, st.st_size)
+        ]
+        removed = [session_id for session_id in indexed if session_id not in files]
+
+        written: List[str] = []
+        batch = []
+        for session_id in stale:
+            loaded = load_meta(session_id)
+            if loaded is None:
+                continue
+            batch.append((session_id, files[session_id], *loaded))
+            if len(batch) >= SYNC_BATCH_SIZE:
+                written += self._write_synced(batch)
+                batch = []
+        written += self._write_synced(batch)
+        if removed:
+            with self._lock:
+                for session_id in removed:
+                    self._remove(session_id)  # 连同全文索引一起删除
+                self._conn.commit()
+        return written, removed
+
+    def _write_synced(self, batch: List[Tuple[str, os.stat_result, Dict, Optional[List[Dict]]]]) -> List[str]:
+        """
+        在一个事务中写入一批同步读到的会话，返回实际写入的会话 ID。
+        读取文件之后该会话可能已由保存操作写入了更新的版本（mtime 更大），此时跳过这份过期的内容
+        """
+        if not batch:
+            return []
+        written = []
+        with self._lock:
+            for session_id, st, meta, messages in batch:
+                row = self._conn.execute("SELECT mtime FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                if row is not None and row["mtime"] > st.st_mtime:
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (id, title, mtime, size, message_count, preview) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, meta["title"], st.st_mtime, st.st_size, meta["message_count"], meta["preview"]),
+                )
+                if messages is not None:
+                    self._index_session(session_id, messages)
+                written.append(session_id)
+            self._conn.commit()
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,177 @@
+# app/session_store.py
+
+"""
+会话文件的读写格式
+
+JSONL（追加写）格式：每行一条记录
+    {"type": "header", "title": ..., "system_prompt": ..., "summary": ...}
+    {"type": "message", "message": {"role": ..., "content": ...}}
+header 可以出现多次，读取时以最后一条为准；新消息只需在文件末尾追加。
+旧的 .json 格式（整个会话一个 JSON 对象，或早期的纯消息列表）仍可读取。
+同样的记录也可以按帧压缩保存为 .jsonl.gz / .jsonl.zst，见 session_codec；
+读取时按文件开头的魔数自动识别。
+"""
+
+import json
+import os
+from typing import List, Dict, Optional
+from app import session_codec
+
+DEFAULT_TITLE = "新对话"
+DEFAULT_SYSTEM_PROMPT = "你是一个有帮助的AI助手。"
+HEADER_KEYS = ("title", "system_prompt", "summary")
+
+
+def fsync_dir(path: str) -> None:
+    # 确保 rename 本身落盘；部分平台（Windows）不支持对目录 fsync
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def sync_files(paths: List[str]) -> None:
+    """
+    让一批已写入但未 fsync 的文件落盘（批量导入）：支持时用一次 os.sync() 代替逐个 fsync，
+    否则（Windows）逐个 fsync
+    """
+    if hasattr(os, "sync"):
+        os.sync()
+        return
+    for path in paths:
+        with open(path, 'ab') as f:
+            os.fsync(f.fileno())
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """先写临时文件并 fsync，再用 os.replace 原子替换目标文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    atomic_write_bytes(path, text.encode('utf-8'))
+
+
+def header_of(data: Dict) -> Dict:
+    header = {"type": "header"}
+    for key in HEADER_KEYS:
+        if data.get(key) is not None:
+            header[key] = data[key]
+    return header
+
+
+def encode_records(records: List[Dict]) -> str:
+    return "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+
+
+def message_record(message: Dict) -> Dict:
+    return {"type": "message", "message": message}
+
+
+def write_jsonl(path: str, data: Dict, codec=None) -> int:
+    """
+    整体重写（压缩）JSONL 会话文件，返回写入的记录数
+    :param codec: session_codec 中的编码器，None 表示不压缩
+    """
+    payload = encode_session(data, codec)
+    atomic_write_bytes(path, payload)
+    return len(data.get("messages", [])) + 1
+
+
+def encode_session(data: Dict, codec=None) -> bytes:
+    """整个会话的 JSONL 文件内容（header + 全部消息），按 codec 压缩"""
+    records = [header_of(data)] + [message_record(m) for m in data.get("messages", [])]
+    payload = encode_records(records).encode('utf-8')
+    return codec.compress(payload) if codec else payload
+
+
+def append_jsonl(path: str, records: List[Dict], codec=None) -> None:
+    """在文件末尾追加记录并 fsync；压缩格式下追加的记录是单独的一帧"""
+    payload = encode_records(records).encode('utf-8')
+    with open(path, 'ab') as f:
+        f.write(codec.compress(payload) if codec else payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_jsonl(path: str) -> Optional[Dict]:
+    """
+    读取 JSONL 会话文件（未压缩或按帧压缩的），返回与旧格式相同结构的 dict，
+    另带 "_records" 表示文件中的记录数（用于判断何时压缩），
+    "_corrupt" 表示读到了无法解析的行或不完整的压缩帧（如崩溃导致的不完整末尾，会被忽略）。
+    """
+    header = {}
+    messages = []
+    records = 0
+    with open(path, 'rb') as f:
+        raw = f.read()
+    raw, corrupt = session_codec.decompress(raw, os.path.dirname(path))
+    if corrupt:
+        print(f"[SessionStore] Skipping truncated frame in {path}")
+    for line in raw.decode('utf-8', errors='replace').split("\n"):  # 不用 splitlines，内容中可能有 U+2028 等字符
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            print(f"[SessionStore] Skipping corrupt record in {path}")
+            corrupt = True
+            continue
+        # 合法的 JSON 但不是对象，或消息记录中没有消息对象，同样按损坏的行跳过
+        if not isinstance(record, dict) or (
+                record.get("type") == "message" and not isinstance(record.get("message"), dict)):
+            print(f"[SessionStore] Skipping corrupt record in {path}")
+            corrupt = True
+            continue
+        records += 1
+        if record.get("type") == "header":
+            header = record
+        elif record.get("type") == "message":
+            messages.append(record["message"])
+    if not records:
+        return None
+    data = {
+        "title": header.get("title", DEFAULT_TITLE),
+        "system_prompt": header.get("system_prompt", DEFAULT_SYSTEM_PROMPT),
+        "messages": messages,
+    }
+    if header.get("summary"):
+        data["summary"] = header["summary"]
+    data["_records"] = records
+    data["_corrupt"] = corrupt
+    return data
+
+
+def read_legacy_json(path: str) -> Dict:
+    """读取旧的 .json 会话；纯消息列表格式使用第一个用户消息作为标题"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        first_user_message = "(无内容)"
+        for msg in data:
+            if msg.get("role") == "user" and msg.get("content"):
+                first_user_message = msg["content"][:30] + ('...' if len(msg["content"]) > 30 else '')
+                break
+        return {
+            "title": first_user_message,
+            "system_prompt": DEFAULT_SYSTEM_PROMPT,
+            "messages": data,
+        }
+    return data
+
+
+def write_legacy_json(path: str, data: Dict) -> None:
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=4))
@@ -0,0 +1,347 @@
+# app/usage_ledger.py
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 延迟直方图的桶宽：对数刻度，相邻桶相差 5%，由直方图得到的分位数误差不超过约 2.5%
+LATENCY_STEP = math.log(1.05)
+LATENCY_METRICS = ("ttft", "total")
+
+
+def latency_bucket(ms: float) -> int:
+    return int(math.log(max(ms, 1.0)) / LATENCY_STEP)
+
+
+def bucket_value(bucket: int) -> float:
+    """桶的代表值（几何中点，毫秒）"""
+    return math.exp((bucket + 0.5) * LATENCY_STEP)
+
+
+def day_of(timestamp: float) -> int:
+    """本地日期，如 20261017"""
+    t = time.localtime(timestamp)
+    return t.tm_year * 10000 + t.tm_mon * 100 + t.tm_mday
+
+
+def days_ago(days: int) -> int:
+    """days 天前的本地日期（0 表示今天）"""
+    return day_of(time.time() - days * 86400)
+
+
+def percentiles_from_histogram(buckets: Sequence[Tuple[int, int]],
+                               quantiles: Sequence[float]) -> Dict[float, Optional[float]]:
+    """
+    :param buckets: 按桶号升序的 (桶号, 次数)
+    :return: {分位: 毫秒}，没有数据时为 None
+    """
+    total = sum(count for _, count in buckets)
+    result: Dict[float, Optional[float]] = {}
+    for q in quantiles:
+        if not total:
+            result[q] = None
+            continue
+        rank = max(1, math.ceil(q * total))
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= rank:
+                result[q] = round(bucket_value(bucket), 1)
+                break
+    return result
+
+
+class UsageLedger:
+    """
+    持久化的 token 用量与延迟账本（SQLite）
+
+    每次请求追加一条记录（requests 表，按时间和会话建索引，用于查看明细），
+    同一事务中累加到汇总表：按 (日期, 模型) 的次数与 token 数（daily）、按会话的累计（session_totals），
+    以及按 (日期, 模型) 和按 (月份, 模型) 的首字/总耗时对数直方图（latency / latency_monthly）。
+    按天、按模型的用量与 p50/p95 延迟只读取汇总表：跨月的范围中完整的月份读月直方图，
+    只有首尾两个月按天读取，查询的行数与记录条数无关，记录有几百万条时仍是毫秒级。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            day INTEGER NOT NULL,
+            session_id TEXT,
+            model TEXT NOT NULL,
+            tag TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            cached_tokens INTEGER,
+            ttft_ms REAL,
+            total_ms REAL,
+            error_type TEXT,
+            response_cached INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_requests_ts ON requests (ts);
+        CREATE INDEX IF NOT EXISTS idx_requests_session ON requests (session_id, ts);
+        CREATE TABLE IF NOT EXISTS daily (
+            day INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            response_cached INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            cached_tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, model)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS session_totals (
+            session_id TEXT PRIMARY KEY,
+            requests INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            cached_tokens INTEGER NOT NULL DEFAULT 0,
+            last_ts REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_session_totals_tokens
+            ON session_totals ((prompt_tokens + completion_tokens) DESC);
+        CREATE TABLE IF NOT EXISTS latency (
+            day INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, model, metric, bucket)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS latency_monthly (
+            month INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (month, model, metric, bucket)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # 记录在请求结束时写入（事件循环线程），WAL + NORMAL 避免每次提交都 fsync
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> Optional["UsageLedger"]:
+        """根据 user_config.json 中的 usage_ledger 配置创建，未启用时返回 None"""
+        options = cfg.get('usage_ledger') or {}
+        if not options.get('enabled', True):
+            return None
+        path = options.get('path') or os.path.join('.qwen_cache', 'usage_ledger.sqlite3')
+        try:
+            return cls(path)
+        except sqlite3.Error as e:
+            print(f"[UsageLedger] Cannot open {path}: {e}")
+            return None
+
+    def record(self, entry: Dict) -> None:
+        """追加一条请求记录，entry 的字段与 RequestMetrics.to_dict() 相同"""
+        self.record_many([entry])
+
+    def record_many(self, entries: Iterable[Dict]) -> int:
+        """在一个事务中追加多条记录，返回写入的条数"""
+        requests, daily, sessions, latency = [], [], [], []
+        for e in entries:
+            ts = e.get("timestamp") or time.time()
+            day = day_of(ts)
+            model = e.get("model") or ""
+            prompt = e.get("prompt_tokens") or 0
+            completion = e.get("completion_tokens") or 0
+            cached_tokens = e.get("cached_prompt_tokens") or 0
+            error = e.get("error_type")
+            response_cached = bool(e.get("cached"))
+            requests.append((ts, day, e.get("session_id"), model, e.get("tag"), e.get("prompt_tokens"),
+                             e.get("completion_tokens"), e.get("cached_prompt_tokens"),
+                             e.get("ttft_ms"), e.get("total_ms"), error, int(response_cached)))
+            daily.append((day, model, int(error is not None), int(response_cached), prompt, completion, cached_tokens))
+            if e.get("session_id"):
+                sessions.append((e["session_id"], prompt, completion, cached_tokens, ts))
+            if error is None and not response_cached:
+                # 与 MetricsRecorder 的汇总一致：失败和命中回复缓存的请求不计入延迟
+                for metric in LATENCY_METRICS:
+                    value = e.get(f"{metric}_ms")
+                    if value is not None:
+                        latency.append((day, model, metric, latency_bucket(value)))
+        if not requests:
+            return 0
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO requests (ts, day, session_id, model, tag, prompt_tokens, completion_tokens, "
+                "cached_tokens, ttft_ms, total_ms, error_type, response_cached) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                requests,
+            )
+            self._conn.executemany(
+                "INSERT INTO daily (day, model, requests, errors, response_cached, prompt_tokens, "
+                "completion_tokens, cached_tokens) VALUES (?, ?, 1, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (day, model) DO UPDATE SET requests = requests + 1, "
+                "errors = errors + excluded.errors, response_cached = response_cached + excluded.response_cached, "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "cached_tokens = cached_tokens + excluded.cached_tokens",
+                daily,
+            )
+            self._conn.executemany(
+                "INSERT INTO session_totals (session_id, requests, prompt_tokens, completion_tokens, "
+                "cached_tokens, last_ts) VALUES (?, 1, ?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET requests = requests + 1, "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "cached_tokens = cached_tokens + excluded.cached_tokens, "
+                "last_ts = MAX(last_ts, excluded.last_ts)",
+                sessions,
+            )
+            self._conn.executemany(
+                "INSERT INTO latency (day, model, metric, bucket, count) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT (day, model, metric, bucket) DO UPDATE SET count = count + 1",
+                latency,
+            )
+            self._conn.executemany(
+                "INSERT INTO latency_monthly (month, model, metric, bucket, count) VALUES (? / 100, ?, ?, ?, 1) "
+                "ON CONFLICT (month, model, metric, bucket) DO UPDATE SET count = count + 1",
+                latency,
+            )
+            self._conn.commit()
+        return len(requests)
+
+    @staticmethod
+    def _range(since_day: Optional[int], until_day: Optional[int]) -> Tuple[str, List]:
+        clauses, params = [], []
+        if since_day is not None:
+            clauses.append("day >= ?")
+            params.append(since_day)
+        if until_day is not None:
+            clauses.append("day <= ?")
+            params.append(until_day)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _latency_histogram(self, group_by: str, since_day: Optional[int], until_day: Optional[int],
+                           filters: str = "", filter_params: Sequence = ()) -> List[sqlite3.Row]:
+        """
+        合并日期范围内的延迟直方图：首尾两个月中范围内的日期读 latency，中间的完整月份读 latency_monthly
+        :param group_by: 分组列（不含 bucket），如 "model, metric"
+        :param filters: 附加条件，如 " AND metric = ?"
+        """
+        since_month = since_day // 100 if since_day is not None else None
+        until_month = until_day // 100 if until_day is not None else None
+        parts: List[str] = []
+        params: List = []
+        columns = f"{group_by}, bucket, count" if group_by else "bucket, count"
+        if since_month is not None and since_month == until_month:
+            parts.append(f"SELECT {columns} FROM latency WHERE day >= ? AND day <= ?{filters}")
+            params += [since_day, until_day, *filter_params]
+        else:
+            month_clauses, month_params = ["1"], []
+            if since_month is not None:
+                parts.append(f"SELECT {columns} FROM latency WHERE day >= ? AND day < ?{filters}")
+                params += [since_day, (since_month + 1) * 100, *filter_params]
+                month_clauses.append("month > ?")
+                month_params.append(since_month)
+            if until_month is not None:
+                parts.append(f"SELECT {columns} FROM latency WHERE day >= ? AND day <= ?{filters}")
+                params += [until_month * 100, until_day, *filter_params]
+                month_clauses.append("month < ?")
+                month_params.append(until_month)
+            parts.append(f"SELECT {columns} FROM latency_monthly WHERE {' AND '.join(month_clauses)}{filters}")
+            params += [*month_params, *filter_params]
+        keys = f"{group_by}, bucket" if group_by else "bucket"
+        sql = (f"SELECT {keys}, SUM(count) AS count FROM ({' UNION ALL '.join(parts)}) "
+               f"GROUP BY {keys} ORDER BY {keys}")
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    _SUMS = ("SUM(requests) AS requests, SUM(errors) AS errors, SUM(response_cached) AS response_cached, "
+             "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, "
+             "SUM(cached_tokens) AS cached_tokens")
+
+    def totals(self, since_day: Optional[int] = None, until_day: Optional[int] = None) -> Dict:
+        """日期范围（含两端，None 表示不限）内的总用量"""
+        where, params = self._range(since_day, until_day)
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._SUMS} FROM daily{where}", params).fetchone()
+        return {key: row[key] or 0 for key in row.keys()}
+
+    def by_day(self, since_day: Optional[int] = None, until_day: Optional[int] = None,
+               model: Optional[str] = None) -> List[Dict]:
+        """按天汇总（日期倒序），可只统计一个模型"""
+        where, params = self._range(since_day, until_day)
+        if model is not None:
+            where += (" AND" if where else " WHERE") + " model = ?"
+            params.append(model)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT day, {self._SUMS} FROM daily{where} GROUP BY day ORDER BY day DESC", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def by_model(self, since_day: Optional[int] = None, until_day: Optional[int] = None,
+                 quantiles: Sequence[float] = (0.5, 0.95)) -> List[Dict]:
+        """
+        按模型汇总（请求数倒序），另带首字/总耗时的分位数，
+        如 ttft_p50_ms、total_p95_ms（由直方图估算，没有数据时为 None）
+        """
+        where, params = self._range(since_day, until_day)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT model, {self._SUMS} FROM daily{where} GROUP BY model ORDER BY requests DESC", params
+            ).fetchall()
+        hist_rows = self._latency_histogram("model, metric", since_day, until_day)
+        histograms: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        for row in hist_rows:
+            histograms.setdefault((row["model"], row["metric"]), []).append((row["bucket"], row["count"]))
+        result = []
+        for row in rows:
+            item = dict(row)
+            for metric in LATENCY_METRICS:
+                values = percentiles_from_histogram(histograms.get((item["model"], metric), []), quantiles)
+                for q, value in values.items():
+                    item[f"{metric}_p{round(q * 100)}_ms"] = value
+            result.append(item)
+        return result
+
+    def latency_percentiles(self, metric: str = "total", since_day: Optional[int] = None,
+                            until_day: Optional[int] = None, model: Optional[str] = None,
+                            quantiles: Sequence[float] = (0.5, 0.95)) -> Dict[float, Optional[float]]:
+        """某项延迟（"ttft" 或 "total"）的分位数，单位毫秒"""
+        filters, params = " AND metric = ?", [metric]
+        if model is not None:
+            filters += " AND model = ?"
+            params.append(model)
+        rows = self._latency_histogram("", since_day, until_day, filters, params)
+        return percentiles_from_histogram([(row["bucket"], row["count"]) for row in rows], quantiles)
+
+    def top_sessions(self, limit: int = 20) -> List[Dict]:
+        """累计 token 最多的会话"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM session_totals ORDER BY (prompt_tokens + completion_tokens) DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def session_usage(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM session_totals WHERE session_id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        """最近的请求明细，按时间倒序"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM requests ORDER BY ts DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
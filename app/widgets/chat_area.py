@@ -1,81 +1,291 @@
 # app/widgets/chat_area.py
 
+from typing import Dict, List, Optional
 from PyQt6.QtWidgets import QTextEdit
-from PyQt6.QtGui import QTextCursor, QColor, QFont
+from PyQt6.QtGui import QTextCursor, QColor, QFont, QTextCharFormat, QTextFrame, QTextFrameFormat
 from PyQt6.QtCore import QTimer, QPropertyAnimation, QEasingCurve, QSequentialAnimationGroup, QAbstractAnimation
+from app.code_highlighter import CodeHighlighter, code_key, plain_code_html
+from app.markdown_render import MarkdownBlock, MarkdownStream, render_text, split_blocks
+
+ASSISTANT_COLOR = "#FFA726"
+CODE_BACKGROUND = "#1e1e1e"
+
 
 class ChatArea(QTextEdit):
-    def __init__(self, parent=None):
+    PAGE_SIZE = 30  # 每次渲染的历史消息条数
+    LOAD_MORE_THRESHOLD = 40  # 滚动条距顶部小于该像素时加载更早的消息
+
+    def __init__(self, parent=None, highlighter: Optional[CodeHighlighter] = None):
+        """:param highlighter: 代码块语法高亮，默认使用共享实例"""
         super().__init__(parent)
         self.setObjectName("ChatArea")
         self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)  # 只读区域不需要撤销记录，流式插入时也不再累积撤销命令
         # 样式将通过外部 QSS 文件加载
         self.currentCharIndex = 0
         self.animation_timers = [] # Store timers to manage them
         self.current_message_spans = []
         self.streaming_message_open = False # Flag to indicate if an assistant message stream is active
+        # 懒加载：打开会话时只渲染最近的消息，向上滚动时再分页插入更早的消息
+        self._history = []  # [(消息序号, 消息)]
+        self._rendered_from = 0
+        self._loading_older = False
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        # Markdown 渲染：流式回复中只有最后一个未完成的块（tail）以纯文本显示，完成的块渲染后不再改变
+        self._stream: Optional[MarkdownStream] = None
+        self._tail_len = 0  # tail 在文档末尾占用的位置数
+        self._tail_code = False
+        self._code_frames: Dict[str, List[QTextFrame]] = {}  # 等待高亮结果的代码块
+        self._code_frame_format = QTextFrameFormat()
+        self._code_frame_format.setBackground(QColor(CODE_BACKGROUND))
+        self._code_frame_format.setPadding(6)
+        self._code_frame_format.setTopMargin(4)
+        self._code_frame_format.setBottomMargin(4)
+        self._tail_formats = {False: QTextCharFormat(), True: QTextCharFormat()}
+        self._tail_formats[False].setForeground(QColor(ASSISTANT_COLOR))
+        self._tail_formats[True].setFontFamilies(["Consolas", "monospace"])
+        self._tail_formats[True].setFontFixedPitch(True)
+        self.highlighter = highlighter or CodeHighlighter.instance()
+        self.highlighter.highlighted.connect(self._on_code_highlighted)
 
     def _escape_html(self, text):
         # Basic HTML escaping
         return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
-    def append_message(self, role: str, message: str):
+    def _label_html(self, label: str, seq: Optional[int]) -> str:
+        # 带锚点的角色标签，搜索结果据此定位到具体消息
+        if seq is None:
+            return f'<b>{label}：</b>'
+        return f'<a name="msg-{seq}"><b>{label}：</b></a>'
+
+    def _message_html(self, role: str, message: str, seq: Optional[int] = None) -> str:
+        escaped_message = self._escape_html(message)
+        if role == "user":
+            return f'<div style="color:#4CAF50; margin: 8px 0;">{self._label_html("你", seq)}{escaped_message}</div><br>'
+        return f'<div style="margin: 8px 0;"><b>{self._escape_html(role)}：</b>{escaped_message}</div><br>'
+
+    def _insert_message(self, cursor: QTextCursor, role: str, message: str, seq: Optional[int] = None):
+        if role != "assistant":
+            cursor.insertHtml(self._message_html(role, message, seq))
+            return
+        # 助手回复按 Markdown 渲染：标签单独一行，其后是各个块
+        cursor.insertHtml(f'<div style="color:{ASSISTANT_COLOR}; margin: 8px 0;">{self._label_html("Qwen", seq)}</div>')
+        self._insert_blocks(cursor, split_blocks(message))
+        self._end_assistant_message(cursor)
+
+    def _end_assistant_message(self, cursor: QTextCursor):
+        # 与其他消息末尾的 <br> 相同，留出一个空行；在已有内容之前插入（加载更早的分页）时同样适用
+        cursor.insertBlock()
+        cursor.insertBlock()
+
+    def _insert_blocks(self, cursor: QTextCursor, blocks: List[MarkdownBlock]):
+        for block in blocks:
+            if cursor.block().length() > 1:
+                cursor.insertBlock()  # 每个块从新的一段开始
+            if block.kind == "code":
+                self._insert_code(cursor, block)
+            else:
+                cursor.insertHtml(f'<div style="color:{ASSISTANT_COLOR};">{render_text(block.source)}</div>')
+
+    def _insert_code(self, cursor: QTextCursor, block: MarkdownBlock):
+        """代码块放在单独的 QTextFrame 中，高亮结果在后台完成后只替换这个框架的内容"""
+        key = code_key(block.code, block.lang)
+        frame = cursor.insertFrame(self._code_frame_format)
+        highlighted = self.highlighter.lookup(key, block.code, block.lang)
+        frame.firstCursorPosition().insertHtml(highlighted or plain_code_html(block.code))
+        if highlighted is None:
+            self._code_frames.setdefault(key, []).append(frame)
+        cursor.setPosition(frame.lastPosition() + 1)
+
+    def _on_code_highlighted(self, key: str, highlighted: str):
+        frames = self._code_frames.pop(key, None)
+        if not frames:
+            return
+        scrollbar = self.verticalScrollBar()
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+        for frame in frames:
+            try:
+                cursor = frame.firstCursorPosition()
+            except RuntimeError:
+                continue  # 框架所在的内容已被删除
+            cursor.setPosition(frame.lastPosition(), QTextCursor.MoveMode.KeepAnchor)
+            cursor.insertHtml(highlighted)
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def append_message(self, role: str, message: str, seq: Optional[int] = None):
+        """:param seq: 消息在会话中的序号，用于搜索结果定位（系统提示等不需要）"""
         cursor = self.textCursor()
         cursor.movePosition(QTextCursor.MoveOperation.End)
-        escaped_message = self._escape_html(message)
 
-        if role == "user":
-            if self.streaming_message_open: # Finalize any open assistant stream before user message
-                self.finalize_stream()
-            html = f'<div style="color:#4CAF50; margin: 8px 0;"><b>你：</b>{escaped_message}</div><br>'
-            cursor.insertHtml(html)
-        elif role == "assistant":
-            if not message: # This is the start of a new stream (placeholder)
-                if self.streaming_message_open:
-                    self.finalize_stream() # Close previous stream if any
-                # Start a new streaming message structure, leaving content span open
-                html_prefix = f'<div style="color:#FFA726; margin: 8px 0;"><b>Qwen：</b><span class="assistant-content">' # Open span
-                cursor.insertHtml(html_prefix)
-                self.streaming_message_open = True
-            else: # This is a non-streaming, complete assistant message
-                if self.streaming_message_open:
-                    self.finalize_stream()
-                html = f'<div style="color:#FFA726; margin: 8px 0;"><b>Qwen：</b><span class="assistant-content">{escaped_message}</span></div><br>'
-                cursor.insertHtml(html)
-        else: # Other roles (e.g., system, not typically displayed directly like this)
+        if role == "assistant" and not message: # This is the start of a new stream (placeholder)
+            if self.streaming_message_open:
+                self.finalize_stream() # Close previous stream if any
+            cursor.insertHtml(f'<div style="color:{ASSISTANT_COLOR}; margin: 8px 0;">{self._label_html("Qwen", seq)}</div>')
+            self._stream = MarkdownStream()
+            self._tail_len = 0
+            self._tail_code = False
+            self.streaming_message_open = True
+        else:
+            # Finalize any open assistant stream before a complete message
             if self.streaming_message_open:
                 self.finalize_stream()
-            html = f'<div style="margin: 8px 0;"><b>{self._escape_html(role)}：</b>{escaped_message}</div><br>'
-            cursor.insertHtml(html)
-        
+            self._insert_message(cursor, role, message, seq)
+
         self.setTextCursor(cursor)
         self.ensureCursorVisible()
 
+    def load_messages(self, messages: list):
+        """
+        显示一个会话的历史消息：只渲染最近的 PAGE_SIZE 条（一次 insertHtml），
+        更早的消息在向上滚动到顶部时分页插入，打开会话的开销与历史长度无关。
+        """
+        self.clear()
+        self.streaming_message_open = False
+        self._history = [(i, m) for i, m in enumerate(messages) if m.get('role') in ('user', 'assistant')]
+        self._rendered_from = len(self._history)
+        self._render_older_page()
+        cursor = self.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        self.setTextCursor(cursor)
+        self.ensureCursorVisible()
+        # 内容不足以出现滚动条时无法触发向上滚动，继续补充直到填满视口
+        QTimer.singleShot(0, self._fill_viewport)
+
+    def clear(self):
+        self._history = []
+        self._rendered_from = 0
+        self._code_frames = {}
+        self.streaming_message_open = False
+        self._stream = None
+        self._tail_len = 0
+        super().clear()
+
+    @property
+    def has_older_messages(self) -> bool:
+        return self._rendered_from > 0
+
+    def _render_older_page(self):
+        if self._rendered_from <= 0:
+            return
+        start = max(0, self._rendered_from - self.PAGE_SIZE)
+        page = self._history[start:self._rendered_from]
+        self._rendered_from = start
+
+        scrollbar = self.verticalScrollBar()
+        distance_from_bottom = scrollbar.maximum() - scrollbar.value()
+        self._loading_older = True
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.MoveOperation.Start)
+        # 单个编辑块内插入，整页只触发一次重新布局
+        cursor.beginEditBlock()
+        for seq, m in page:
+            self._insert_message(cursor, m['role'], m.get('content', ''), seq)
+        cursor.endEditBlock()
+        # 保持当前可见内容不动
+        scrollbar.setValue(scrollbar.maximum() - distance_from_bottom)
+        self._loading_older = False
+        if self._rendered_from == 0:
+            self._history = []
+
+    def scroll_to_message(self, seq: int, highlight: Optional[str] = None) -> bool:
+        """
+        滚动到会话中第 seq 条消息（必要时先渲染更早的分页），
+        并选中其中第一处 highlight 文本（多个词时依次尝试）
+
+        :return: 是否找到该消息
+        """
+        while self.has_older_messages and self._history[self._rendered_from - 1][0] >= seq:
+            self._render_older_page()
+        position = self._anchor_position(f"msg-{seq}")
+        if position is None:
+            return False
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(position)
+        if highlight:
+            next_anchor = self._anchor_position(f"msg-{seq + 1}")
+            for term in [highlight] + highlight.split():
+                found = self.document().find(term, position)
+                if not found.isNull() and (next_anchor is None or found.selectionEnd() <= next_anchor):
+                    cursor = found
+                    break
+        # 先滚到末尾再定位，使目标消息尽量出现在视口顶部
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+        self.setTextCursor(cursor)
+        self.ensureCursorVisible()
+        return True
+
+    def _anchor_position(self, name: str) -> Optional[int]:
+        block = self.document().begin()
+        while block.isValid():
+            it = block.begin()
+            while not it.atEnd():
+                fragment = it.fragment()
+                if fragment.isValid() and name in fragment.charFormat().anchorNames():
+                    return fragment.position()
+                it += 1
+            block = block.next()
+        return None
+
+    def _fill_viewport(self):
+        while self.has_older_messages and self.verticalScrollBar().maximum() == 0:
+            self._render_older_page()
+
+    def _on_scroll(self, value: int):
+        if not self._loading_older and value <= self.LOAD_MORE_THRESHOLD and self.has_older_messages:
+            self._render_older_page()
+
+    def wheelEvent(self, event):
+        # 没有滚动条时向上滚动也要加载更早的消息
+        if event.angleDelta().y() > 0 and self.verticalScrollBar().value() == 0 and self.has_older_messages:
+            self._render_older_page()
+        super().wheelEvent(event)
+
     def stream_token(self, token_text: str):
         """Appends a token to the currently open assistant message stream."""
-        if self.streaming_message_open:
-            cursor = self.textCursor()
-            cursor.movePosition(QTextCursor.MoveOperation.End)
-            # Insert HTML escaped text into the open span
-            escaped_token = self._escape_html(token_text)
-            # Using insertText here is generally safer for plain text tokens
-            # as it handles the QTextEdit's internal representation correctly.
-            # If tokens could contain HTML to be rendered, insertHtml would be needed.
-            cursor.insertText(escaped_token)
-            self.setTextCursor(cursor)
-            self.ensureCursorVisible()
-        # else:
-            # print("[ChatArea WARNING] stream_token called but no stream is open.")
+        if not self.streaming_message_open:
+            return
+        tail_len = len(self._stream.tail)
+        blocks = self._stream.feed(token_text)
+        cursor = self.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if not blocks and self._stream.in_code == self._tail_code \
+                and len(self._stream.tail) == tail_len + len(token_text):
+            # 通常情况：token 只是延长了未完成的块，直接追加纯文本
+            self._insert_tail(cursor, token_text)
+        else:
+            # 有块完成：用渲染后的块替换之前以纯文本显示的部分，再写入新的 tail
+            self._remove_tail(cursor)
+            self._insert_blocks(cursor, blocks)
+            self._insert_tail(cursor, self._stream.tail)
+        self.setTextCursor(cursor)
+        self.ensureCursorVisible()
+
+    def _insert_tail(self, cursor: QTextCursor, text: str):
+        if not text:
+            return
+        if self._tail_len == 0 and cursor.block().length() > 1:
+            cursor.insertBlock()
+        start = cursor.position()
+        self._tail_code = self._stream.in_code
+        cursor.insertText(text, self._tail_formats[self._tail_code])
+        self._tail_len += cursor.position() - start
+
+    def _remove_tail(self, cursor: QTextCursor):
+        if self._tail_len:
+            cursor.setPosition(cursor.position() - self._tail_len, QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+            self._tail_len = 0
 
     def finalize_stream(self):
-        """Closes the HTML tags for the current assistant message stream."""
+        """Renders the remaining text of the current assistant message stream and closes it."""
         if self.streaming_message_open:
             cursor = self.textCursor()
             cursor.movePosition(QTextCursor.MoveOperation.End)
-            # Close the content span and the message div, then add a line break for separation
-            cursor.insertHtml('</span></div><br>') 
+            self._remove_tail(cursor)
+            self._insert_blocks(cursor, self._stream.finish())
+            self._end_assistant_message(cursor)
             self.setTextCursor(cursor)
             self.ensureCursorVisible()
             self.streaming_message_open = False
-        # else:
-            # print("[ChatArea WARNING] finalize_stream called but no stream was open.")
\ No newline at end of file
+            self._stream = None
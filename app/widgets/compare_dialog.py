@@ -0,0 +1,131 @@
+# app/widgets/compare_dialog.py
+
+from typing import Dict, List, Optional
+from PyQt6.QtWidgets import QDialog, QHBoxLayout, QVBoxLayout, QLabel, QPushButton
+from PyQt6.QtCore import Qt, pyqtSignal
+from app.render_scheduler import StreamRenderScheduler
+from app.widgets.chat_area import ChatArea
+
+
+class _ModelColumn:
+    """对比窗口中的一列：模型名、流式回复、指标和“采用”按钮"""
+
+    def __init__(self, model: str, parent: QDialog):
+        self.model = model
+        self.content = ""
+        self.error: Optional[str] = None
+        self.done = False
+        self.title = QLabel(model)
+        self.title.setObjectName("CompareModelLabel")
+        self.area = ChatArea()
+        self.area.append_message("assistant", "")  # 打开流式消息
+        # 每列单独按帧批量渲染，多个模型同时输出时不会逐 token 重排版
+        self.renderer = StreamRenderScheduler(self.area, parent=parent)
+        self.stats = QLabel("等待响应...")
+        self.stats.setObjectName("StatusLabel")
+        self.stats.setWordWrap(True)
+        self.choose_button = QPushButton("采用此回答")
+        self.choose_button.setEnabled(False)
+
+        self.layout = QVBoxLayout()
+        self.layout.addWidget(self.title)
+        self.layout.addWidget(self.area, stretch=1)
+        self.layout.addWidget(self.stats)
+        self.layout.addWidget(self.choose_button)
+
+
+class CompareDialog(QDialog):
+    """
+    多模型对比：同一条提示词并发发送给多个模型，回复并排流式显示，
+    完成后显示各模型的首字时间、总耗时与 token 用量，由用户选择保存哪一个回答。
+    race 模式下第一个成功完成的回答自动采用，其余请求被取消。
+    """
+
+    answer_chosen = pyqtSignal(str, str)  # 模型, 回复内容
+
+    def __init__(self, models: List[str], prompt: str, race: bool = False, parent=None):
+        super().__init__(parent)
+        models = list(dict.fromkeys(models))  # 每个模型一列，重复的模型名只保留一个
+        self.setWindowTitle("多模型对比（race：先完成者胜出）" if race else "多模型对比")
+        self.resize(360 * max(2, len(models)), 600)
+        self.race = race
+        self.finished_all = False
+        self.chosen: Optional[str] = None
+        self.columns: Dict[str, _ModelColumn] = {}
+
+        layout = QVBoxLayout(self)
+        prompt_label = QLabel(prompt if len(prompt) <= 200 else prompt[:200] + "…")
+        prompt_label.setWordWrap(True)
+        layout.addWidget(prompt_label)
+        row = QHBoxLayout()
+        for model in models:
+            column = _ModelColumn(model, self)
+            column.choose_button.clicked.connect(lambda _=False, m=model: self._choose(m))
+            self.columns[model] = column
+            row.addLayout(column.layout)
+        layout.addLayout(row, stretch=1)
+        self.status_label = QLabel("正在生成...")
+        self.status_label.setObjectName("StatusLabel")
+        self.status_label.setAlignment(Qt.AlignmentFlag.AlignRight)
+        layout.addWidget(self.status_label)
+
+    def append_token(self, model: str, token: str):
+        column = self.columns.get(model)
+        if column:
+            column.renderer.push(token)
+
+    def set_result(self, model: str, content: str, error: str, metrics: Dict):
+        column = self.columns.get(model)
+        if column is None:
+            return
+        column.renderer.flush()
+        column.area.finalize_stream()
+        column.done = True
+        column.content = content
+        column.error = error or None
+        column.stats.setText(f"{error} · {self._format_metrics(metrics)}" if error else self._format_metrics(metrics))
+        column.choose_button.setEnabled(bool(content) and not error and self.chosen is None)
+
+    def set_finished(self, winner: str):
+        """所有模型结束；race 模式下自动采用胜出的回答"""
+        self.finished_all = True
+        for column in self.columns.values():
+            if not column.done:  # 对比被整体取消时可能没有结果
+                column.renderer.flush()
+                column.area.finalize_stream()
+                column.stats.setText("已取消")
+        if winner and self.chosen is None:
+            self._choose(winner)
+        elif self.chosen is None:
+            ok = [c for c in self.columns.values() if c.content and not c.error]
+            self.status_label.setText("请选择要保存的回答" if ok else "所有模型均未返回回答")
+
+    def _choose(self, model: str):
+        column = self.columns[model]
+        if self.chosen is not None or not column.content:
+            return
+        self.chosen = model
+        for c in self.columns.values():
+            c.choose_button.setEnabled(False)
+        column.choose_button.setText("✓ 已采用")
+        column.title.setText(f"✓ {model}")
+        self.status_label.setText(f"已保存 {model} 的回答")
+        self.answer_chosen.emit(model, column.content)
+
+    @staticmethod
+    def _format_metrics(metrics: Dict) -> str:
+        if not metrics:
+            return ""
+        parts = []
+        if metrics.get("ttft_ms") is not None:
+            parts.append(f"首字 {metrics['ttft_ms']:.0f} ms")
+        if metrics.get("total_ms") is not None:
+            parts.append(f"总计 {metrics['total_ms']:.0f} ms")
+        if metrics.get("completion_tokens") is not None:
+            tokens = f"{metrics['completion_tokens']} tokens"
+            if metrics.get("usage_estimated"):
+                tokens += "（估算）"
+            parts.append(tokens)
+        if metrics.get("tokens_per_second") is not None:
+            parts.append(f"{metrics['tokens_per_second']:.0f} tokens/s")
+        return " · ".join(parts)
@@ -1,6 +1,8 @@
 # app/widgets/history_sidebar.py
 
-from typing import Optional
+import os
+import time
+from typing import Dict, List, Optional
 from PyQt6.QtWidgets import (
     QWidget,
     QVBoxLayout,
@@ -8,6 +10,7 @@ from PyQt6.QtWidgets import (
     QPushButton,
     QListWidget,
     QListWidgetItem,
+    QListView,
     QMenu,
     QMessageBox, # Added QMessageBox
     QDialog,
@@ -18,19 +21,28 @@ from PyQt6.QtWidgets import (
     QAbstractItemView, # Import QAbstractItemView
 )
 
-from PyQt6.QtCore import pyqtSignal, Qt
+from PyQt6.QtCore import pyqtSignal, Qt, QTimer, QModelIndex
+from app.context_manager import ContextManager
 from app.history_manager import HistoryManager
+from app.widgets.session_list_model import SessionListModel, SessionItemDelegate
 
 class HistorySidebar(QWidget):
     session_selected = pyqtSignal(str)  # Emits session_id when a session is selected
     new_chat_requested = pyqtSignal()
     config_requested = pyqtSignal()  # 新增信号
+    stats_requested = pyqtSignal()  # 打开用量统计面板
+    search_result_selected = pyqtSignal(str, int, str)  # session_id, 消息序号（标题命中为 -1）, 搜索词
+    session_deleting = pyqtSignal(str)  # 删除会话文件之前发射，用于取消该会话正在进行的请求
+
+    SEARCH_DEBOUNCE_MS = 200
+    SEARCH_LIMIT = 100
 
     def __init__(self, history_manager: HistoryManager, parent=None):
         super().__init__(parent)
         self.history_manager = history_manager
+        self.session_model = SessionListModel(history_manager, self)
         self._init_ui()
-        self.load_history()
+        # 会话列表由 ChatWindow 在后台同步索引后调用 load_history 填充
 
     def _init_ui(self):
         self.layout = QVBoxLayout(self)
@@ -44,12 +56,39 @@ class HistorySidebar(QWidget):
         self.top_bar_layout.addWidget(self.new_chat_button)
         self.layout.addLayout(self.top_bar_layout)
 
-        self.history_list_widget = QListWidget()
-        self.history_list_widget.setObjectName("HistoryList")
-        self.history_list_widget.itemClicked.connect(self._on_item_clicked)
-        self.history_list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.history_list_widget.customContextMenuRequested.connect(self._show_context_menu)
-        self.layout.addWidget(self.history_list_widget)
+        # 全文搜索：输入停止一小段时间后再查询
+        self.search_box = QLineEdit()
+        self.search_box.setObjectName("SearchBox")
+        self.search_box.setPlaceholderText("🔍 搜索聊天记录")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self._on_search_text_changed)
+        self.search_box.returnPressed.connect(self._run_search)
+        self.layout.addWidget(self.search_box)
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self._run_search)
+
+        self.search_results_widget = QListWidget()
+        self.search_results_widget.setObjectName("SearchResults")
+        self.search_results_widget.setWordWrap(True)
+        self.search_results_widget.itemClicked.connect(self._on_search_result_clicked)
+        self.search_results_widget.hide()
+        self.layout.addWidget(self.search_results_widget)
+
+        # 会话列表：模型按页从索引加载，行高一致，视图不必逐行计算尺寸
+        self.history_list_view = QListView()
+        self.history_list_view.setObjectName("HistoryList")
+        self.history_list_view.setModel(self.session_model)
+        self.history_list_view.setItemDelegate(SessionItemDelegate(self.history_list_view))
+        self.history_list_view.setUniformItemSizes(True)
+        # 插入/移动一行后 QListView 会重新布局全部已加载的行，分批布局避免在会话很多时阻塞界面
+        self.history_list_view.setLayoutMode(QListView.LayoutMode.Batched)
+        self.history_list_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.history_list_view.clicked.connect(self._on_item_clicked)
+        self.history_list_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.history_list_view.customContextMenuRequested.connect(self._show_context_menu)
+        self.layout.addWidget(self.history_list_view)
 
         # 左下角配置按钮
         self.bottom_bar_layout = QHBoxLayout()
@@ -57,32 +96,86 @@ class HistorySidebar(QWidget):
         self.config_button.setObjectName("ConfigButton")
         self.config_button.clicked.connect(self.config_requested.emit)
         self.bottom_bar_layout.addWidget(self.config_button)
+        self.stats_button = QPushButton("📊 用量")
+        self.stats_button.setObjectName("ConfigButton")
+        self.stats_button.clicked.connect(self.stats_requested.emit)
+        self.bottom_bar_layout.addWidget(self.stats_button)
         self.layout.addLayout(self.bottom_bar_layout)
 
         self.setLayout(self.layout)
         self.setFixedWidth(200) # Adjust width as needed
 
-    def _on_item_clicked(self, item: QListWidgetItem):
-        session_id = item.data(Qt.ItemDataRole.UserRole) # Get session_id stored in the item
+    def _on_item_clicked(self, index: QModelIndex):
+        session_id = index.data(SessionListModel.SessionIdRole)
         if session_id:
             self.session_selected.emit(session_id)
 
+    def _on_search_text_changed(self, text: str):
+        if text.strip():
+            self._search_timer.start()
+        else:
+            self._search_timer.stop()
+            self.search_results_widget.clear()
+            self.search_results_widget.hide()
+            self.history_list_view.show()
+
+    def _run_search(self):
+        self._search_timer.stop()
+        query = self.search_box.text().strip()
+        if not query:
+            return
+        hits = self.history_manager.search(query, limit=self.SEARCH_LIMIT)
+        self.search_results_widget.clear()
+        for hit in hits:
+            if hit["seq"] is None:
+                text = f"📁 {hit['title']}"
+            else:
+                role = "你" if hit["role"] == "user" else "Qwen"
+                text = f"{hit['title']}\n{role}：{hit['snippet']}"
+            item = QListWidgetItem(text)
+            item.setData(Qt.ItemDataRole.UserRole, (hit["session_id"], -1 if hit["seq"] is None else hit["seq"]))
+            item.setToolTip(f"会话ID: {hit['session_id']}")
+            self.search_results_widget.addItem(item)
+        if not hits:
+            placeholder = QListWidgetItem("没有找到匹配的内容")
+            placeholder.setFlags(Qt.ItemFlag.NoItemFlags)
+            self.search_results_widget.addItem(placeholder)
+        self.history_list_view.hide()
+        self.search_results_widget.show()
+
+    def _on_search_result_clicked(self, item: QListWidgetItem):
+        data = item.data(Qt.ItemDataRole.UserRole)
+        if data:
+            session_id, seq = data
+            self.search_result_selected.emit(session_id, seq, self.search_box.text().strip())
+
     def load_history(self):
-        self.history_list_widget.clear()
-        session_ids = self.history_manager.get_all_session_ids()
-        for session_id in session_ids:
-            title = self.history_manager.get_session_title(session_id)
-            item = QListWidgetItem(title)
-            item.setData(Qt.ItemDataRole.UserRole, session_id)
-            item.setToolTip(f"会话ID: {session_id}")
-            self.history_list_widget.addItem(item)
+        # 元数据来自会话索引，不需要逐个解析会话文件；其余会话在滚动到底部时按页加载
+        self.session_model.reload()
+
+    def apply_changes(self, updated: List[Dict], removed: List[str]):
+        """
+        增量应用历史目录的变化（见 HistoryWatcher）：更新标题并按修改时间移动/插入变化的会话，
+        移除已删除的会话，不重建整个列表
+        """
+        for session_id in removed:
+            self.session_model.remove(session_id)
+        for meta in updated:
+            self.session_model.upsert(meta)
+
+    def remove_session(self, session_id: str):
+        self.session_model.remove(session_id)
+
+    def set_session_generating(self, session_id: str, generating: bool):
+        """标记会话是否正在生成回复（标题前显示 ⏳）"""
+        self.session_model.set_generating(session_id, generating)
 
     def _show_context_menu(self, position):
-        item = self.history_list_widget.itemAt(position)
-        if not item:
+        index = self.history_list_view.indexAt(position)
+        if not index.isValid():
             return
 
-        session_id = item.data(Qt.ItemDataRole.UserRole)
+        session_id = index.data(SessionListModel.SessionIdRole)
         if not session_id:
             return
 
@@ -95,7 +188,7 @@ class HistorySidebar(QWidget):
         delete_action.triggered.connect(lambda: self._confirm_delete_session(session_id))
         config_action.triggered.connect(lambda: self._config_session(session_id))
         edit_action.triggered.connect(lambda: self._edit_session_info(session_id))
-        menu.exec(self.history_list_widget.mapToGlobal(position))
+        menu.exec(self.history_list_view.viewport().mapToGlobal(position))
 
     def _confirm_delete_session(self, session_id: str):
         confirm_dialog = QMessageBox()
@@ -113,16 +206,14 @@ class HistorySidebar(QWidget):
             self._delete_session(session_id)
 
     def _delete_session(self, session_id: str):
-        filepath = self.history_manager._get_session_filepath(session_id)
+        self.session_deleting.emit(session_id)
         try:
-            import os
-            os.remove(filepath)
-            print(f"[HistorySidebar] Session '{session_id}' deleted.")
-            self.load_history() # Refresh the list
+            self.history_manager.delete_chat_session(session_id)
+            self.remove_session(session_id)
             # Optionally, emit a signal if the currently active chat was deleted
             # self.active_chat_deleted.emit(session_id)
         except OSError as e:
-            print(f"[HistorySidebar] Error deleting session file '{filepath}': {e}")
+            print(f"[HistorySidebar] Error deleting session '{session_id}': {e}")
             QMessageBox.warning(self, "删除失败", f"无法删除会话文件：{e}")
 
     def _favorite_session(self, session_id: str):
@@ -140,49 +231,57 @@ class HistorySidebar(QWidget):
         if not data:
             QMessageBox.warning(self, "错误", "无法加载会话信息")
             return
-        dlg = SessionInfoDialog(data.get('title', ''), data.get('system_prompt', ''), self)
+        old_prompt = data.get('system_prompt', '')
+        history_tokens = sum(ContextManager.message_tokens(m) for m in data.get('messages', []))
+        dlg = SessionInfoDialog(data.get('title', ''), old_prompt, self, history_tokens=history_tokens)
         if dlg.exec() == QDialog.DialogCode.Accepted:
             new_title, new_prompt = dlg.get_values()
             data['title'] = new_title or '新对话'
-            data['system_prompt'] = new_prompt or '你是一个有帮助的AI助手。'
+            if new_prompt != old_prompt.strip():  # 只去掉首尾空白不算修改，避免无谓地改变请求前缀
+                data['system_prompt'] = new_prompt or '你是一个有帮助的AI助手。'
             self.history_manager.save_chat_session(session_id, data)
-            self.load_history()
-
-    def add_session_to_top(self, session_id: str, preview: Optional[str] = None):
-        title = self.history_manager.get_session_title(session_id)
-        current_item = None
-        for i in range(self.history_list_widget.count()):
-            item = self.history_list_widget.item(i)
-            if item and item.data(Qt.ItemDataRole.UserRole) == session_id:
-                current_item = item
-                break
-        if current_item:
-            current_item.setText(title)
-            current_item.setToolTip(f"会话ID: {session_id}")
-            self.history_list_widget.setCurrentItem(current_item)
-        else:
-            new_item = QListWidgetItem(title)
-            new_item.setData(Qt.ItemDataRole.UserRole, session_id)
-            new_item.setToolTip(f"会话ID: {session_id}")
-            self.history_list_widget.insertItem(0, new_item)
-            self.history_list_widget.setCurrentItem(new_item)
+            self.add_session_to_top(session_id, data['title'], select=False)
+
+    def add_session_to_top(self, session_id: str, preview: Optional[str] = None, select: bool = True):
+        # 刚保存的会话已写入索引（不必等待后台同步），不在索引中时按新会话放在最前
+        meta = self.history_manager.get_session_meta(session_id, wait_for_sync=False)
+        meta = dict(meta) if meta else {"id": session_id, "mtime": time.time(),
+                                         "title": self.history_manager.get_session_title(session_id)}
+        if preview:  # 调用方已知标题时直接使用
+            meta["title"] = preview
+        row = self.session_model.upsert(meta)
+        if select:
+            self.history_list_view.setCurrentIndex(self.session_model.index(row))
 
     def select_session(self, session_id: str, move_to_top_on_select=False):
         """Selects a session in the list by its ID."""
-        for i in range(self.history_list_widget.count()):
-            item = self.history_list_widget.item(i)
-            if item and item.data(Qt.ItemDataRole.UserRole) == session_id:
-                if move_to_top_on_select and self.history_list_widget.row(item) != 0:
-                    # This part is now mainly for new chats or explicit moves
-                    self.history_list_widget.takeItem(self.history_list_widget.row(item))
-                    self.history_list_widget.insertItem(0, item)
-                self.history_list_widget.setCurrentItem(item)
-                # Scroll to the item to make sure it's visible
-                self.history_list_widget.scrollToItem(item, QAbstractItemView.ScrollHint.PositionAtCenter)
-                break
+        if move_to_top_on_select:
+            self.add_session_to_top(session_id, select=False)
+        row = self.session_model.row_of(session_id)
+        if row is None:
+            # 还没有按页加载到的较早会话（例如从搜索结果打开），单独插入到它的位置
+            meta = self.history_manager.get_session_meta(session_id, wait_for_sync=False)
+            if meta is None:
+                return
+            row = self.session_model.upsert(dict(meta))
+        index = self.session_model.index(row)
+        view = self.history_list_view
+        view.setCurrentIndex(index)
+        if not view.visualRect(index).isValid():
+            # 分批布局还没有排到这一行，先一次完成布局，否则无法滚动到它
+            view.setLayoutMode(QListView.LayoutMode.SinglePass)
+            view.doItemsLayout()
+            view.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
+            view.setLayoutMode(QListView.LayoutMode.Batched)
+            return
+        # Scroll to the item to make sure it's visible
+        view.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
 
 class SessionInfoDialog(QDialog):
-    def __init__(self, title='', system_prompt='', parent=None):
+    def __init__(self, title='', system_prompt='', parent=None, history_tokens=0):
+        """
+        :param history_tokens: 会话已有历史的估算 token 数；大于 0 时修改 System Prompt 会提示前缀缓存失效
+        """
         super().__init__(parent)
         self.setWindowTitle('会话信息')
         layout = QVBoxLayout(self)
@@ -193,10 +292,25 @@ class SessionInfoDialog(QDialog):
         self.prompt_edit = QTextEdit(system_prompt)
         self.prompt_edit.setFixedHeight(80)
         layout.addWidget(self.prompt_edit)
+        # System prompt 是每次请求的第一条消息，修改后服务端缓存的整个前缀都无法复用
+        self._original_prompt = system_prompt.strip()
+        self.cache_warning = QLabel(
+            f'⚠ 修改 System Prompt 后，下一次请求无法命中服务端的前缀缓存，'
+            f'已有的约 {history_tokens} tokens 历史需要重新计算。'
+        )
+        self.cache_warning.setWordWrap(True)
+        self.cache_warning.setStyleSheet("color: #d08000;")
+        self.cache_warning.setVisible(False)
+        layout.addWidget(self.cache_warning)
+        if history_tokens > 0:
+            self.prompt_edit.textChanged.connect(self._update_cache_warning)
         buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
+    def _update_cache_warning(self):
+        self.cache_warning.setVisible(self.prompt_edit.toPlainText().strip() != self._original_prompt)
+
     def get_values(self):
         return self.title_edit.text().strip(), self.prompt_edit.toPlainText().strip()
 
@@ -5,6 +5,7 @@ from PyQt6.QtCore import pyqtSignal
 
 class InputBar(QWidget):
     send_clicked = pyqtSignal(str) # 定义信号，在发送按钮点击时发射
+    stop_clicked = pyqtSignal() # 生成过程中点击“停止”按钮时发射
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -26,10 +27,37 @@ class InputBar(QWidget):
         # 样式将通过外部 QSS 文件加载
         self.send_button.clicked.connect(self._on_send_clicked)
 
+        self.stop_button = QPushButton("停止")
+        self.stop_button.setObjectName("StopButton")
+        self.stop_button.clicked.connect(self.stop_clicked.emit)
+        self.stop_button.hide() # 仅在生成回复时显示
+
+        # 多模型对比：选中后同一条消息并发发送给配置中的多个模型
+        self.compare_button = QPushButton("对比")
+        self.compare_button.setObjectName("CompareButton")
+        self.compare_button.setCheckable(True)
+        self.compare_button.setToolTip("同时发送给多个模型，并排比较回答后选择保存哪一个")
+        self.compare_button.hide() # 配置了两个及以上模型时才显示
+
         layout.addWidget(self.input_box, stretch=4)
         layout.addWidget(self.send_button, stretch=1)
+        layout.addWidget(self.stop_button, stretch=1)
+        layout.addWidget(self.compare_button)
         self.setLayout(layout)
 
+    def set_generating(self, generating: bool):
+        """生成回复期间显示“停止”按钮"""
+        self.stop_button.setVisible(generating)
+
+    def set_compare_available(self, available: bool):
+        self.compare_button.setVisible(available)
+        if not available:
+            self.compare_button.setChecked(False)
+
+    @property
+    def compare_mode(self) -> bool:
+        return self.compare_button.isVisible() and self.compare_button.isChecked()
+
     def _on_send_clicked(self):
         user_input = self.input_box.text().strip()
         if user_input:
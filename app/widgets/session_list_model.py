@@ -0,0 +1,300 @@
+# app/widgets/session_list_model.py
+
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QRect
+from PyQt6.QtGui import QPalette
+from PyQt6.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem
+
+
+# 把 id 的 UTF-8 字节逐个取反，使字节串升序即 id 倒序（与 SQLite 的 BINARY 排序一致）；
+# 末尾的 0xff 让较长的 id 排在它的前缀之前。会话 ID 是文件名，不含 \0，取反后不会出现 0xff
+_DESCENDING = bytes(255 - b for b in range(256))
+
+
+def _descending(text: str) -> bytes:
+    return text.encode("utf-8").translate(_DESCENDING) + b"\xff"
+
+
+class SessionMetaStore:
+    """
+    内存中的会话元数据，与 SessionIndex 的排序一致：按修改时间倒序，相同时按 id 倒序。
+
+    与 sortedcontainers.SortedList 相同的分块结构：排序键分成若干块（每块至多 2 * BLOCK_SIZE 条），
+    另有每块最大键的列表和懒重建的块起始行号。按 id 求行号、按行号取元数据、插入与删除
+    都只需两次二分查找加一个块内的操作，块级前缀和在修改后的第一次查询时重建（几百个块），
+    因此 5 万个会话时单次操作的开销与会话总数基本无关。
+    """
+
+    BLOCK_SIZE = 256
+
+    def __init__(self):
+        self._metas: Dict[str, Dict] = {}  # session_id -> 元数据
+        self._blocks: List[List[Tuple[float, bytes, str]]] = []
+        self._maxes: List[Tuple[float, bytes, str]] = []  # 每块的最大键
+        self._offsets: Optional[List[int]] = None  # 每块第一条的行号，None 表示需要重建
+
+    @staticmethod
+    def key(meta: Dict) -> Tuple[float, bytes, str]:
+        """排序键 (-mtime, 倒序的 id, id)，末项只用于由键取回会话"""
+        return -meta["mtime"], _descending(meta["id"]), meta["id"]
+
+    def __len__(self) -> int:
+        return len(self._metas)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._metas
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        return self._metas.get(session_id)
+
+    def last_key(self) -> Optional[Tuple[float, bytes, str]]:
+        return self._maxes[-1] if self._maxes else None
+
+    def reset(self, metas: Iterable[Dict]) -> None:
+        self._metas = {meta["id"]: meta for meta in metas}
+        keys = sorted(self.key(meta) for meta in self._metas.values())
+        self._blocks = [keys[i:i + self.BLOCK_SIZE] for i in range(0, len(keys), self.BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._offsets = None
+
+    def _block_offsets(self) -> List[int]:
+        if self._offsets is None:
+            offsets, total = [], 0
+            for block in self._blocks:
+                offsets.append(total)
+                total += len(block)
+            self._offsets = offsets
+        return self._offsets
+
+    def rank(self, key: Tuple[float, bytes, str]) -> int:
+        """排序键小于 key 的条数，即 key 应插入的行号"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._blocks):
+            return len(self._metas)
+        return self._block_offsets()[i] + bisect_left(self._blocks[i], key)
+
+    def row_of(self, session_id: str) -> Optional[int]:
+        meta = self._metas.get(session_id)
+        return None if meta is None else self.rank(self.key(meta))
+
+    def at(self, row: int) -> Dict:
+        offsets = self._block_offsets()
+        i = bisect_right(offsets, row) - 1
+        return self._metas[self._blocks[i][row - offsets[i]][2]]
+
+    def insert(self, meta: Dict) -> None:
+        """插入不存在的会话"""
+        key = self.key(meta)
+        self._metas[meta["id"]] = meta
+        self._offsets = None
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            return
+        i = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+        block = self._blocks[i]
+        insort(block, key)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self._blocks[i:i + 1] = [block[:self.BLOCK_SIZE], block[self.BLOCK_SIZE:]]
+            self._maxes[i:i + 1] = [self._blocks[i][-1], self._blocks[i + 1][-1]]
+
+    def remove(self, session_id: str) -> None:
+        meta = self._metas.pop(session_id)
+        key = self.key(meta)
+        i = bisect_left(self._maxes, key)
+        block = self._blocks[i]
+        del block[bisect_left(block, key)]
+        self._offsets = None
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+
+class SessionListModel(QAbstractListModel):
+    """
+    侧边栏的会话列表模型，数据来自会话索引（不读取会话文件），按修改时间倒序。
+    首次只加载 PAGE_SIZE 个会话，滚动到底部时视图通过 canFetchMore/fetchMore 按页继续加载；
+    新增/更新/删除单个会话时只移动或插入受影响的一行，不重新列出全部会话。
+    """
+
+    SessionIdRole = Qt.ItemDataRole.UserRole
+    TitleRole = Qt.ItemDataRole.UserRole + 1  # 不含状态标记的会话标题
+    MtimeRole = Qt.ItemDataRole.UserRole + 2
+    GroupRole = Qt.ItemDataRole.UserRole + 3  # 按最近修改时间的分组："今天"、"昨天"……
+    GroupStartRole = Qt.ItemDataRole.UserRole + 4  # 是否为所在分组的第一行
+
+    PAGE_SIZE = 200
+    GROUPS = ((0, "今天"), (1, "昨天"), (7, "7 天内"), (30, "30 天内"))
+
+    def __init__(self, history_manager, parent=None):
+        super().__init__(parent)
+        self.history_manager = history_manager
+        self.store = SessionMetaStore()
+        self._generating = set()  # 正在生成回复的会话
+        self._cursor: Optional[Tuple[float, str]] = None  # 已从索引按页加载到的最后一个会话
+        self._exhausted = True
+        self._group_bounds: List[Tuple[float, str]] = []
+        self._groups_expire = 0.0
+
+    # ---- 加载 ----
+
+    def reload(self):
+        """从索引重新加载第一页"""
+        self.beginResetModel()
+        self._cursor = None
+        self._exhausted = False
+        self.store.reset(self._next_page())
+        self.endResetModel()
+
+    def _next_page(self) -> List[Dict]:
+        page = self.history_manager.list_sessions_page(self._cursor, self.PAGE_SIZE)
+        if len(page) < self.PAGE_SIZE:
+            self._exhausted = True
+        if page:
+            self._cursor = (page[-1]["mtime"], page[-1]["id"])
+        return [meta for meta in page if meta["id"] not in self.store]
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page = self._next_page()
+        if not page:
+            return
+        last = self.store.last_key()
+        if last is None or last < SessionMetaStore.key(page[0]):
+            # 通常情况：新的一页整体接在末尾
+            self.beginInsertRows(QModelIndex(), len(self.store), len(self.store) + len(page) - 1)
+            for meta in page:
+                self.store.insert(meta)
+            self.endInsertRows()
+        else:
+            # 之前单独加入过更早的会话（例如打开了搜索结果），逐条插入到各自的位置
+            for meta in page:
+                self._insert(meta)
+
+    # ---- 增量修改 ----
+
+    def _insert(self, meta: Dict) -> int:
+        row = self.store.rank(SessionMetaStore.key(meta))
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.store.insert(meta)
+        self.endInsertRows()
+        return row
+
+    def upsert(self, meta: Dict) -> int:
+        """新增或更新会话（标题/修改时间），按修改时间移动到对应位置，返回所在行"""
+        session_id = meta["id"]
+        old = self.store.get(session_id)
+        if old is None:
+            return self._insert(meta)
+        old_row = self.store.rank(SessionMetaStore.key(old))
+        dest = self.store.rank(SessionMetaStore.key(meta))  # 移动前的行号，含自身
+        moved = dest not in (old_row, old_row + 1)
+        if moved:
+            self.beginMoveRows(QModelIndex(), old_row, old_row, QModelIndex(), dest)
+        self.store.remove(session_id)
+        self.store.insert(meta)
+        if moved:
+            self.endMoveRows()
+        row = self.store.rank(SessionMetaStore.key(meta))
+        # 分组标记取决于相邻行，移动后一并刷新前后两行
+        for changed in {max(row - 1, 0), row, min(row + 1, len(self.store) - 1),
+                        min(old_row, len(self.store) - 1)}:
+            self.dataChanged.emit(self.index(changed), self.index(changed))
+        return row
+
+    def remove(self, session_id: str):
+        row = self.store.row_of(session_id)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.store.remove(session_id)
+        self.endRemoveRows()
+        self._generating.discard(session_id)
+        if row < len(self.store):
+            self.dataChanged.emit(self.index(row), self.index(row))
+
+    def set_generating(self, session_id: str, generating: bool):
+        if generating:
+            self._generating.add(session_id)
+        else:
+            self._generating.discard(session_id)
+        row = self.store.row_of(session_id)
+        if row is not None:
+            self.dataChanged.emit(self.index(row), self.index(row), [Qt.ItemDataRole.DisplayRole])
+
+    def row_of(self, session_id: str) -> Optional[int]:
+        return self.store.row_of(session_id)
+
+    # ---- 数据 ----
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.store)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self.store):
+            return None
+        meta = self.store.at(index.row())
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"⏳ {meta['title']}" if meta["id"] in self._generating else meta["title"]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"会话ID: {meta['id']}"
+        if role == self.SessionIdRole:
+            return meta["id"]
+        if role == self.TitleRole:
+            return meta["title"]
+        if role == self.MtimeRole:
+            return meta["mtime"]
+        if role == self.GroupRole:
+            return self.group_of(meta["mtime"])
+        if role == self.GroupStartRole:
+            return index.row() == 0 or \
+                self.group_of(self.store.at(index.row() - 1)["mtime"]) != self.group_of(meta["mtime"])
+        return None
+
+    def group_of(self, mtime: float) -> str:
+        now = time.time()
+        if now >= self._groups_expire:  # 跨过午夜后重新计算分组边界
+            midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            self._group_bounds = [((midnight - timedelta(days=days)).timestamp(), label) for days, label in self.GROUPS]
+            self._groups_expire = (midnight + timedelta(days=1)).timestamp()
+        for bound, label in self._group_bounds:
+            if mtime >= bound:
+                return label
+        return "更早"
+
+
+class SessionItemDelegate(QStyledItemDelegate):
+    """在每个分组的第一行右侧绘制分组名，行高保持一致（视图可以使用 uniformItemSizes）"""
+
+    LABEL_WIDTH = 52
+
+    def paint(self, painter, option, index):
+        if not index.data(SessionListModel.GroupStartRole):
+            super().paint(painter, option, index)
+            return
+        row_rect = QRect(option.rect)
+        label_rect = QRect(row_rect)
+        label_rect.setLeft(row_rect.right() - self.LABEL_WIDTH)
+        option = QStyleOptionViewItem(option)
+        option.rect.setRight(label_rect.left())  # 标题在分组名之前省略
+        super().paint(painter, option, index)
+        painter.save()
+        painter.setPen(option.palette.color(QPalette.ColorRole.PlaceholderText))
+        font = painter.font()
+        font.setPointSizeF(max(font.pointSizeF() * 0.8, 6))
+        painter.setFont(font)
+        painter.drawLine(row_rect.topLeft(), row_rect.topRight())
+        painter.drawText(label_rect.adjusted(0, 0, -4, 0),
+                         Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter,
+                         index.data(SessionListModel.GroupRole))
+        painter.restore()
@@ -58,12 +58,14 @@ class SettingsDialog(QDialog):
             self.model_list.addItem(m)
 
     def save_config(self):
-        cfg = {
+        # 保留对话框中未展示的配置项（如 context_limits）
+        cfg = config.get_config()
+        cfg.update({
             'name': self.name_edit.text().strip(),
             'api_key': self.api_key_edit.text().strip(),
-            'api_base_url': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
+            'api_base_url': cfg.get('api_base_url', 'https://dashscope.aliyuncs.com/compatible-mode/v1'),
             'models': [self.model_list.item(i).text() for i in range(self.model_list.count())]
-        }
+        })
         config.set_config(cfg)
         QMessageBox.information(self, '提示', '配置已保存！')
         self.accept()
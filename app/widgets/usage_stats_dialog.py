@@ -0,0 +1,155 @@
+# app/widgets/usage_stats_dialog.py
+
+from typing import Dict, List, Optional, Sequence
+from PyQt6.QtWidgets import (
+    QDialog,
+    QVBoxLayout,
+    QHBoxLayout,
+    QLabel,
+    QComboBox,
+    QPushButton,
+    QTabWidget,
+    QTableWidget,
+    QTableWidgetItem,
+    QAbstractItemView,
+    QHeaderView,
+)
+from PyQt6.QtCore import Qt
+from app.usage_ledger import UsageLedger, days_ago
+
+# 时间范围选项：(显示文本, 向前的天数，None 表示全部)
+RANGES = [("今天", 0), ("近 7 天", 6), ("近 30 天", 29), ("全部", None)]
+TOP_SESSIONS = 20
+
+
+def _fmt(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.0f}"
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+
+def _fmt_day(day: int) -> str:
+    return f"{day // 10000}-{day // 100 % 100:02d}-{day % 100:02d}"
+
+
+class _NumberItem(QTableWidgetItem):
+    """按数值而不是文本排序的单元格"""
+
+    def __init__(self, value):
+        super().__init__(_fmt(value))
+        self.value = value if value is not None else -1
+        self.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+
+    def __lt__(self, other):
+        if isinstance(other, _NumberItem):
+            return self.value < other.value
+        return super().__lt__(other)
+
+
+class UsageStatsDialog(QDialog):
+    """
+    用量统计面板：按模型（含首字/总耗时 p50/p95）、按天和按会话汇总 UsageLedger 中的记录。
+    所有查询只读取账本的汇总表，打开和切换时间范围都不会扫描请求明细。
+    """
+
+    MODEL_COLUMNS = [("模型", "model"), ("请求", "requests"), ("错误", "errors"), ("输入", "prompt_tokens"),
+                     ("缓存命中", "cached_tokens"), ("输出", "completion_tokens"),
+                     ("首字 p50", "ttft_p50_ms"), ("首字 p95", "ttft_p95_ms"),
+                     ("耗时 p50", "total_p50_ms"), ("耗时 p95", "total_p95_ms")]
+    DAY_COLUMNS = [("日期", "day"), ("请求", "requests"), ("错误", "errors"), ("输入", "prompt_tokens"),
+                   ("缓存命中", "cached_tokens"), ("输出", "completion_tokens")]
+    SESSION_COLUMNS = [("会话", "title"), ("请求", "requests"), ("输入", "prompt_tokens"),
+                       ("缓存命中", "cached_tokens"), ("输出", "completion_tokens")]
+
+    def __init__(self, ledger: UsageLedger, history_manager=None, parent=None):
+        """
+        :param history_manager: 用于显示会话标题，为 None 时显示会话 ID
+        """
+        super().__init__(parent)
+        self.ledger = ledger
+        self.history_manager = history_manager
+        self.setWindowTitle("用量统计")
+        self.resize(820, 480)
+
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        self.range_combo = QComboBox()
+        for label, _ in RANGES:
+            self.range_combo.addItem(label)
+        self.range_combo.setCurrentIndex(2)
+        self.range_combo.currentIndexChanged.connect(self.refresh)
+        top.addWidget(self.range_combo)
+        self.summary_label = QLabel()
+        self.summary_label.setObjectName("StatusLabel")
+        self.summary_label.setWordWrap(True)
+        top.addWidget(self.summary_label, stretch=1)
+        refresh_button = QPushButton("刷新")
+        refresh_button.clicked.connect(self.refresh)
+        top.addWidget(refresh_button)
+        layout.addLayout(top)
+
+        self.tabs = QTabWidget()
+        self.model_table = self._make_table(self.MODEL_COLUMNS)
+        self.day_table = self._make_table(self.DAY_COLUMNS)
+        self.session_table = self._make_table(self.SESSION_COLUMNS)
+        self.tabs.addTab(self.model_table, "按模型")
+        self.tabs.addTab(self.day_table, "按天")
+        self.tabs.addTab(self.session_table, f"会话（全部时间前 {TOP_SESSIONS}）")
+        layout.addWidget(self.tabs, stretch=1)
+        self.refresh()
+
+    @staticmethod
+    def _make_table(columns: Sequence) -> QTableWidget:
+        table = QTableWidget(0, len(columns))
+        table.setHorizontalHeaderLabels([label for label, _ in columns])
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        # 默认保持账本返回的顺序，点击表头后才排序
+        table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        return table
+
+    @staticmethod
+    def _fill(table: QTableWidget, columns: Sequence, rows: List[Dict]):
+        table.setSortingEnabled(False)
+        table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, (_, key) in enumerate(columns):
+                value = row.get(key)
+                item = QTableWidgetItem(str(value)) if c == 0 else _NumberItem(value)
+                table.setItem(r, c, item)
+        table.setSortingEnabled(True)
+
+    def _since_day(self) -> Optional[int]:
+        days = RANGES[self.range_combo.currentIndex()][1]
+        return days_ago(days) if days is not None else None
+
+    def _session_title(self, session_id: str) -> str:
+        if self.history_manager is not None:
+            meta = self.history_manager.get_session_meta(session_id, wait_for_sync=False)
+            if meta:
+                return meta["title"]
+        return session_id
+
+    def refresh(self):
+        since_day = self._since_day()
+        totals = self.ledger.totals(since_day)
+        prompt, cached = totals["prompt_tokens"], totals["cached_tokens"]
+        text = (f"请求 {totals['requests']:,} 次（错误 {totals['errors']:,}），"
+                f"输入 {prompt:,} tokens，输出 {totals['completion_tokens']:,} tokens")
+        if cached and prompt:
+            text += f"，前缀缓存命中 {cached:,} tokens（{cached / prompt:.0%}）"
+        self.summary_label.setText(text)
+
+        self._fill(self.model_table, self.MODEL_COLUMNS, self.ledger.by_model(since_day))
+        days = self.ledger.by_day(since_day)
+        for row in days:
+            row["day"] = _fmt_day(row["day"])
+        self._fill(self.day_table, self.DAY_COLUMNS, days)
+        sessions = self.ledger.top_sessions(TOP_SESSIONS)
+        for row in sessions:
+            row["title"] = self._session_title(row["session_id"])
+        self._fill(self.session_table, self.SESSION_COLUMNS, sessions)
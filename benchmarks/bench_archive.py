@@ -0,0 +1,139 @@
+# benchmarks/bench_archive.py
+
+"""
+历史归档导出/导入基准：生成含 N 个会话的归档，测量
+
+    import        HistoryManager.import_archive 导入到空目录（批量落盘 + 批量写索引）
+    export        HistoryManager.export_archive 把该目录导出为新的归档
+    save_each     逐个 save_chat_session（每个会话一次 fsync 与一次索引事务），作为对照，
+                  只测前 --save-each 个会话并按单个会话的耗时给出
+
+以及导入、导出过程中 Python 堆内存的峰值（tracemalloc，单独运行一遍以免影响计时），
+峰值应基本不随会话数量增长。
+
+用法: python -m benchmarks.bench_archive [--sizes 1000,10000] [--format jsonl] [--archive-suffix .jsonl.zst] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+from app import session_codec
+from app.history_archive import ArchiveWriter
+from app.history_manager import HistoryManager
+
+WORDS = ["缓存", "索引", "请求", "模型", "上下文", "token", "异步", "数据库", "压缩", "会话", "def", "return"]
+
+
+def _make_archive(path: str, sessions: int, seed: int = 5) -> None:
+    rng = random.Random(seed)
+    now = time.time()
+    with ArchiveWriter(path, sessions) as writer:
+        for i in range(sessions):
+            messages = []
+            for j in range(rng.randint(2, 12)):
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 80)))
+                messages.append({"role": "user" if j % 2 == 0 else "assistant", "content": text})
+            writer.write_session(f"s{i:06d}", now - i * 60,
+                                 {"title": f"会话 {i}", "system_prompt": "你是一个有帮助的AI助手。", "messages": messages})
+
+
+def _import(source: str, storage_format: str) -> Dict:
+    with tempfile.TemporaryDirectory() as target, contextlib.redirect_stdout(io.StringIO()):
+        manager = HistoryManager(history_dir=target, storage_format=storage_format)
+        report = manager.import_archive(source)
+        manager.index.close()
+    return report
+
+
+def _peak_kb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_size(sessions: int, storage_format: str, archive_suffix: str, save_each: int) -> Dict:
+    result = {"sessions": sessions}
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, f"source{archive_suffix}")
+        _make_archive(source, sessions)
+        result["archive_kb"] = round(os.path.getsize(source) / 1024)
+
+        history_dir = os.path.join(tmp, "history")
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = HistoryManager(history_dir=history_dir, storage_format=storage_format)
+            start = time.perf_counter()
+            report = manager.import_archive(source)
+            result["import_ms"] = round((time.perf_counter() - start) * 1000)
+            assert report["imported"] == sessions, report
+            assert manager.index.count() == sessions
+
+            exported = os.path.join(tmp, f"exported{archive_suffix}")
+            start = time.perf_counter()
+            report = manager.export_archive(exported)
+            result["export_ms"] = round((time.perf_counter() - start) * 1000)
+            assert report["exported"] == sessions, report
+            manager.index.close()
+
+            # 逐个保存的对照：同样的会话内容，每个会话一次 fsync 与一次索引事务
+            count = min(save_each, sessions)
+            if count:
+                with tempfile.TemporaryDirectory() as each_dir:
+                    each = HistoryManager(history_dir=each_dir, storage_format=storage_format)
+                    records = [(f"s{i:06d}", each) for i in range(count)]
+                    data = manager._read_session_file  # 已导入的会话，读取不计入耗时
+                    contents = [data(session_id, track_state=False) for session_id, _ in records]
+                    start = time.perf_counter()
+                    for (session_id, _), content in zip(records, contents):
+                        each.save_chat_session(session_id, content)
+                    per_session = (time.perf_counter() - start) / count
+                    each.index.close()
+                result["save_each_per_session_us"] = round(per_session * 1e6)
+                result["import_per_session_us"] = round(result["import_ms"] * 1000 / sessions)
+
+        result["import_peak_kb"] = _peak_kb(lambda: _import(source, storage_format))
+        with contextlib.redirect_stdout(io.StringIO()):
+            # 启动时的目录同步（GUI 中在后台完成）不计入导出的内存峰值
+            manager = HistoryManager(history_dir=history_dir, storage_format=storage_format)
+            manager.sync_index()
+            again = os.path.join(tmp, f"again{archive_suffix}")
+            result["export_peak_kb"] = _peak_kb(lambda: manager.export_archive(again))
+            manager.index.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史归档导出/导入基准")
+    parser.add_argument("--sizes", default="1000,10000", help="逗号分隔的会话数量")
+    parser.add_argument("--format", default="jsonl", choices=sorted(session_codec.FORMATS) + ["json"],
+                        help="导入目录的会话存储格式")
+    parser.add_argument("--archive-suffix", default=".jsonl.zst" if session_codec.zstd_available() else ".jsonl.gz",
+                        choices=[".jsonl", ".jsonl.gz", ".jsonl.zst"])
+    parser.add_argument("--save-each", type=int, default=300, help="逐个保存对照测试的会话数，0 表示不测")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results: List[Dict] = [bench_size(int(n), args.format, args.archive_suffix, args.save_each)
+                           for n in args.sizes.split(",")]
+    if args.json:
+        print(json.dumps({"results": results}, ensure_ascii=False, indent=2))
+        return
+    columns = ["archive_kb", "import_ms", "export_ms", "import_per_session_us", "save_each_per_session_us",
+               "import_peak_kb", "export_peak_kb"]
+    print(f"{'sessions':>9}" + "".join(f"{c:>26}" for c in columns))
+    for r in results:
+        print(f"{r['sessions']:>9}" + "".join(f"{r.get(c, '-'):>26}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# benchmarks/bench_ledger.py
+
+"""
+用量账本基准：向 UsageLedger 批量写入 N 条模拟请求记录（分布在 --days 天、若干模型和会话上），测量
+
+    append        单条 record() 的耗时（每条一个事务，对应运行时每个请求结束时的写入）
+    totals        最近 30 天总用量
+    by_day        最近 30 天按天汇总
+    by_model      全部时间按模型汇总，含首字/总耗时 p50/p95（读取汇总表与延迟直方图）
+    top_sessions  累计 token 最多的 20 个会话
+    naive         对照：直接在 requests 明细表上 GROUP BY 并排序取分位数
+
+并检查直方图估算的 p50/p95 与明细精确值的相对误差。
+
+用法: python -m benchmarks.bench_ledger [--rows 1000000] [--days 365] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from app.usage_ledger import UsageLedger, days_ago
+
+MODELS = ["qwen-max", "qwen-plus", "qwen-turbo", "qwen-long", "qwen-coder-plus"]
+BATCH = 10_000
+
+
+def _entries(count: int, days: int, sessions: int, seed: int, start: float):
+    rng = random.Random(seed)
+    span = days * 86400
+    for i in range(count):
+        model = MODELS[min(int(rng.expovariate(1.0)), len(MODELS) - 1)]
+        prompt = rng.randint(50, 8000)
+        error = "APITimeoutError" if rng.random() < 0.01 else None
+        ttft = rng.lognormvariate(6.0, 0.5)
+        yield {
+            "timestamp": start + span * i / count,
+            "session_id": f"s{rng.randrange(sessions):05d}",
+            "model": model,
+            "tag": "chat",
+            "prompt_tokens": None if error else prompt,
+            "completion_tokens": None if error else rng.randint(10, 1500),
+            "cached_prompt_tokens": None if error else int(prompt * rng.random() * 0.8),
+            "ttft_ms": None if error else round(ttft, 1),
+            "total_ms": None if error else round(ttft + rng.lognormvariate(7.5, 0.6), 1),
+            "error_type": error,
+            "cached": False,
+        }
+
+
+def _fill(ledger: UsageLedger, rows: int, days: int, sessions: int) -> float:
+    start = time.time() - days * 86400
+    batch: List[Dict] = []
+    begin = time.perf_counter()
+    for entry in _entries(rows, days, sessions, seed=7, start=start):
+        batch.append(entry)
+        if len(batch) >= BATCH:
+            ledger.record_many(batch)
+            batch = []
+    if batch:
+        ledger.record_many(batch)
+    return time.perf_counter() - begin
+
+
+def _time_ms(fn: Callable, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 2)
+
+
+def _naive_by_model(conn, quantiles=(0.5, 0.95)) -> Dict[str, Dict[float, float]]:
+    """不使用汇总表：在明细上 GROUP BY，再按模型排序全部耗时取精确分位数"""
+    conn.execute("SELECT model, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cached_tokens) "
+                 "FROM requests GROUP BY model").fetchall()
+    result = {}
+    for (model,) in conn.execute("SELECT DISTINCT model FROM requests").fetchall():
+        values = [row[0] for row in conn.execute(
+            "SELECT total_ms FROM requests WHERE model = ? AND total_ms IS NOT NULL AND error_type IS NULL "
+            "ORDER BY total_ms", (model,))]
+        result[model] = {q: values[max(0, int(q * len(values) + 0.999999) - 1)] for q in quantiles}
+    return result
+
+
+def run(rows: int, days: int, sessions: int) -> Dict:
+    result: Dict = {"rows": rows, "days": days}
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = UsageLedger(os.path.join(tmp, "ledger.sqlite3"))
+        fill_s = _fill(ledger, rows, days, sessions)
+        result["bulk_insert_us_per_row"] = round(fill_s * 1e6 / rows, 2)
+        result["db_mb"] = round(sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp)) / 2 ** 20, 1)
+
+        extra = list(_entries(200, 1, sessions, seed=11, start=time.time()))
+        start = time.perf_counter()
+        for entry in extra:
+            ledger.record(entry)
+        result["append_us"] = round((time.perf_counter() - start) * 1e6 / len(extra))
+
+        since = days_ago(29)
+        result["totals_ms"] = _time_ms(lambda: ledger.totals(since))
+        result["by_day_ms"] = _time_ms(lambda: ledger.by_day(since))
+        result["by_model_ms"] = _time_ms(lambda: ledger.by_model())
+        result["top_sessions_ms"] = _time_ms(lambda: ledger.top_sessions(20))
+
+        start = time.perf_counter()
+        exact = _naive_by_model(ledger._conn)
+        result["naive_by_model_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        worst = 0.0
+        for item in ledger.by_model():
+            for q in (0.5, 0.95):
+                estimate = item[f"total_p{round(q * 100)}_ms"]
+                worst = max(worst, abs(estimate - exact[item["model"]][q]) / exact[item["model"]][q])
+        result["percentile_max_rel_error"] = round(worst, 4)
+        ledger.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用量账本写入与聚合查询基准")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="模拟的请求记录数")
+    parser.add_argument("--days", type=int, default=365, help="记录分布的天数")
+    parser.add_argument("--sessions", type=int, default=5000, help="会话数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    result = run(args.rows, args.days, args.sessions)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for key, value in result.items():
+        print(f"{key:<26}{value:>12}")
+
+
+if __name__ == "__main__":
+    main()
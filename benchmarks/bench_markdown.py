@@ -0,0 +1,198 @@
+# benchmarks/bench_markdown.py
+
+"""
+Markdown 增量渲染基准（无界面 offscreen QPA）：把约 20 KB、以代码块为主的回复
+按帧（每帧若干个 token）写入 ChatArea，比较：
+
+    incremental   ChatArea.stream_token：只重新处理最后一个未完成的块
+    full          每帧重新解析并渲染整条回复（朴素做法，O(n²)）
+    plain         旧的纯文本插入（不渲染 Markdown），作为下限参考
+
+输出总耗时、单帧耗时的中位数/最大值，以及语法高亮全部完成的时间；
+最后测量打开包含该回复的会话两次（第二次命中按内容哈希缓存的高亮结果）。
+
+用法: python -m benchmarks.bench_markdown [--size 20000] [--chars-per-frame 40] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from typing import Dict, List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtGui import QTextCursor
+from PyQt6.QtWidgets import QApplication
+
+from app.markdown_render import split_blocks
+from app.widgets.chat_area import ChatArea
+from benchmarks.bench_render import _wait_until
+
+PROSE = [
+    "下面的实现把热点数据放在内存中，并按 **访问频率** 淘汰。",
+    "注意 `asyncio.gather` 会并发执行这些协程，异常会传播给调用方。",
+    "如果数据量很大，建议分批处理并在每批之后提交事务。",
+    "这个函数的时间复杂度是 *O(n log n)*，瓶颈在排序。",
+]
+LANGS = ["python", "javascript", "sql", "bash", ""]
+
+
+def make_reply(size: int, seed: int = 3) -> str:
+    rng = random.Random(seed)
+    parts: List[str] = ["## 实现思路", rng.choice(PROSE)]
+    i = 0
+    while sum(len(p) + 2 for p in parts) < size:
+        i += 1
+        parts.append(f"### 第 {i} 步\n" + "\n".join(f"- {rng.choice(PROSE)}" for _ in range(rng.randint(2, 4))))
+        lang = rng.choice(LANGS)
+        lines = [f"def step_{i}(items, limit={rng.randint(1, 99)}):", "    result = []"]
+        for j in range(rng.randint(8, 30)):
+            lines.append(f"    if items[{j}].get(\"key_{j}\") is not None:  # 条件 {j}")
+            lines.append(f"        result.append(items[{j}][\"value\"] * {rng.randint(2, 9)})")
+        lines.append("    return result")
+        parts.append(f"```{lang}\n" + "\n".join(lines) + "\n```")
+        parts.append(rng.choice(PROSE))
+    return "\n\n".join(parts)[:size]
+
+
+def _new_area() -> ChatArea:
+    area = ChatArea()
+    area.resize(800, 600)
+    area.show()
+    return area
+
+
+def _frames(reply: str, chars_per_frame: int) -> List[str]:
+    return [reply[i:i + chars_per_frame] for i in range(0, len(reply), chars_per_frame)]
+
+
+def _summary(frame_times: List[float], total: float) -> Dict:
+    return {
+        "total_ms": round(total * 1000, 1),
+        "frame_p50_ms": round(statistics.median(frame_times) * 1000, 3),
+        "frame_max_ms": round(max(frame_times) * 1000, 2),
+    }
+
+
+def bench_incremental(app: QApplication, reply: str, chars_per_frame: int) -> Dict:
+    area = _new_area()
+    area.append_message("assistant", "")
+    frame_times = []
+    start = time.perf_counter()
+    for text in _frames(reply, chars_per_frame):
+        frame_start = time.perf_counter()
+        area.stream_token(text)
+        app.processEvents()  # 包括重新布局与高亮结果的替换
+        frame_times.append(time.perf_counter() - frame_start)
+    area.finalize_stream()
+    total = time.perf_counter() - start
+    _wait_until(lambda: not area.highlighter.busy, timeout=60)
+    app.processEvents()
+    highlighted = time.perf_counter() - start
+    result = _summary(frame_times, total)
+    result["highlighted_ms"] = round(highlighted * 1000, 1)
+    area.close()
+    return result
+
+
+def bench_full(app: QApplication, reply: str, chars_per_frame: int) -> Dict:
+    area = _new_area()
+    area.append_message("assistant", "")
+    area.streaming_message_open = False
+    cursor = area.textCursor()
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    content_start = cursor.position()
+    buffer, frame_times = "", []
+    start = time.perf_counter()
+    for text in _frames(reply, chars_per_frame):
+        frame_start = time.perf_counter()
+        buffer += text
+        cursor.setPosition(content_start)
+        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+        area._insert_blocks(cursor, split_blocks(buffer))
+        app.processEvents()
+        frame_times.append(time.perf_counter() - frame_start)
+    total = time.perf_counter() - start
+    area.close()
+    return _summary(frame_times, total)
+
+
+def bench_plain(app: QApplication, reply: str, chars_per_frame: int) -> Dict:
+    area = _new_area()
+    area.append_message("assistant", "")
+    cursor = area.textCursor()
+    frame_times = []
+    start = time.perf_counter()
+    for text in _frames(reply, chars_per_frame):
+        frame_start = time.perf_counter()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        area.setTextCursor(cursor)
+        area.ensureCursorVisible()
+        app.processEvents()
+        frame_times.append(time.perf_counter() - frame_start)
+    total = time.perf_counter() - start
+    area.close()
+    return _summary(frame_times, total)
+
+
+def bench_reopen(app: QApplication, reply: str) -> Dict:
+    messages = [{"role": "user" if i % 2 == 0 else "assistant",
+                 "content": f"问题 {i}" if i % 2 == 0 else reply.replace("step_", f"s{i}_step_")}
+                for i in range(6)]
+    area = _new_area()
+    stats_before = dict(area.highlighter.stats)
+    result = {}
+    for label in ("first", "second"):
+        start = time.perf_counter()
+        area.load_messages(messages)
+        app.processEvents()
+        shown = time.perf_counter() - start
+        _wait_until(lambda: not area.highlighter.busy, timeout=60)
+        app.processEvents()
+        result[f"{label}_open_ms"] = round(shown * 1000, 1)
+        result[f"{label}_highlighted_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["cache"] = {k: v - stats_before[k] for k, v in area.highlighter.stats.items()}
+    area.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown 增量渲染基准")
+    parser.add_argument("--size", type=int, default=20000, help="回复的字符数")
+    parser.add_argument("--chars-per-frame", type=int, default=40, help="每帧写入的字符数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    reply = make_reply(args.size)
+    blocks = split_blocks(reply)
+    results = {
+        "size": len(reply),
+        "code_blocks": sum(1 for b in blocks if b.kind == "code"),
+        "frames": len(_frames(reply, args.chars_per_frame)),
+        "incremental": bench_incremental(app, reply, args.chars_per_frame),
+        "full": bench_full(app, reply, args.chars_per_frame),
+        "plain": bench_plain(app, reply, args.chars_per_frame),
+        "reopen": bench_reopen(app, reply),
+    }
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{results['size']} chars, {results['code_blocks']} code blocks, {results['frames']} frames")
+    print(f"{'mode':<13}{'total':>10}{'frame p50':>12}{'frame max':>12}")
+    for mode in ("incremental", "full", "plain"):
+        r = results[mode]
+        print(f"{mode:<13}{r['total_ms']:>8.0f}ms{r['frame_p50_ms']:>10.2f}ms{r['frame_max_ms']:>10.1f}ms")
+    print(f"incremental: all code blocks highlighted after {results['incremental']['highlighted_ms']:.0f} ms")
+    r = results["reopen"]
+    print(f"reopen session: first {r['first_open_ms']:.0f} ms (highlighted {r['first_highlighted_ms']:.0f} ms), "
+          f"second {r['second_open_ms']:.0f} ms (highlighted {r['second_highlighted_ms']:.0f} ms), cache {r['cache']}")
+
+
+if __name__ == "__main__":
+    main()
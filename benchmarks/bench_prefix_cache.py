@@ -0,0 +1,101 @@
+# benchmarks/bench_prefix_cache.py
+
+"""
+前缀缓存基准：通过 QwenAPIClient 向启用 prefix_cache 的本地模拟服务器发送一段多轮对话，
+按服务端报告的 prompt_tokens_details.cached_tokens 统计命中前缀缓存的比例。
+
+    stable   ContextManager.fit(session_id=...)：窗口起点保持不变，需要前移时一次让出 WINDOW_SLACK
+    sliding  旧的做法：每轮从新到旧填满预算，历史超出预算后每轮都丢掉最早的消息，前缀每轮都变
+
+另外在第 --edit-at 轮修改 system prompt，确认前缀失效被识别（prefix_break=system_prompt）。
+
+用法: python -m benchmarks.bench_prefix_cache [--turns 60] [--context-limit 3000] [--json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+from typing import Dict, List
+
+import app.context_manager as context_manager
+from app.context_manager import ContextManager
+from app.metrics import MetricsRecorder
+from app.qwen_api import QwenAPIClient
+from app.request_scheduler import RequestScheduler
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+SYSTEM_PROMPT = "你是一个有帮助的AI助手。"
+
+
+async def _conversation(server: MockOpenAIServer, mode: str, turns: int, context_limit: int,
+                        edit_at: int) -> Dict:
+    server.reset_counters()
+    manager = ContextManager(reserve_tokens=0)
+    manager.context_limit = lambda model: context_limit
+    recorder = MetricsRecorder()
+    scheduler = RequestScheduler(requests_per_minute=1_000_000, max_concurrency=1)
+    client = QwenAPIClient(api_key="mock-key", model="mock-model", base_url=server.base_url,
+                           scheduler=scheduler, metrics=recorder)
+    messages: List[Dict] = []
+    system_prompt = SYSTEM_PROMPT
+    breaks: Dict[str, int] = {}
+    slack = context_manager.WINDOW_SLACK
+    if mode == "sliding":
+        context_manager.WINDOW_SLACK = 0
+    try:
+        for turn in range(turns):
+            if turn == edit_at:
+                system_prompt = SYSTEM_PROMPT + "回答尽量简短。"
+            messages.append({"role": "user", "content": f"第 {turn} 个问题：" + "请解释一下这段代码的作用。" * 3})
+            plan = manager.fit(system_prompt, messages, "mock-model",
+                               session_id="bench" if mode == "stable" else None)
+            if plan.prefix_break:
+                breaks[plan.prefix_break] = breaks.get(plan.prefix_break, 0) + 1
+            reply = await client.chat_completion(plan.messages, callback=lambda _token: None)
+            messages.append({"role": "assistant", "content": reply})
+    finally:
+        context_manager.WINDOW_SLACK = slack
+        await client.close()
+    summary = recorder.summary(window=turns)
+    return {
+        "requests": summary["requests"],
+        "prompt_tokens": summary["prompt_tokens"],
+        "cached_prompt_tokens": summary["cached_prompt_tokens"],
+        "hit_rate": summary["prompt_cache_hit_rate"],
+        "prefix_breaks": breaks,
+    }
+
+
+async def _run(args) -> Dict:
+    results = {}
+    with MockOpenAIServer(first_token_delay=0, reply_length=args.reply_length, chunk_size=64,
+                          prefix_cache=True) as server:
+        for mode in ("stable", "sliding"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[mode] = await _conversation(server, mode, args.turns, args.context_limit, args.edit_at)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="前缀缓存命中率基准")
+    parser.add_argument("--turns", type=int, default=60, help="对话轮数")
+    parser.add_argument("--context-limit", type=int, default=3000, help="模拟的上下文上限（估算 tokens）")
+    parser.add_argument("--reply-length", type=int, default=200, help="每轮回复的字符数")
+    parser.add_argument("--edit-at", type=int, default=40, help="在该轮修改 system prompt，负数表示不修改")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results = asyncio.run(_run(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'mode':<9}{'requests':>10}{'prompt':>10}{'cached':>10}{'hit rate':>10}  prefix breaks")
+    for mode, r in results.items():
+        print(f"{mode:<9}{r['requests']:>10}{r['prompt_tokens']:>10}{r['cached_prompt_tokens']:>10}"
+              f"{r['hit_rate']:>10.1%}  {r['prefix_breaks']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_render.py
+
+"""
+无界面 (offscreen QPA) 下测量长回复的渲染耗时。
+
+把回复切成小 token 推入 StreamRenderScheduler，测量从第一个 token
+到全部文字进入 ChatArea 的时间，并与旧的“每 50 ms 显示一个字符”方式对比。
+用法: python -m benchmarks.bench_render [--lengths 2000 20000]
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QEventLoop, QTimer
+from PyQt6.QtWidgets import QApplication
+
+from app.render_scheduler import StreamRenderScheduler
+from app.widgets.chat_area import ChatArea
+
+LEGACY_CHAR_INTERVAL_MS = 50
+
+
+def _make_reply(length: int) -> str:
+    base = "流式渲染基准测试 with some English words and `code`. "
+    return (base * (length // len(base) + 1))[:length]
+
+
+def _wait_until(predicate, timeout: float):
+    loop = QEventLoop()
+    deadline = time.perf_counter() + timeout
+    while not predicate() and time.perf_counter() < deadline:
+        loop.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 5)
+
+
+def bench_scheduler(length: int, token_size: int, tokens_per_tick: int, typing_animation: bool) -> float:
+    """模拟网络每 5 ms 到达 tokens_per_tick 个 token，返回渲染完成耗时（秒）"""
+    area = ChatArea()
+    area.resize(800, 600)
+    area.show()
+    area.append_message("assistant", "")
+    scheduler = StreamRenderScheduler(area, typing_animation=typing_animation)
+    reply = _make_reply(length)
+    tokens = [reply[i:i + token_size] for i in range(0, len(reply), token_size)]
+
+    feeder = QTimer()
+    position = [0]
+
+    def feed():
+        for _ in range(tokens_per_tick):
+            if position[0] >= len(tokens):
+                feeder.stop()
+                return
+            scheduler.push(tokens[position[0]])
+            position[0] += 1
+
+    start = time.perf_counter()
+    feeder.timeout.connect(feed)
+    feeder.start(5)
+    _wait_until(lambda: position[0] >= len(tokens) and scheduler.pending == 0, timeout=120)
+    elapsed = time.perf_counter() - start
+    assert area.toPlainText().endswith(reply)  # 回复中没有换行，整条都是以纯文本显示的未完成块
+    area.close()
+    return elapsed
+
+
+def bench_legacy_insert_cost(length: int) -> float:
+    """旧方式：逐字符调用 stream_token 的纯 CPU 开销（不含 50 ms 定时间隔）"""
+    area = ChatArea()
+    area.resize(800, 600)
+    area.show()
+    area.append_message("assistant", "")
+    buffer = _make_reply(length)
+    start = time.perf_counter()
+    while buffer:
+        area.stream_token(buffer[0])
+        buffer = buffer[1:]
+    elapsed = time.perf_counter() - start
+    area.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长回复渲染耗时基准")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--token-size", type=int, default=3)
+    parser.add_argument("--tokens-per-tick", type=int, default=4)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    for length in args.lengths:
+        network_time = len(range(0, length, args.token_size)) / args.tokens_per_tick * 0.005
+        frame = bench_scheduler(length, args.token_size, args.tokens_per_tick, typing_animation=False)
+        typing = bench_scheduler(length, args.token_size, args.tokens_per_tick, typing_animation=True)
+        legacy_cpu = bench_legacy_insert_cost(length)
+        legacy_wall = length * LEGACY_CHAR_INTERVAL_MS / 1000
+        print(
+            f"{length:>7} chars  network≈{network_time:.2f}s  "
+            f"frame-batched={frame:.2f}s  typing={typing:.2f}s  "
+            f"legacy per-char: wall≈{legacy_wall:.0f}s cpu={legacy_cpu:.2f}s"
+        )
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
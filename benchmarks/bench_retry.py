@@ -0,0 +1,99 @@
+# benchmarks/bench_retry.py
+
+"""
+验证 RequestScheduler 的重试与限速。
+
+模拟服务器按给定序列注入 429/5xx 错误，统计每种场景下的重试次数、
+总请求数与耗时；最后用随机错误率并发发送一批请求，观察成功率与并发上限。
+用法: python -m benchmarks.bench_retry [--requests 20] [--error-rate 0.3]
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.metrics import MetricsRecorder
+from app.qwen_api import QwenAPIClient, QwenAPIException
+from app.request_scheduler import RequestScheduler
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+MESSAGES = [
+    {"role": "system", "content": "你是一个有帮助的AI助手。"},
+    {"role": "user", "content": "你好"},
+]
+
+SCENARIOS = [
+    ("429 x2 with Retry-After", [429, 429], 0.2),
+    ("503 then 500", [503, 500], None),
+    ("401 (not retried)", [401], None),
+    ("429 x5 (gives up)", [429] * 5, 0.05),
+]
+
+
+def _client(server: MockOpenAIServer, scheduler: RequestScheduler) -> QwenAPIClient:
+    # 使用不带用量账本的 MetricsRecorder，模拟请求不写入用户的 .qwen_cache/usage_ledger.sqlite3
+    return QwenAPIClient(api_key="mock-key", model="mock-model", base_url=server.base_url, scheduler=scheduler,
+                         metrics=MetricsRecorder())
+
+
+async def _scenarios():
+    with MockOpenAIServer(first_token_delay=0.0) as server:
+        for label, statuses, retry_after in SCENARIOS:
+            scheduler = RequestScheduler(requests_per_minute=600, max_retries=3, base_delay=0.05)
+            client = _client(server, scheduler)
+            server.reset_counters()
+            server.retry_after = retry_after
+            server.inject_errors(statuses)
+            start = time.perf_counter()
+            try:
+                await client.chat_completion(MESSAGES, callback=lambda _t: None)
+                outcome = "ok"
+            except QwenAPIException as e:
+                outcome = f"{e.error_type} ({e.status_code})"
+            elapsed = time.perf_counter() - start
+            print(
+                f"{label:<26} outcome={outcome:<22} retries={scheduler.stats['retries']}  "
+                f"http_requests={server.request_count}  elapsed={elapsed * 1000:.0f} ms"
+            )
+            await client.close()
+
+
+async def _burst(args):
+    with MockOpenAIServer(first_token_delay=0.05, error_rate=args.error_rate, error_status=503) as server:
+        scheduler = RequestScheduler(
+            requests_per_minute=args.rpm, max_concurrency=args.concurrency, max_retries=5, base_delay=0.05,
+        )
+        client = _client(server, scheduler)
+
+        async def one():
+            try:
+                await client.chat_completion(MESSAGES, callback=lambda _t: None)
+                return True
+            except QwenAPIException:
+                return False
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        print(
+            f"burst of {args.requests} (error_rate={args.error_rate}, concurrency={args.concurrency}, "
+            f"rpm={args.rpm:g}): ok={sum(results)}  errors_injected={server.error_responses}  "
+            f"elapsed={elapsed:.2f} s"
+        )
+        print(f"scheduler stats: {scheduler.stats}")
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重试、退避与限速验证")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=600)
+    args = parser.parse_args()
+    asyncio.run(_scenarios())
+    asyncio.run(_burst(args))
+
+
+if __name__ == "__main__":
+    main()
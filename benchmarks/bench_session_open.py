@@ -0,0 +1,78 @@
+# benchmarks/bench_session_open.py
+
+"""
+无界面 (offscreen QPA) 下测量打开长会话的耗时。
+
+对比 ChatArea.load_messages（只渲染最近一页）与旧的
+clear() + 逐条 append_message 方式。
+用法: python -m benchmarks.bench_session_open [--sizes 1000 10000] [--legacy-max 10000]
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from app.widgets.chat_area import ChatArea
+
+
+def make_messages(count: int, length: int):
+    body = ("这是一条用于测试的较长消息，包含一些 English text 与代码 `print(x)`。" * (length // 40 + 1))[:length]
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"#{i} {body}"}
+        for i in range(count)
+    ]
+
+
+def _open(area: ChatArea, messages, legacy: bool) -> float:
+    app = QApplication.instance()
+    start = time.perf_counter()
+    if legacy:
+        area.clear()
+        for msg in messages:
+            area.append_message(msg["role"], msg["content"])
+    else:
+        area.load_messages(messages)
+    app.processEvents()  # 包含首次布局/绘制
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="打开长会话的耗时基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--length", type=int, default=400, help="每条消息的字符数")
+    parser.add_argument("--legacy-max", type=int, default=10000,
+                        help="旧方式只测到该消息数（更大的会话耗时过长）")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    for size in args.sizes:
+        messages = make_messages(size, args.length)
+        area = ChatArea()
+        area.resize(800, 600)
+        area.show()
+        lazy = _open(area, messages, legacy=False)
+        page_start = time.perf_counter()
+        area.verticalScrollBar().setValue(0)  # 向上滚动到顶部，加载上一页
+        app.processEvents()
+        page = time.perf_counter() - page_start
+        line = f"{size:>6} messages  lazy open={lazy * 1000:.1f} ms  load older page={page * 1000:.1f} ms"
+        if size <= args.legacy_max:
+            legacy_area = ChatArea()
+            legacy_area.resize(800, 600)
+            legacy_area.show()
+            legacy = _open(legacy_area, messages, legacy=True)
+            line += f"  legacy open={legacy * 1000:.1f} ms"
+            legacy_area.close()
+        else:
+            line += "  legacy open=skipped"
+        print(line)
+        area.close()
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bench_sidebar.py
+
+"""
+侧边栏会话列表基准（无界面 offscreen QPA）：在 1k / 10k / 50k 个会话的索引上测量
+HistorySidebar 各操作的耗时，单次操作的开销应基本不随会话数量增长。
+
+    load           load_history()，只加载第一页
+    fetch_all      滚动到底部，按页加载全部会话（总耗时）
+    add_new        add_session_to_top() 新会话
+    move_to_top    最底部的会话被更新后移动到最前（upsert）
+    select_bottom  select_session() 最底部的会话并滚动到它
+    generating     set_session_generating() 开/关
+    remove         remove_session() 中间的会话
+
+索引直接写入 SQLite（跳过目录同步），不生成会话文件。
+
+用法: python -m benchmarks.bench_sidebar [--sizes 1000,10000,50000] [--repeat 50] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from app.history_manager import HistoryManager
+from app.widgets.history_sidebar import HistorySidebar
+
+
+def _fill_index(manager: HistoryManager, sessions: int) -> None:
+    now = time.time()
+    rows = [(f"s{i:06d}", f"会话 {i}", now - i * 60, 100, 2, "") for i in range(sessions)]
+    with manager.index._lock:
+        manager.index._conn.executemany(
+            "INSERT INTO sessions (id, title, mtime, size, message_count, preview) VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        manager.index._conn.commit()
+    manager._index_synced = True
+
+
+def _median_us(app: QApplication, fn: Callable[[int], None], repeat: int) -> float:
+    """单次操作的中位耗时，包括随后一轮事件处理（视图的重新布局与绘制）"""
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        app.processEvents()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1e6, 1)
+
+
+def bench_size(app: QApplication, sessions: int, repeat: int) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        manager = HistoryManager(history_dir=tmp)
+        _fill_index(manager, sessions)
+        sidebar = HistorySidebar(manager)
+        sidebar.resize(200, 600)
+        sidebar.show()
+        app.processEvents()
+        model = sidebar.session_model
+
+        start = time.perf_counter()
+        sidebar.load_history()
+        app.processEvents()
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        while model.canFetchMore():
+            model.fetchMore()
+        app.processEvents()
+        fetch_all = time.perf_counter() - start
+        assert model.rowCount() == sessions
+
+        def add_new(i):
+            sidebar.add_session_to_top(f"new{i}", f"新会话 {i}")
+
+        def move_to_top(i):
+            meta = dict(model.store.at(model.rowCount() - 1))
+            meta["mtime"] = time.time()
+            sidebar.apply_changes([meta], [])
+
+        def select_bottom(i):
+            sidebar.select_session(model.store.at(model.rowCount() - 1)["id"])
+
+        def generating(i):
+            session_id = model.store.at(model.rowCount() // 2)["id"]
+            sidebar.set_session_generating(session_id, True)
+            sidebar.set_session_generating(session_id, False)
+
+        def remove(i):
+            sidebar.remove_session(model.store.at(model.rowCount() // 2)["id"])
+
+        result = {"sessions": sessions, "load_ms": round(load * 1000, 2), "fetch_all_ms": round(fetch_all * 1000, 1)}
+        for name, fn in (("add_new", add_new), ("move_to_top", move_to_top), ("select_bottom", select_bottom),
+                         ("generating", generating), ("remove", remove)):
+            result[f"{name}_us"] = _median_us(app, fn, repeat)
+        app.processEvents()
+        sidebar.close()
+        sidebar.deleteLater()
+        manager.index.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="侧边栏会话列表基准")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="逗号分隔的会话数量")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    results: List[Dict] = [bench_size(app, int(n), args.repeat) for n in args.sizes.split(",")]
+
+    if args.json:
+        print(json.dumps({"results": results}, ensure_ascii=False, indent=2))
+        return
+    columns = ["load_ms", "fetch_all_ms", "add_new_us", "move_to_top_us", "select_bottom_us", "generating_us", "remove_us"]
+    print(f"{'sessions':>9}" + "".join(f"{c:>17}" for c in columns))
+    for r in results:
+        print(f"{r['sessions']:>9}" + "".join(f"{r[c]:>17}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
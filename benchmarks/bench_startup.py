@@ -0,0 +1,170 @@
+# benchmarks/bench_startup.py
+
+"""
+启动耗时基准（无界面 offscreen QPA）。
+
+1. 导入耗时：以 -X importtime 运行 `import main`，列出累计耗时最多的模块；
+2. 首次绘制：在临时目录中生成若干历史会话，启动 ChatWindow，测量
+   进程启动 → 窗口首次绘制、进程启动 → 历史会话加载完成的耗时（取多次中位数）。
+
+用法: python -m benchmarks.bench_startup [--sessions 2000] [--repeat 5] [--cold] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(top: int = 15):
+    """返回 (总耗时秒数, [(累计微秒, 模块名)]，按累计耗时倒序)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # 表头
+        rows.append((int(cumulative), name[1:].rstrip()))  # 保留表示嵌套层级的缩进
+    total = sum(c for c, name in rows if not name.startswith(" ")) / 1e6
+    # 只列出顶层导入（缩进最少的行）与本项目模块，嵌套的子模块已计入其父模块
+    selected = [(c, name) for c, name in rows if not name.startswith(" ") or name.strip().startswith(("app.", "config"))]
+    selected.sort(reverse=True)
+    imported = {name.strip() for _, name in rows}
+    return total, selected[:top], imported
+
+
+def make_history(history_dir: str, sessions: int, messages: int) -> None:
+    sys.path.insert(0, ROOT)
+    from app.history_manager import HistoryManager
+    manager = HistoryManager(history_dir=history_dir)
+    with contextlib.redirect_stdout(io.StringIO()):  # 不输出每个会话的保存日志
+        for i in range(sessions):
+            messages_of_session = [
+                {"role": "user" if j % 2 == 0 else "assistant", "content": f"会话 {i} 的第 {j} 条消息"}
+                for j in range(messages)
+            ]
+            manager.save_chat_session(f"{20240101000000 + i}", messages_of_session, title=f"会话 {i}")
+    manager.index.close()
+
+
+def child() -> None:
+    """在子进程中启动窗口，输出各阶段的时间点（time.time()）"""
+    sys.path.insert(0, ROOT)
+    from PyQt6.QtCore import QObject, QEvent, QTimer
+    from PyQt6.QtWidgets import QApplication
+    from app.chat_window import ChatWindow
+
+    marks = {"imported": time.time()}
+    app = QApplication(sys.argv[:1])
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint and "first_paint" not in marks:
+                marks["first_paint"] = time.time()
+            return False
+
+    window = ChatWindow()
+    marks["constructed"] = time.time()
+
+    def history_ready():
+        marks.setdefault("history_ready", time.time())
+
+    window.history_ready.connect(history_ready)
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.show()
+
+    def poll():
+        if window.history_loaded:  # 后台同步可能在连接信号之前就已完成并发射
+            history_ready()
+        if "first_paint" in marks and "history_ready" in marks:
+            window.close()
+            app.quit()
+        else:
+            QTimer.singleShot(5, poll)
+
+    QTimer.singleShot(0, poll)
+    app.exec()
+    marks["openai_imported"] = "openai" in sys.modules
+    print("STARTUP " + json.dumps(marks))
+
+
+def run_once(workdir: str) -> dict:
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    start = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+        cwd=workdir, env=dict(env, PYTHONPATH=ROOT), capture_output=True, text=True, timeout=120,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            marks = json.loads(line[len("STARTUP "):])
+            return {key: (value - start) if isinstance(value, float) else value for key, value in marks.items()}
+    raise RuntimeError(f"child failed:\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--sessions", type=int, default=2000, help="历史会话数量")
+    parser.add_argument("--messages", type=int, default=10, help="每个会话的消息数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cold", action="store_true", help="每次启动前删除会话索引（首次启动/升级后的情形）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    total, top, imported = import_times()
+    result = {
+        "import_total_ms": round(total * 1000, 1),
+        "import_top": [{"module": name.strip(), "cumulative_ms": round(c / 1000, 1)} for c, name in top],
+        "openai_imported_at_startup": "openai" in imported,
+        "sessions": args.sessions,
+        "cold": args.cold,
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "app"))
+        shutil.copy(os.path.join(ROOT, "app", "styles.qss"), os.path.join(workdir, "app", "styles.qss"))
+        history_dir = os.path.join(workdir, "chat_history")
+        make_history(history_dir, args.sessions, args.messages)
+        runs = []
+        for _ in range(args.repeat):
+            if args.cold:
+                for name in os.listdir(history_dir):
+                    if name.startswith(".session_index"):
+                        os.remove(os.path.join(history_dir, name))
+            runs.append(run_once(workdir))
+    for key in ("imported", "constructed", "first_paint", "history_ready"):
+        result[f"{key}_ms"] = round(statistics.median(r[key] for r in runs) * 1000, 1)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print(f"import main: {result['import_total_ms']:.0f} ms (openai imported: {result['openai_imported_at_startup']})")
+    for row in result["import_top"]:
+        print(f"  {row['cumulative_ms']:>8.1f} ms  {row['module']}")
+    print(f"startup with {args.sessions} sessions ({'cold' if args.cold else 'warm'} index), "
+          f"median of {args.repeat}, from process start:")
+    for key in ("imported", "constructed", "first_paint", "history_ready"):
+        print(f"  {key:<14} {result[key + '_ms']:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
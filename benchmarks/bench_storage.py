@@ -0,0 +1,158 @@
+# benchmarks/bench_storage.py
+
+"""
+会话存储格式基准：在合成语料（中文说明 + 代码块的对话，大部分是几条消息的小会话，
+少量几百条消息的长会话）上比较各存储格式的磁盘占用、批量写入耗时与读取耗时。
+
+    json           旧的整体重写格式（indent=4）
+    jsonl          追加写格式（默认）
+    jsonl.gz       按帧 gzip 压缩
+    jsonl.zst      按帧 zstd 压缩（需要 zstandard）
+    jsonl.zst+dict 同上，并用小会话训练的共享字典（python -m app.compact_history 的做法）
+
+读取耗时为不经缓存读取并解析全部会话文件，以及单独读取一个长会话的中位数。
+
+用法: python -m benchmarks.bench_storage [--sessions 2000] [--long 20] [--long-messages 400] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from app import session_codec
+from app.history_manager import HistoryManager
+
+TOPICS = ["缓存", "数据库索引", "异步接口", "并发请求", "日志解析", "配置加载", "单元测试", "性能分析"]
+PROSE = [
+    "可以先把热点数据放在内存中，再按访问频率淘汰。",
+    "这里的关键是避免在 GUI 线程中做阻塞的磁盘 IO。",
+    "下面是一个简单的实现，注意异常处理和资源释放：",
+    "如果数据量很大，建议分批处理并在每批之后提交事务。",
+    "这个函数的时间复杂度是 O(n log n)，瓶颈在排序。",
+    "你可以用 asyncio.gather 并发执行这些请求。",
+]
+NAMES = ["items", "records", "cache", "session", "result", "payload", "rows", "config"]
+
+
+def _code(rng: random.Random) -> str:
+    name, other = rng.sample(NAMES, 2)
+    lines = [f"def process_{name}({name}, limit={rng.randint(1, 100)}):",
+             f"    {other} = []",
+             f"    for item in {name}[:limit]:"]
+    for _ in range(rng.randint(2, 10)):
+        lines.append(f"        if item.get(\"{rng.choice(NAMES)}\") is not None:")
+        lines.append(f"            {other}.append(item[\"{rng.choice(NAMES)}\"] * {rng.randint(2, 9)})")
+    lines.append(f"    return {other}")
+    return "```python\n" + "\n".join(lines) + "\n```"
+
+
+def _message(rng: random.Random, role: str, topic: str) -> Dict:
+    if role == "user":
+        return {"role": role, "content": f"关于{topic}：{rng.choice(PROSE)}能给个例子吗？"}
+    parts = [rng.choice(PROSE) for _ in range(rng.randint(1, 4))]
+    if rng.random() < 0.7:
+        parts.append(_code(rng))
+    parts.append(rng.choice(PROSE))
+    return {"role": role, "content": "\n\n".join(parts)}
+
+
+def make_corpus(sessions: int, long_sessions: int, long_messages: int, seed: int = 7) -> Dict[str, Dict]:
+    rng = random.Random(seed)
+    corpus = {}
+    for i in range(sessions):
+        count = long_messages if i < long_sessions else rng.randint(2, 8)
+        topic = rng.choice(TOPICS)
+        corpus[f"s{i:06d}"] = {
+            "title": f"{topic}问题 {i}",
+            "system_prompt": "你是一个有帮助的AI助手。",
+            "messages": [_message(rng, "user" if j % 2 == 0 else "assistant", topic) for j in range(count)],
+        }
+    return corpus
+
+
+def _dir_bytes(path: str, exclude_index: bool = True) -> int:
+    total = 0
+    for name in os.listdir(path):
+        if exclude_index and name.startswith(".session_index"):
+            continue
+        total += os.path.getsize(os.path.join(path, name))
+    return total
+
+
+def bench_format(label: str, corpus: Dict[str, Dict], repeat: int) -> Dict:
+    storage_format = label.split("+")[0]
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        manager = HistoryManager(history_dir=tmp, storage_format=storage_format, cache_size=1)
+        start = time.perf_counter()
+        for session_id, data in corpus.items():
+            manager.save_chat_session(session_id, dict(data))
+        write = time.perf_counter() - start
+        if label.endswith("+dict"):
+            start = time.perf_counter()
+            manager.compact_all(train_dictionary=True)
+            write += time.perf_counter() - start
+        files = list(manager._scan_session_files())
+        read_all = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for session_id in files:
+                manager._read_session_file(session_id, track_state=False)
+            read_all.append(time.perf_counter() - start)
+        long_id = max(corpus, key=lambda s: len(corpus[s]["messages"]))
+        read_long = []
+        for _ in range(repeat * 5):
+            start = time.perf_counter()
+            data = manager._read_session_file(long_id, track_state=False)
+            read_long.append(time.perf_counter() - start)
+        assert data["messages"] == corpus[long_id]["messages"]
+        size = _dir_bytes(tmp)
+        manager.index.close()
+    return {
+        "format": label,
+        "bytes": size,
+        "write_ms": round(write * 1000, 1),
+        "read_all_ms": round(statistics.median(read_all) * 1000, 1),
+        "read_long_ms": round(statistics.median(read_long) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话存储格式基准")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--long", type=int, default=20, help="其中长会话的数量")
+    parser.add_argument("--long-messages", type=int, default=400, help="长会话的消息数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.sessions, args.long, args.long_messages)
+    content = sum(len(m["content"].encode("utf-8")) for d in corpus.values() for m in d["messages"])
+    labels: List[str] = ["json", "jsonl", "jsonl.gz"]
+    if session_codec.zstd_available():
+        labels += ["jsonl.zst", "jsonl.zst+dict"]
+    else:
+        print("zstandard is not installed, skipping jsonl.zst")
+    results = [bench_format(label, corpus, args.repeat) for label in labels]
+
+    if args.json:
+        print(json.dumps({"sessions": args.sessions, "content_bytes": content, "results": results},
+                         ensure_ascii=False, indent=2))
+        return
+    print(f"{args.sessions} sessions ({args.long} x {args.long_messages} messages), "
+          f"message content {content / 1024 / 1024:.1f} MB")
+    baseline = results[0]
+    print(f"{'format':<16}{'size':>10}{'vs json':>9}{'write':>11}{'read all':>11}{'read long':>11}")
+    for r in results:
+        print(f"{r['format']:<16}{r['bytes'] / 1024 / 1024:>8.2f}MB{r['bytes'] / baseline['bytes']:>9.0%}"
+              f"{r['write_ms']:>9.0f}ms{r['read_all_ms']:>9.0f}ms{r['read_long_ms']:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
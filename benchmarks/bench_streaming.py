@@ -0,0 +1,89 @@
+# benchmarks/bench_streaming.py
+
+"""
+对比旧的“探测请求 + 重新创建流”与单请求流式路径。
+
+统计每轮发送到模拟服务器的请求数以及首 token 时间 (TTFT)。
+用法: python -m benchmarks.bench_streaming [--rounds 5] [--first-token-delay 0.2]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.metrics import MetricsRecorder
+from app.qwen_api import QwenAPIClient
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+
+async def _legacy_chat_completion(client: QwenAPIClient, messages, callback):
+    """旧实现：先用 with_raw_response 检查状态码，再重新创建一次流。"""
+    request_params = {
+        "model": client.model,
+        "messages": messages,
+        "temperature": client.temperature,
+        "top_p": client.top_p,
+        "max_tokens": client.max_tokens,
+        "stream": True,
+    }
+    response_obj = await client.client.chat.completions.with_raw_response.create(**request_params)
+    await response_obj.http_response.aclose()
+    stream = await client.client.chat.completions.create(**request_params)
+    full = ""
+    async for chunk in stream:
+        if chunk.choices:
+            content = chunk.choices[0].delta.content
+            if content:
+                callback(content)
+                full += content
+    return full
+
+
+async def _measure(client: QwenAPIClient, server: MockOpenAIServer, legacy: bool, rounds: int):
+    messages = [
+        {"role": "system", "content": "你是一个有帮助的AI助手。"},
+        {"role": "user", "content": "你好"},
+    ]
+    ttfts = []
+    server.reset_counters()
+    for _ in range(rounds):
+        first_token_at = []
+        start = time.perf_counter()
+
+        def on_token(_token):
+            if not first_token_at:
+                first_token_at.append(time.perf_counter())
+
+        if legacy:
+            await _legacy_chat_completion(client, messages, on_token)
+        else:
+            await client.chat_completion(messages, callback=on_token)
+        ttfts.append(first_token_at[0] - start)
+    return server.request_count / rounds, ttfts
+
+
+async def _run(args):
+    with MockOpenAIServer(first_token_delay=args.first_token_delay) as server:
+        # 使用不带用量账本的 MetricsRecorder，模拟请求不写入用户的 .qwen_cache/usage_ledger.sqlite3
+        client = QwenAPIClient(api_key="mock-key", model="mock-model", base_url=server.base_url,
+                               metrics=MetricsRecorder())
+        for label, legacy in (("before (probe + stream)", True), ("after (single stream)", False)):
+            per_turn, ttfts = await _measure(client, server, legacy, args.rounds)
+            print(
+                f"{label:<24} requests/turn={per_turn:.1f}  "
+                f"TTFT median={statistics.median(ttfts) * 1000:.1f} ms  "
+                f"max={max(ttfts) * 1000:.1f} ms"
+            )
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式请求次数与首 token 时间基准")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# benchmarks/mock_openai_server.py
+
+"""
+本地 OpenAI 兼容模拟服务器，只依赖标准库。
+
+实现 POST /chat/completions（流式 SSE 与非流式 JSON），
+用于在无网络环境下统计请求次数、测量首 token 时间等。
+可以配置首 token 延迟、输出速率 (tokens/s)、chunk 大小与回复长度，
+注入 429/5xx 错误响应（带 Retry-After）或在输出若干 chunk 后断开连接，
+并按 stream_options.include_usage 返回 usage。
+启用 prefix_cache 时模拟服务端的前缀缓存：与之前某次请求的消息前缀逐字节相同的部分
+计入 usage.prompt_tokens_details.cached_tokens。
+
+用法: python -m benchmarks.mock_openai_server --port 8765 [--tokens-per-second 50]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Iterable
+
+_ERROR_TYPES = {429: "rate_limit_exceeded", 500: "internal_error", 502: "bad_gateway", 503: "service_unavailable"}
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_MockHTTPServer"
+
+    def log_message(self, format, *args):  # 静默默认的访问日志
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        mock = self.server.mock
+        mock._record_request(body)
+
+        status = mock._next_error()
+        if status:
+            self._send_error(status, mock.retry_after)
+            return
+
+        model = body.get("model", "mock-model")
+        usage = mock.usage_for(body)
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._send_stream(model, usage if include_usage else None)
+        else:
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": mock.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, retry_after: Optional[float]):
+        data = json.dumps({"error": {
+            "message": f"mock error {status}",
+            "type": _ERROR_TYPES.get(status, "api_error"),
+            "code": status,
+        }}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", f"{retry_after:g}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model: str, usage: Optional[dict] = None):
+        mock = self.server.mock
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(mock.first_token_delay)
+        text = mock.reply
+        try:
+            for n, i in enumerate(range(0, len(text), mock.chunk_size)):
+                if mock.disconnect_after is not None and n >= mock.disconnect_after:
+                    # 模拟输出中途连接中断：以 RST 关闭连接，客户端读取时报错
+                    mock._record_disconnect()
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    self.connection.close()
+                    return
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": text[i:i + mock.chunk_size]},
+                        "finish_reason": "stop" if i + mock.chunk_size >= len(text) else None,
+                    }],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if mock.token_interval:
+                    time.sleep(mock.token_interval)
+            if usage:
+                # stream_options.include_usage：最后一个 chunk 的 choices 为空，只带 usage
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                         "created": int(time.time()), "model": model, "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前关闭了连接（例如请求被取消）
+            mock._record_abort()
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    mock: "MockOpenAIServer"
+
+
+class MockOpenAIServer:
+    """
+    在后台线程中运行的模拟服务器
+
+    :param first_token_delay: 首个 chunk 之前的延迟（秒）
+    :param token_interval: 相邻 chunk 之间的间隔（秒）
+    :param chunk_size: 每个 chunk 包含的字符数
+    :param reply: 固定的回复内容
+    :param reply_length: 未指定 reply 时生成的回复字符数
+    :param tokens_per_second: 输出速率（每个 chunk 计一个 token），设置后覆盖 token_interval
+    :param error_rate: 以该概率随机返回 error_status
+    :param error_status: 随机注入的错误状态码
+    :param retry_after: 错误响应中 Retry-After 头的秒数，None 表示不发送
+    :param disconnect_after: 流式响应输出该数量的 chunk 后断开连接，None 表示正常结束
+    :param prefix_cache: 模拟前缀缓存，在 usage 中报告 prompt_tokens_details.cached_tokens
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_token_delay: float = 0.2,
+        token_interval: float = 0.0,
+        chunk_size: int = 4,
+        reply: Optional[str] = None,
+        reply_length: Optional[int] = None,
+        tokens_per_second: Optional[float] = None,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        retry_after: Optional[float] = None,
+        disconnect_after: Optional[int] = None,
+        prefix_cache: bool = False,
+    ):
+        self.first_token_delay = first_token_delay
+        self.token_interval = 1.0 / tokens_per_second if tokens_per_second else token_interval
+        self.chunk_size = max(1, chunk_size)
+        self.reply = reply or self.make_reply(reply_length or 120)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.disconnect_after = disconnect_after
+        self.prefix_cache = prefix_cache
+        self._seen_prefixes = set()  # 已缓存的消息前缀的哈希
+        self.request_count = 0
+        self.aborted_streams = 0
+        self.error_responses = 0
+        self.disconnects = 0
+        self.requests = []
+        self._error_queue = []
+        self._lock = threading.Lock()
+        self._httpd = _MockHTTPServer((host, port), _MockHandler)
+        self._httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def make_reply(length: int) -> str:
+        base = "这是一个来自模拟服务器的回复。"
+        return (base * (length // len(base) + 1))[:length]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _record_request(self, body: dict):
+        with self._lock:
+            self.request_count += 1
+            self.requests.append(body)
+
+    def usage_for(self, body: dict) -> dict:
+        """粗略的 token 用量：每个字符计 1 个 token"""
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        completion_tokens = len(self.reply)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        if self.prefix_cache:
+            usage["prompt_tokens_details"] = {"cached_tokens": self._cached_tokens(body.get("messages", []))}
+        return usage
+
+    def _cached_tokens(self, messages: list) -> int:
+        """
+        最长的已缓存前缀的 token 数，并把本次请求的各个前缀加入缓存。
+        前缀按每条消息原样（保留字段顺序）的 JSON 序列化比较，字段顺序或内容的任何变化都会导致不命中。
+        """
+        digest = hashlib.sha1()
+        cached, tokens, hit = 0, 0, True
+        with self._lock:
+            for message in messages:
+                digest.update(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+                tokens += len(str(message.get("content", "")))
+                key = digest.hexdigest()
+                if hit and key in self._seen_prefixes:
+                    cached = tokens
+                else:
+                    hit = False
+                    self._seen_prefixes.add(key)
+        return cached
+
+    def inject_errors(self, statuses: Iterable[int]):
+        """接下来的请求依次返回这些错误状态码，用完后恢复正常"""
+        with self._lock:
+            self._error_queue.extend(statuses)
+
+    def _next_error(self) -> Optional[int]:
+        with self._lock:
+            if self._error_queue:
+                status = self._error_queue.pop(0)
+            elif self.error_rate and random.random() < self.error_rate:
+                status = self.error_status
+            else:
+                return None
+            self.error_responses += 1
+            return status
+
+    def _record_abort(self):
+        with self._lock:
+            self.aborted_streams += 1
+
+    def _record_disconnect(self):
+        with self._lock:
+            self.disconnects += 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.request_count = 0
+            self.aborted_streams = 0
+            self.error_responses = 0
+            self.disconnects = 0
+            self.requests = []
+            self._error_queue = []
+            self._seen_prefixes.clear()
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-interval", type=float, default=0.0)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="输出速率，覆盖 --token-interval")
+    parser.add_argument("--reply-length", type=int, default=120, help="回复字符数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回错误响应的概率")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--disconnect-after", type=int, default=None, help="输出该数量的 chunk 后断开连接")
+    parser.add_argument("--prefix-cache", action="store_true", help="模拟前缀缓存并报告 cached_tokens")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        host=args.host,
+        port=args.port,
+        first_token_delay=args.first_token_delay,
+        token_interval=args.token_interval,
+        chunk_size=args.chunk_size,
+        reply_length=args.reply_length,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        disconnect_after=args.disconnect_after,
+        prefix_cache=args.prefix_cache,
+    )
+    print(f"[MockServer] Listening on {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+# benchmarks/suite.py
+
+"""
+端到端基准套件：全部在本地模拟服务器与 offscreen QPA 下运行，不需要网络。
+
+场景：
+  client   QwenAPIClient 的首 token 时间、流式吞吐，注入 503 后重试成功与输出中途断线的耗时
+  render   ChatArea + StreamRenderScheduler 的渲染吞吐，打开长会话的耗时
+  history  N 个会话的索引同步（冷/热）、列表与搜索耗时
+  session  长会话的加载（未缓存）与追加保存耗时
+  window   无界面 ChatWindow 从发送到首个 token 显示、到回复保存的耗时
+
+结果写入 JSON（-o），指标命名约定：*_ms 越小越好，*_per_s 越大越好。
+指定 --baseline 时与旧结果逐项比较，变差超过 --tolerance 的指标视为性能回退，以退出码 1 结束。
+
+用法: python -m benchmarks.suite [-o bench_results.json] [--baseline old.json] [--only client window] [--quick]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from app.history_manager import HistoryManager
+from app.metrics import MetricsRecorder
+from app.qwen_api import QwenAPIClient, QwenAPIException
+from app.request_scheduler import RequestScheduler
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+FIRST_TOKEN_DELAY = 0.05
+MESSAGES = [
+    {"role": "system", "content": "你是一个有帮助的AI助手。"},
+    {"role": "user", "content": "你好"},
+]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _p50_ms(values: List[float]) -> float:
+    return _ms(statistics.median(values))
+
+
+def _client(server: MockOpenAIServer) -> QwenAPIClient:
+    # 基准中不希望被限速；重试退避缩短到毫秒级
+    scheduler = RequestScheduler(requests_per_minute=1_000_000, max_concurrency=8,
+                                 max_retries=3, base_delay=0.01, max_delay=0.05)
+    return QwenAPIClient(api_key="mock-key", model="mock-model", base_url=server.base_url,
+                         scheduler=scheduler, metrics=MetricsRecorder())
+
+
+async def _stream_once(client: QwenAPIClient):
+    """返回 (首 token 耗时, 总耗时, 回复)"""
+    first = []
+    start = time.perf_counter()
+    content = await client.chat_completion(
+        MESSAGES, callback=lambda _token: first or first.append(time.perf_counter()))
+    return (first[0] if first else time.perf_counter()) - start, time.perf_counter() - start, content
+
+
+async def _bench_client(args) -> Dict:
+    results = {}
+    with MockOpenAIServer(first_token_delay=FIRST_TOKEN_DELAY) as server:
+        client = _client(server)
+        await _stream_once(client)  # 预热：导入 openai、建立连接
+        server.reset_counters()
+        ttfts = []
+        for _ in range(args.rounds):
+            ttft, _, _ = await _stream_once(client)
+            ttfts.append(ttft)
+        results["ttft_p50_ms"] = _p50_ms(ttfts)
+        results["ttft_overhead_p50_ms"] = _ms(statistics.median(ttfts) - FIRST_TOKEN_DELAY)
+        results["requests_per_turn"] = server.request_count / args.rounds
+
+        server.retry_after = 0
+        latencies = []
+        for _ in range(args.rounds):
+            server.inject_errors([503, 503])
+            _, total, _ = await _stream_once(client)
+            latencies.append(total)
+        results["retry_2x503_p50_ms"] = _p50_ms(latencies)
+        await client.close()
+
+    with MockOpenAIServer(first_token_delay=0, reply_length=args.reply_length) as server:
+        client = _client(server)
+        await _stream_once(client)
+        totals = []
+        for _ in range(max(1, args.rounds // 2)):
+            _, total, content = await _stream_once(client)
+            assert len(content) == args.reply_length
+            totals.append(total)
+        results["stream_chars_per_s"] = round(args.reply_length / statistics.median(totals))
+
+        server.disconnect_after = 5
+        latencies = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            try:
+                await _stream_once(client)
+            except QwenAPIException:
+                latencies.append(time.perf_counter() - start)
+        results["mid_stream_disconnect_p50_ms"] = _p50_ms(latencies) if latencies else None
+        await client.close()
+    return results
+
+
+def bench_client(args) -> Dict:
+    return asyncio.run(_bench_client(args))
+
+
+_qt_app = None
+
+
+def _app():
+    global _qt_app
+    from PyQt6.QtWidgets import QApplication
+    if _qt_app is None:
+        _qt_app = QApplication.instance() or QApplication([])  # 保持引用，避免被回收
+    return _qt_app
+
+
+def bench_render(args) -> Dict:
+    from benchmarks.bench_render import bench_scheduler
+    from benchmarks.bench_session_open import make_messages, _open
+    from app.widgets.chat_area import ChatArea
+
+    _app()
+    elapsed = bench_scheduler(args.reply_length, token_size=4, tokens_per_tick=50, typing_animation=False)
+    area = ChatArea()
+    area.resize(800, 600)
+    area.show()
+    opens = [_open(area, make_messages(args.long_session, 400), legacy=False) for _ in range(3)]
+    area.close()
+    return {
+        "render_chars_per_s": round(args.reply_length / elapsed),
+        f"open_{args.long_session}_messages_ms": _p50_ms(opens),
+    }
+
+
+def _session_messages(index: int, count: int) -> List[Dict]:
+    return [
+        {"role": "user" if j % 2 == 0 else "assistant",
+         "content": f"会话 {index} 第 {j} 条：关于缓存、索引与异步接口的讨论"}
+        for j in range(count)
+    ]
+
+
+def _timed(fn: Callable) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_history(args) -> Dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = HistoryManager(history_dir=tmp)
+        saves = []
+        for i in range(args.sessions):
+            messages = _session_messages(i, 10)
+            saves.append(_timed(lambda: manager.save_chat_session(f"s{i:06d}", messages, title=f"会话 {i}")))
+        manager.index.close()
+        results["save_new_session_p50_ms"] = _p50_ms(saves)
+
+        for name in os.listdir(tmp):
+            if name.startswith(".session_index"):
+                os.remove(os.path.join(tmp, name))
+        cold = HistoryManager(history_dir=tmp)
+        results["sync_index_cold_ms"] = _ms(_timed(cold.sync_index))
+        cold.index.close()
+
+        warm = HistoryManager(history_dir=tmp)
+        results["sync_index_warm_ms"] = _ms(_timed(warm.sync_index))
+        results["list_sessions_ms"] = _p50_ms([_timed(warm.list_sessions) for _ in range(5)])
+        results["search_ms"] = _p50_ms([_timed(lambda: warm.search("索引 异步")) for _ in range(5)])
+        warm.index.close()
+    results["sessions"] = args.sessions
+    return results
+
+
+def bench_session(args) -> Dict:
+    count = args.long_session
+    with tempfile.TemporaryDirectory() as tmp:
+        # 缓存只保留一个会话，交替读取两个长会话时每次都要读文件
+        manager = HistoryManager(history_dir=tmp, cache_size=1)
+        first = _timed(lambda: manager.save_chat_session("long_a", _session_messages(0, count)))
+        manager.save_chat_session("long_b", _session_messages(1, count))
+        loads = []
+        for i in range(6):
+            loads.append(_timed(lambda: manager.load_chat_session("long_a" if i % 2 == 0 else "long_b")))
+        messages = _session_messages(0, count)
+        appends = []
+        for i in range(args.rounds):
+            messages.append({"role": "user", "content": f"追加的消息 {i}"})
+            appends.append(_timed(lambda: manager.save_chat_session("long_a", messages)))
+        manager.index.close()
+    return {
+        f"save_{count}_messages_ms": _ms(first),
+        f"load_{count}_messages_uncached_ms": _p50_ms(loads),
+        "append_save_p50_ms": _p50_ms(appends),
+    }
+
+
+def bench_window(args) -> Dict:
+    from benchmarks.bench_render import _wait_until
+    from app.chat_window import ChatWindow
+
+    app = _app()
+    with MockOpenAIServer(first_token_delay=FIRST_TOKEN_DELAY) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        manager = HistoryManager(history_dir=tmp)
+        window = ChatWindow(qwen_client=_client(server), history_manager=manager)
+        window.show()
+        _wait_until(lambda: window.history_loaded, timeout=30)
+        session_id = manager.generate_session_id()
+        manager.save_chat_session(session_id, [], title="bench")
+        window._load_chat_session(session_id)
+
+        first_shown, done = [], []
+        for i in range(args.rounds + 1):
+            start = time.perf_counter()
+            window.on_user_input(f"问题 {i}")
+            base = len(window.chat_area.toPlainText())
+            _wait_until(lambda: len(window.chat_area.toPlainText()) > base + len("Qwen："), timeout=30)
+            shown = time.perf_counter() - start
+            _wait_until(lambda: session_id not in window.streams, timeout=30)
+            if i:  # 第一轮包含导入 openai 与建立连接
+                first_shown.append(shown)
+                done.append(time.perf_counter() - start)
+        app.processEvents()
+        saved = len(manager.load_chat_session(session_id)["messages"])
+        window.close()
+        assert saved == 2 * (args.rounds + 1), saved
+    return {
+        "first_token_shown_p50_ms": _p50_ms(first_shown),
+        "first_token_overhead_p50_ms": _ms(statistics.median(first_shown) - FIRST_TOKEN_DELAY),
+        "reply_saved_p50_ms": _p50_ms(done),
+    }
+
+
+SCENARIOS = {
+    "client": bench_client,
+    "render": bench_render,
+    "history": bench_history,
+    "session": bench_session,
+    "window": bench_window,
+}
+
+
+def find_regressions(results: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """与旧结果比较，返回变差超过 tolerance 的指标说明"""
+    regressions = []
+    for scenario, metrics in results.get("results", {}).items():
+        before_metrics = baseline.get("results", {}).get(scenario, {})
+        for name, value in metrics.items():
+            before = before_metrics.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or before <= 0:
+                continue
+            if name.endswith("_ms") and value > before * (1 + tolerance) and value - before >= min_delta_ms:
+                regressions.append(f"{scenario}.{name}: {before} -> {value} ms")
+            elif name.endswith("_per_s") and value < before * (1 - tolerance):
+                regressions.append(f"{scenario}.{name}: {before} -> {value} /s")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="端到端基准套件（本地模拟服务器，无需网络）")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="与该结果文件比较，发现回退时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="允许的相对变差比例")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="*_ms 指标变差小于该值时忽略（计时噪声）")
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS), default=None)
+    parser.add_argument("--quick", action="store_true", help="减少轮数和数据量，用于快速检查")
+    parser.add_argument("--rounds", type=int, default=None)
+    parser.add_argument("--sessions", type=int, default=None, help="history 场景的会话数")
+    parser.add_argument("--long-session", type=int, default=None, help="长会话的消息数")
+    parser.add_argument("--reply-length", type=int, default=None, help="吞吐测试的回复字符数")
+    args = parser.parse_args()
+    args.rounds = args.rounds or (5 if args.quick else 20)
+    args.sessions = args.sessions or (300 if args.quick else 2000)
+    args.long_session = args.long_session or (1000 if args.quick else 5000)
+    args.reply_length = args.reply_length or (5000 if args.quick else 20000)
+
+    output = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"rounds": args.rounds, "sessions": args.sessions,
+                   "long_session": args.long_session, "reply_length": args.reply_length},
+        "results": {},
+    }
+    for name in args.only or SCENARIOS:
+        print(f"[Bench] {name} ...", file=sys.stderr)
+        start = time.perf_counter()
+        output["results"][name] = SCENARIOS[name](args)
+        print(f"[Bench] {name} done in {time.perf_counter() - start:.1f} s: "
+              f"{json.dumps(output['results'][name], ensure_ascii=False)}", file=sys.stderr)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"[Bench] Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(output, baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"[Bench] REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"[Bench] No regressions against {args.baseline} (tolerance {args.tolerance:.0%})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
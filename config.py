@@ -1,37 +1,147 @@
 # config.py
 
 import os
+import copy
 import json
-from dotenv import load_dotenv
-
-# 加载.env文件中的环境变量
-load_dotenv()
+import threading
 
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'user_config.json')
 
 # 默认配置
 DEFAULT_CONFIG = {
     'name': '默认配置',
-    'api_key': os.getenv('OPENAI_API_KEY', ''),
+    'api_key': '',  # 未配置时使用 .env / 环境变量中的 OPENAI_API_KEY，见 _default_config
     'api_base_url': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
     'models': ['qwen-plus-latest'],
+    # 各模型的上下文窗口上限 (token)，未列出的模型使用 default
+    'context_limits': {'default': 32768, 'qwen-plus-latest': 131072},
+    # 超出上下文预算时是否生成滚动摘要代替被省略的早期消息
+    'context_summary': False,
+    # 生成回复期间再次发送: cancel_previous（取消当前回复）/ queue（排队）/ reject（拒绝）
+    'concurrent_send_policy': 'cancel_previous',
+    # 回复缓存：默认只缓存 temperature 为 0 的请求，cache_all 为 True 时缓存所有请求
+    'response_cache': {
+        'enabled': False,
+        'cache_all': False,
+        'max_memory_entries': 128,
+        'max_disk_mb': 64,
+        'ttl_hours': 168,
+    },
+    # 请求调度：每个 API Key/模型的限速（requests_per_minute 不大于 0 表示不限速）、并发上限与可重试错误的退避重试
+    'rate_limits': {
+        'requests_per_minute': 60,
+        'max_concurrency': 4,
+        'max_retries': 3,
+        'base_delay': 0.5,
+        'max_delay': 20.0,
+    },
+    # 请求指标（首 token 时间、生成速度、用量等）：环形缓冲保存最近 capacity 次，
+    # log_path 非空时同时追加写入 JSONL
+    'metrics': {
+        'enabled': True,
+        'capacity': 200,
+        'log_path': '',
+    },
+    # 持久化的用量账本（SQLite）：每次请求的 token 用量与延迟，可按天/模型/会话汇总，
+    # 在侧边栏的“用量”面板中查看；需要同时启用 metrics。path 为空时使用 .qwen_cache/usage_ledger.sqlite3
+    'usage_ledger': {
+        'enabled': True,
+        'path': '',
+    },
+    # 多模型对比：models 为空时使用上面配置的全部模型；policy 为 all（全部完成后由用户选择）
+    # 或 race（第一个成功完成的回答自动采用，其余请求取消）
+    'compare': {
+        'models': [],
+        'policy': 'all',
+    },
+    # 会话存储格式：jsonl（默认）、jsonl.gz 或 jsonl.zst（需要安装 zstandard）。
+    # 已有会话在下次整体重写时转换，也可以用 python -m app.compact_history 批量迁移；
+    # compression_level 为 0 时使用各格式的默认级别
+    'history_storage': {
+        'format': 'jsonl',
+        'compression_level': 0,
+    },
+    # 监视历史目录的外部修改（同步工具、脚本写入），增量更新侧边栏；
+    # watch_recent_files 为单独监视原地追加写的最近会话文件数量
+    'history_watcher': {
+        'enabled': True,
+        'debounce_ms': 500,
+        'watch_recent_files': 50,
+    },
 }
 
-def get_config():
-    if os.path.exists(CONFIG_PATH):
+
+class _ConfigCache:
+    """
+    user_config.json 的缓存：只在文件的 mtime/大小变化时重新解析，
+    其余调用只需一次 stat。get_config 返回副本，调用方可以放心修改。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._data = None
+
+    def _file_stamp(self):
         try:
-            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return DEFAULT_CONFIG.copy()
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self) -> dict:
+        stamp = self._file_stamp()
+        with self._lock:
+            if self._data is None or stamp != self._stamp:
+                self._data = self._load(stamp)
+                self._stamp = stamp
+            return copy.deepcopy(self._data)
+
+    def _load(self, stamp) -> dict:
+        if stamp is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception:
+                pass
+        return _default_config()
+
+    def set(self, cfg: dict) -> None:
+        with self._lock:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(cfg, f, ensure_ascii=False, indent=2)
+            self._data = copy.deepcopy(cfg)
+            self._stamp = self._file_stamp()
+
+
+def _default_config() -> dict:
+    # 只有在没有配置文件时才需要读取 .env，避免每次启动都导入 dotenv
+    from dotenv import load_dotenv
+    load_dotenv()
+    cfg = copy.deepcopy(DEFAULT_CONFIG)
+    cfg['api_key'] = os.getenv('OPENAI_API_KEY', '')
+    return cfg
+
+
+_cache = _ConfigCache(CONFIG_PATH)
+
+
+def get_config():
+    return _cache.get()
 
 def set_config(cfg: dict):
-    with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-        json.dump(cfg, f, ensure_ascii=False, indent=2)
-
-# 兼容旧用法
-OPENAI_API_KEY = get_config().get('api_key', '')
-API_BASE_URL = get_config().get('api_base_url', DEFAULT_CONFIG['api_base_url'])
-MODEL_NAME = get_config().get('models', DEFAULT_CONFIG['models'])[0] if get_config().get('models') else DEFAULT_CONFIG['models'][0]
-HISTORY_DIR = 'chat_history' 
\ No newline at end of file
+    _cache.set(cfg)
+
+HISTORY_DIR = 'chat_history'
+
+# 兼容旧用法：OPENAI_API_KEY / API_BASE_URL / MODEL_NAME 在首次访问时才读取配置
+def __getattr__(name):
+    if name == 'OPENAI_API_KEY':
+        return get_config().get('api_key', '')
+    if name == 'API_BASE_URL':
+        return get_config().get('api_base_url', DEFAULT_CONFIG['api_base_url'])
+    if name == 'MODEL_NAME':
+        models = get_config().get('models')
+        return models[0] if models else DEFAULT_CONFIG['models'][0]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")